@@ -6,8 +6,6 @@ import numpy as np
 import time
 import base64
 from PIL import Image
-import plotly.express as px
-import plotly.graph_objects as go
 from streamlit_extras.colored_header import colored_header
 import streamlit.components.v1
 from streamlit.runtime.scriptrunner import add_script_run_ctx
@@ -96,6 +94,8 @@ if 'username' not in st.session_state:
     st.session_state.username = ""
 if 'current_data' not in st.session_state:
     st.session_state.current_data = None
+if 'raw_data' not in st.session_state:
+    st.session_state.raw_data = None
 if 'detection_results' not in st.session_state:
     st.session_state.detection_results = None
 if 'selected_algorithm' not in st.session_state:
@@ -250,6 +250,10 @@ def login_page():
 
 # Get Started page
 def get_started_page():
+    # Plotly is only needed once a user is logged in
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.title("⚡ Energy Anomaly Detection System")
     
     # Animated energy consumption visual
@@ -14,17 +14,47 @@ def create_app(test_config=None):
     """Create and configure the Flask application."""
     app = Flask(__name__, instance_relative_config=True)
     
-    # Load configuration
+    # Load configuration; saved detectors default to the registry directory
+    # the Streamlit pages use
+    from models.registry import MODEL_REGISTRY_DIR
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_key_for_development_only'),
         SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///energy_anomaly_detection.db'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         UPLOAD_FOLDER=os.path.join(app.root_path, 'uploads'),
-        MAX_CONTENT_LENGTH=16 * 1024 * 1024  # 16 MB max upload size
+        MODEL_FOLDER=MODEL_REGISTRY_DIR,  # Saved detectors, one directory per analysis, shared with the Streamlit pages
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16 MB max form upload and upload chunk size
+        MAX_STREAM_UPLOAD_LENGTH=int(os.environ.get('MAX_STREAM_UPLOAD_MB', 2048)) * 1024 * 1024,  # Streamed upload limit
+        INGEST_CHUNK_SIZE=int(os.environ.get('INGEST_CHUNK_SIZE', 100000)),  # Rows parsed per ingestion chunk
+        DATASET_CACHE_MAX_BYTES=int(os.environ.get('DATASET_CACHE_MAX_MB', 512)) * 1024 * 1024,  # Loaded dataset cache budget
+        FEATURE_CACHE_MAX_BYTES=int(os.environ.get('FEATURE_CACHE_MAX_MB', 256)) * 1024 * 1024,  # Feature matrix cache budget
+        MODEL_CACHE_MAX_BYTES=int(os.environ.get('MODEL_CACHE_MAX_MB', 512)) * 1024 * 1024,  # Loaded model cache budget
+        PRELOAD_MODELS=[i.strip() for i in os.environ.get('PRELOAD_MODELS', '').split(',') if i.strip()]  # Analysis ids whose models are loaded at startup
     )
     
-    # Ensure the upload folder exists
+    # Apply test configuration if provided
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    
+    # Ensure the upload and model folders exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['MODEL_FOLDER'], exist_ok=True)
+    
+    # Size the process-wide dataset cache
+    from utils.dataset_store import dataset_cache
+    dataset_cache.configure(app.config['DATASET_CACHE_MAX_BYTES'])
+    
+    # Size the process-wide feature matrix cache
+    from models.features import feature_cache
+    feature_cache.configure(app.config['FEATURE_CACHE_MAX_BYTES'])
+    
+    # Size the process-wide model cache and preload the production models,
+    # so their first requests do not pay for loading them
+    from models.registry import model_cache, warm_model_cache, analysis_detector_path
+    model_cache.configure(app.config['MODEL_CACHE_MAX_BYTES'])
+    if app.config['PRELOAD_MODELS']:
+        warm_model_cache([analysis_detector_path(app.config['MODEL_FOLDER'], analysis_id)
+                          for analysis_id in app.config['PRELOAD_MODELS']])
     
     # Initialize Flask extensions
     db.init_app(app)
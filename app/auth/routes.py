@@ -1,9 +1,9 @@
 """
 Authentication routes for the Energy Anomaly Detection System.
 """
+from urllib.parse import urlparse
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.urls import url_parse
 from app import db
 from app.models import User
 from app.auth.forms import LoginForm, SignupForm
@@ -36,7 +36,7 @@ def login():
         
         # Redirect to next page or home
         next_page = request.args.get('next')
-        if not next_page or url_parse(next_page).netloc != '':
+        if not next_page or urlparse(next_page).netloc != '':
             next_page = url_for('main.index')
             
         flash(f'Welcome back, {user.full_name}!', 'success')
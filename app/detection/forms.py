@@ -2,8 +2,22 @@
 Detection forms for the Energy Anomaly Detection System.
 """
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, SubmitField, FloatField, IntegerField
-from wtforms.validators import DataRequired, Length, Optional, NumberRange
+from wtforms import StringField, TextAreaField, SelectField, SelectMultipleField, SubmitField, FloatField, IntegerField
+from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
+from models.sweep import SWEEP_PARAMS, SWEEP_LIMITS, parse_values
+
+class ValueList:
+    """Validate a comma-separated list of values of one swept detector parameter."""
+    
+    def __init__(self, algorithm, param):
+        self.cast = SWEEP_PARAMS[algorithm][param]
+        self.limits = SWEEP_LIMITS[algorithm][param]
+    
+    def __call__(self, form, field):
+        try:
+            parse_values(field.data, self.cast, self.limits)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 class DetectionForm(FlaskForm):
     """Form for configuring anomaly detection."""
@@ -26,7 +40,8 @@ class DetectionForm(FlaskForm):
     ], choices=[
         ('isolation_forest', 'Isolation Forest'),
         ('autoencoder', 'AutoEncoder'),
-        ('kmeans', 'K-Means Clustering')
+        ('kmeans', 'K-Means Clustering'),
+        ('ensemble', 'Ensemble')
     ])
     
     # Isolation Forest parameters
@@ -40,6 +55,16 @@ class DetectionForm(FlaskForm):
         NumberRange(min=0.01, max=0.2)
     ])
     
+    if_max_samples = IntegerField('Samples per Tree', validators=[
+        Optional(),
+        NumberRange(min=16, max=1000000)
+    ])
+    
+    if_n_jobs = IntegerField('Parallel Jobs', default=-1, validators=[
+        Optional(),
+        NumberRange(min=-1, max=64)
+    ])
+    
     # AutoEncoder parameters
     ae_threshold = IntegerField('Threshold Percentile', default=95, validators=[
         Optional(),
@@ -62,4 +87,105 @@ class DetectionForm(FlaskForm):
         NumberRange(min=90, max=99)
     ])
     
-    submit = SubmitField('Run Detection')
\ No newline at end of file
+    # Ensemble parameters; each detector uses its own parameters above
+    ens_algorithms = SelectMultipleField('Detectors', default=['isolation_forest', 'kmeans'], validators=[
+        Optional()
+    ], choices=[
+        ('isolation_forest', 'Isolation Forest'),
+        ('autoencoder', 'AutoEncoder'),
+        ('kmeans', 'K-Means Clustering')
+    ])
+    
+    ens_normalization = SelectField('Score Normalization', default='rank', choices=[
+        ('rank', 'Rank'),
+        ('robust_z', 'Robust Z-Score')
+    ])
+    
+    ens_fusion = SelectField('Score Fusion', default='mean', choices=[
+        ('mean', 'Mean'),
+        ('max', 'Maximum'),
+        ('vote', 'Majority Vote')
+    ])
+    
+    ens_threshold = IntegerField('Threshold Percentile', default=95, validators=[
+        Optional(),
+        NumberRange(min=90, max=99)
+    ])
+    
+    submit = SubmitField('Run Detection')
+
+class ScoreForm(FlaskForm):
+    """Form for scoring a dataset with the saved model of an earlier analysis."""
+    name = StringField('Analysis Name', validators=[
+        DataRequired(),
+        Length(min=3, max=100)
+    ])
+    
+    analysis_id = SelectField('Trained Model', coerce=int, validators=[
+        DataRequired()
+    ])
+    
+    dataset_id = SelectField('Dataset', coerce=int, validators=[
+        DataRequired()
+    ])
+    
+    submit = SubmitField('Score with Model')
+
+class SweepForm(FlaskForm):
+    """Form for sweeping a grid of detector parameters on a dataset."""
+    dataset_id = SelectField('Dataset', coerce=int, validators=[
+        DataRequired()
+    ])
+    
+    algorithm = SelectField('Algorithm', validators=[
+        DataRequired()
+    ], choices=[
+        ('isolation_forest', 'Isolation Forest'),
+        ('autoencoder', 'AutoEncoder'),
+        ('kmeans', 'K-Means Clustering')
+    ])
+    
+    # Comma-separated candidate values of each parameter
+    if_n_estimators = StringField('Number of Estimators', default='100, 200', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('isolation_forest', 'n_estimators')
+    ])
+    
+    if_max_samples = StringField('Samples per Tree', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('isolation_forest', 'max_samples')
+    ])
+    
+    if_contamination = StringField('Contamination Factor', default='0.01, 0.02, 0.05, 0.1', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('isolation_forest', 'contamination')
+    ])
+    
+    ae_components = StringField('Number of Components', default='2, 4', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('autoencoder', 'components')
+    ])
+    
+    ae_threshold = StringField('Threshold Percentile', default='90, 95, 99', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('autoencoder', 'threshold_percentile')
+    ])
+    
+    km_clusters = StringField('Number of Clusters', default='3, 5, 8', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('kmeans', 'n_clusters')
+    ])
+    
+    km_threshold = StringField('Threshold Percentile', default='90, 95, 99', validators=[
+        Optional(),
+        Length(max=200),
+        ValueList('kmeans', 'threshold_percentile')
+    ])
+    
+    submit = SubmitField('Run Sweep')
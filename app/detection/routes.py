@@ -10,15 +10,132 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from app.models import Dataset, AnalysisResult, Anomaly
-from app.detection.forms import DetectionForm
-from models.isolation_forest import run_isolation_forest
-from models.autoencoder import run_autoencoder
-from models.kmeans import run_kmeans
+from app.detection.forms import DetectionForm, ScoreForm, SweepForm
+from utils.dataset_store import load_dataset, dataset_version
+from models import load_algorithm
+from models.registry import analysis_detector_path, has_detector, save_detector, get_detector
+from models.sweep import SWEEP_PARAMS, SWEEP_LIMITS, parse_values, label_vector, run_sweep
 from datetime import datetime
 
 # Create blueprint
 detection_bp = Blueprint('detection', __name__)
 
+def _detector_path(analysis_id):
+    """Directory of the detector saved for an analysis result."""
+    return analysis_detector_path(current_app.config['MODEL_FOLDER'], analysis_id)
+
+def _score_form(datasets):
+    """Build the form for scoring with a saved model, listing the analyses that have one."""
+    score_form = ScoreForm(prefix='score')
+    analyses = AnalysisResult.query.filter_by(user_id=current_user.id).order_by(
+        AnalysisResult.created_at.desc()
+    ).all()
+    score_form.analysis_id.choices = [(a.id, f"{a.name} ({a.algorithm})") for a in analyses
+                                      if has_detector(_detector_path(a.id))]
+    score_form.dataset_id.choices = [(d.id, d.name) for d in datasets]
+    return score_form
+
+def _sweep_form(datasets):
+    """Build the form for sweeping detector parameters."""
+    sweep_form = SweepForm(prefix='sweep')
+    sweep_form.dataset_id.choices = [(d.id, d.name) for d in datasets]
+    return sweep_form
+
+def _sweep_grid(form, algorithm):
+    """Candidate values of each parameter of a detector from the sweep form."""
+    fields = {
+        'isolation_forest': {
+            'n_estimators': form.if_n_estimators,
+            'max_samples': form.if_max_samples,
+            'contamination': form.if_contamination
+        },
+        'autoencoder': {
+            'components': form.ae_components,
+            'threshold_percentile': form.ae_threshold
+        },
+        'kmeans': {
+            'n_clusters': form.km_clusters,
+            'threshold_percentile': form.km_threshold
+        }
+    }[algorithm]
+    return {name: parse_values(field.data, SWEEP_PARAMS[algorithm][name], SWEEP_LIMITS[algorithm][name])
+            for name, field in fields.items()}
+
+def _validated_labels(dataset):
+    """Whether each anomaly validated in earlier analyses of a dataset is a true anomaly, by row index."""
+    validated = Anomaly.query.join(AnalysisResult).filter(
+        AnalysisResult.dataset_id == dataset.id,
+        AnalysisResult.user_id == current_user.id,
+        Anomaly.is_validated.is_(True),
+        Anomaly.is_true_anomaly.isnot(None)
+    ).all()
+    return {anomaly.index: bool(anomaly.is_true_anomaly) for anomaly in validated}
+
+def _algorithm_parameters(form, algorithm):
+    """Parameters of an algorithm from the detection form, or None for an unknown algorithm."""
+    if algorithm == 'isolation_forest':
+        return {
+            'n_estimators': form.if_n_estimators.data,
+            'contamination': form.if_contamination.data,
+            'max_samples': form.if_max_samples.data or 'auto',
+            'n_jobs': form.if_n_jobs.data or None
+        }
+    if algorithm == 'autoencoder':
+        return {
+            'threshold_percentile': form.ae_threshold.data,
+            'components': form.ae_components.data
+        }
+    if algorithm == 'kmeans':
+        return {
+            'n_clusters': form.km_clusters.data,
+            'threshold_percentile': form.km_threshold.data
+        }
+    if algorithm == 'ensemble':
+        # Each detector runs with the parameters set for it on the form
+        members = list(form.ens_algorithms.data or [])
+        return {
+            'algorithms': members,
+            'normalization': form.ens_normalization.data,
+            'fusion': form.ens_fusion.data,
+            'threshold_percentile': form.ens_threshold.data,
+            'members': {name: _algorithm_parameters(form, name) for name in members}
+        }
+    return None
+
+def _save_anomalies(df, anomalies, scores, analysis_result):
+    """Create the anomaly records of an analysis result."""
+    for idx in anomalies:
+        # Create a row with anomaly information
+        row_data = df.iloc[idx].to_dict()
+        
+        # Convert timestamp to datetime if it exists
+        timestamp = None
+        if 'timestamp' in row_data:
+            if isinstance(row_data['timestamp'], pd.Timestamp):
+                timestamp = row_data['timestamp'].to_pydatetime()
+            else:
+                try:
+                    timestamp = pd.to_datetime(row_data['timestamp']).to_pydatetime()
+                except:
+                    timestamp = None
+        
+        # Create feature values dict, excluding timestamp
+        feature_values = {k: float(v) if isinstance(v, (int, float, np.number)) else str(v) 
+                         for k, v in row_data.items() if k != 'timestamp'}
+        
+        # Create anomaly record
+        anomaly = Anomaly(
+            timestamp=timestamp,
+            index=int(idx),
+            score=float(scores[idx]) if idx < len(scores) else 0.0,
+            feature_values=feature_values,
+            analysis_result_id=analysis_result.id
+        )
+        
+        db.session.add(anomaly)
+    
+    db.session.commit()
+
 @detection_bp.route('/detection')
 @login_required
 def index():
@@ -51,6 +168,8 @@ def index():
         'detection/index.html',
         active_page='detection',
         form=form,
+        score_form=_score_form(datasets),
+        sweep_form=_sweep_form(datasets),
         recent_analyses=recent_analyses
     )
 
@@ -93,6 +212,8 @@ def new(dataset_id):
         'detection/index.html',
         active_page='detection',
         form=form,
+        score_form=_score_form(datasets),
+        sweep_form=_sweep_form(datasets),
         recent_analyses=recent_analyses
     )
 
@@ -112,53 +233,28 @@ def run_detection():
         dataset = Dataset.query.filter_by(id=dataset_id, user_id=current_user.id).first_or_404()
         
         try:
-            # Load the dataset
-            df = pd.read_csv(dataset.file_path)
-            
-            # Parse timestamp if available
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
+            # Load the dataset; its version keys the cached feature matrix
+            df = load_dataset(dataset)
+            version = dataset_version(dataset.file_path)
             
             # Select algorithm and parameters
             algorithm = form.algorithm.data
-            parameters = {}
+            parameters = _algorithm_parameters(form, algorithm)
+            
+            if parameters is None:
+                flash('Invalid algorithm selected', 'danger')
+                return redirect(url_for('detection.index'))
+            
+            if algorithm == 'ensemble' and len(parameters['algorithms']) < 2:
+                flash('Select at least two detectors for an ensemble.', 'danger')
+                return redirect(url_for('detection.index'))
             
             # Track execution time
             start_time = time.time()
             
-            if algorithm == 'isolation_forest':
-                # Isolation Forest parameters
-                parameters = {
-                    'n_estimators': form.if_n_estimators.data,
-                    'contamination': form.if_contamination.data
-                }
-                
-                # Run Isolation Forest algorithm
-                anomalies, scores = run_isolation_forest(df, params=parameters)
-                
-            elif algorithm == 'autoencoder':
-                # AutoEncoder parameters
-                parameters = {
-                    'threshold_percentile': form.ae_threshold.data,
-                    'components': form.ae_components.data
-                }
-                
-                # Run AutoEncoder algorithm
-                anomalies, scores = run_autoencoder(df, params=parameters)
-                
-            elif algorithm == 'kmeans':
-                # K-Means parameters
-                parameters = {
-                    'n_clusters': form.km_clusters.data,
-                    'threshold_percentile': form.km_threshold.data
-                }
-                
-                # Run K-Means algorithm
-                anomalies, scores = run_kmeans(df, params=parameters)
-                
-            else:
-                flash('Invalid algorithm selected', 'danger')
-                return redirect(url_for('detection.index'))
+            # Run the algorithm; its libraries are imported on first use
+            run_algorithm = load_algorithm(algorithm)
+            anomalies, scores, detector = run_algorithm(df, params=parameters, version=version, return_model=True)
             
             # Calculate execution time
             execution_time = round(time.time() - start_time, 2)
@@ -183,38 +279,16 @@ def run_detection():
             db.session.add(analysis_result)
             db.session.commit()
             
-            # Create individual anomaly records
-            for idx in anomalies:
-                # Create a row with anomaly information
-                row_data = df.iloc[idx].to_dict()
-                
-                # Convert timestamp to datetime if it exists
-                timestamp = None
-                if 'timestamp' in row_data:
-                    if isinstance(row_data['timestamp'], pd.Timestamp):
-                        timestamp = row_data['timestamp'].to_pydatetime()
-                    else:
-                        try:
-                            timestamp = pd.to_datetime(row_data['timestamp']).to_pydatetime()
-                        except:
-                            timestamp = None
-                
-                # Create feature values dict, excluding timestamp
-                feature_values = {k: float(v) if isinstance(v, (int, float, np.number)) else str(v) 
-                                 for k, v in row_data.items() if k != 'timestamp'}
-                
-                # Create anomaly record
-                anomaly = Anomaly(
-                    timestamp=timestamp,
-                    index=int(idx),
-                    score=float(scores[idx]) if idx < len(scores) else 0.0,
-                    feature_values=feature_values,
-                    analysis_result_id=analysis_result.id
-                )
-                
-                db.session.add(anomaly)
+            # Save the fitted model so other datasets can be scored without retraining;
+            # ensembles have no single model to save
+            if detector is not None:
+                try:
+                    save_detector(detector, _detector_path(analysis_result.id), name=analysis_result.name)
+                except Exception as e:
+                    current_app.logger.warning(f'Could not save model of analysis {analysis_result.id}: {str(e)}')
             
-            db.session.commit()
+            # Create individual anomaly records
+            _save_anomalies(df, anomalies, scores, analysis_result)
             
             flash(f'Successfully detected {len(anomalies)} anomalies using {algorithm} in {execution_time} seconds.', 'success')
             
@@ -230,4 +304,113 @@ def run_detection():
         for error in errors:
             flash(f'{getattr(form, field).label.text}: {error}', 'danger')
     
+    return redirect(url_for('detection.index'))
+
+@detection_bp.route('/detection/score', methods=['POST'])
+@login_required
+def score():
+    """Score a dataset with the saved model of an earlier analysis, without retraining."""
+    datasets = Dataset.query.filter_by(user_id=current_user.id).all()
+    score_form = _score_form(datasets)
+    
+    if score_form.validate_on_submit():
+        source = AnalysisResult.query.filter_by(id=score_form.analysis_id.data, user_id=current_user.id).first_or_404()
+        dataset = Dataset.query.filter_by(id=score_form.dataset_id.data, user_id=current_user.id).first_or_404()
+        
+        try:
+            detector = get_detector(_detector_path(source.id))
+            df = load_dataset(dataset)
+            
+            # Track execution time
+            start_time = time.time()
+            anomalies, scores = detector.score(df)
+            execution_time = round(time.time() - start_time, 2)
+            
+            # Create analysis result record
+            analysis_result = AnalysisResult(
+                name=score_form.name.data,
+                description=f'Scored with the model of "{source.name}"',
+                algorithm=source.algorithm,
+                parameters=dict(source.parameters or {}, model_analysis_id=source.id),
+                result_metrics={
+                    'execution_time': execution_time,
+                    'anomaly_count': len(anomalies),
+                    'score_mean': float(np.mean(scores)) if len(scores) > 0 else 0,
+                    'score_std': float(np.std(scores)) if len(scores) > 0 else 0,
+                    'threshold': detector.threshold
+                },
+                anomaly_count=len(anomalies),
+                dataset_id=dataset.id,
+                user_id=current_user.id
+            )
+            
+            db.session.add(analysis_result)
+            db.session.commit()
+            
+            # Create individual anomaly records
+            _save_anomalies(df, anomalies, scores, analysis_result)
+            
+            flash(f'Scored {len(df)} records with the model of "{source.name}" in {execution_time} seconds: {len(anomalies)} anomalies.', 'success')
+            
+            return redirect(url_for('results.view', id=analysis_result.id))
+            
+        except Exception as e:
+            flash(f'Error scoring with saved model: {str(e)}', 'danger')
+            return redirect(url_for('detection.index'))
+    
+    # If form validation failed
+    for field, errors in score_form.errors.items():
+        for error in errors:
+            flash(f'{getattr(score_form, field).label.text}: {error}', 'danger')
+    
+    return redirect(url_for('detection.index'))
+
+
+@detection_bp.route('/detection/sweep', methods=['POST'])
+@login_required
+def sweep():
+    """Evaluate a grid of detector parameters on a dataset and compare the configurations."""
+    datasets = Dataset.query.filter_by(user_id=current_user.id).all()
+    sweep_form = _sweep_form(datasets)
+    
+    if sweep_form.validate_on_submit():
+        dataset = Dataset.query.filter_by(id=sweep_form.dataset_id.data, user_id=current_user.id).first_or_404()
+        algorithm = sweep_form.algorithm.data
+        
+        try:
+            grid = _sweep_grid(sweep_form, algorithm)
+            
+            # Load the dataset; its version keys the cached feature matrix
+            df = load_dataset(dataset)
+            version = dataset_version(dataset.file_path)
+            
+            # Precision and recall come from the dataset's labels, if it has
+            # any, and from the anomalies validated in earlier analyses
+            is_anomaly = df['is_anomaly'] if 'is_anomaly' in df.columns and df['is_anomaly'].any() else None
+            labels = label_vector(len(df), is_anomaly=is_anomaly, validated=_validated_labels(dataset))
+            
+            # Track execution time
+            start_time = time.time()
+            results = run_sweep(df, algorithm, grid, version=version, labels=labels)
+            execution_time = round(time.time() - start_time, 2)
+            
+            return render_template(
+                'detection/sweep.html',
+                active_page='detection',
+                dataset=dataset,
+                algorithm=algorithm,
+                results=results,
+                labelled=labels is not None,
+                execution_time=execution_time
+            )
+            
+        except Exception as e:
+            flash(f'Error running parameter sweep: {str(e)}', 'danger')
+            return redirect(url_for('detection.index'))
+    
+    # If form validation failed
+    for field, errors in sweep_form.errors.items():
+        for error in errors:
+            flash(f'{getattr(sweep_form, field).label.text}: {error}', 'danger')
+    
     return redirect(url_for('detection.index'))
\ No newline at end of file
@@ -6,13 +6,15 @@ import json
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
 from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.insights import insights_bp
 from app.models import Dataset, AnalysisResult, Anomaly
+from utils.dataset_store import load_dataset
+from utils.dataset_profile import dataset_profile
+from utils.dataset_rollups import chart_series, DEFAULT_CHART_WIDTH
+from utils.data_processing import parse_timestamps
 
 
 @insights_bp.route('/')
@@ -39,6 +41,9 @@ def index():
 @login_required
 def dataset_insights(dataset_id):
     """View insights for a specific dataset."""
+    # Plotly is only imported by the pages that draw charts
+    import plotly.graph_objects as go
+    
     # Get the dataset
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -53,52 +58,48 @@ def dataset_insights(dataset_id):
             flash('Dataset file not found.', 'danger')
             return redirect(url_for('insights.index'))
         
-        # Get file extension
-        _, ext = os.path.splitext(dataset.filename)
-        ext = ext.lower()
-        
-        if ext == '.csv':
-            df = pd.read_csv(dataset.file_path)
-        elif ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(dataset.file_path)
-        elif ext == '.json':
-            df = pd.read_json(dataset.file_path)
-        elif ext == '.txt':
-            df = pd.read_csv(dataset.file_path, sep=None, engine='python')
-        else:
-            flash(f'Unsupported file format: {ext}', 'danger')
-            return redirect(url_for('insights.index'))
+        # Render from the profile computed at upload time
+        profile = dataset_profile(dataset)
+        db.session.commit()
+        column_stats = profile['column_stats']
         
         # Basic dataset statistics
         stats = {
-            'row_count': len(df),
-            'column_count': len(df.columns),
-            'numeric_columns': len(df.select_dtypes(include=['number']).columns),
-            'missing_values': df.isna().sum().sum(),
-            'memory_usage': df.memory_usage(deep=True).sum() / (1024 * 1024)  # MB
+            'row_count': profile['row_count'],
+            'column_count': profile['column_count'],
+            'numeric_columns': len(profile['numeric_columns']),
+            'missing_values': profile['null_count'],
+            'memory_usage': profile['memory_usage'] / (1024 * 1024)  # MB
         }
         
         # Numeric column summary
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        numeric_cols = profile['numeric_columns']
         numeric_summary = {}
         for col in numeric_cols:
             numeric_summary[col] = {
-                'min': float(df[col].min()),
-                'max': float(df[col].max()),
-                'mean': float(df[col].mean()),
-                'median': float(df[col].median()),
-                'std': float(df[col].std())
+                stat: column_stats[col][stat] for stat in ['min', 'max', 'mean', 'median', 'std']
             }
         
-        # Generate distribution plot for numeric columns
+        # Generate distribution plot for numeric columns from the stored histograms
         distribution_plots = {}
         for col in numeric_cols[:5]:  # Limit to first 5 columns
-            fig = px.histogram(df, x=col, title=f'Distribution of {col}',
-                              histnorm='probability density',
-                              labels={col: col},
-                              color_discrete_sequence=['#4b7bec'])
+            histogram = column_stats[col]['histogram']
+            if not histogram:
+                continue
+            
+            edges = np.array(histogram['edges'])
+            counts = np.array(histogram['counts'])
+            widths = np.diff(edges)
+            density = counts / (counts.sum() * widths) if counts.sum() else counts
+            
+            fig = go.Figure(go.Bar(x=(edges[:-1] + widths / 2).tolist(), y=density.tolist(), width=widths.tolist(),
+                                   marker_color='#4b7bec'))
             
             fig.update_layout(
+                title=f'Distribution of {col}',
+                xaxis_title=col,
+                yaxis_title='probability density',
+                bargap=0,
                 plot_bgcolor='rgba(30, 39, 46, 0.8)',
                 paper_bgcolor='rgba(30, 39, 46, 0)',
                 font=dict(color='white'),
@@ -109,30 +110,21 @@ def dataset_insights(dataset_id):
             
             distribution_plots[col] = json.dumps(fig.to_dict())
         
-        # Check for timestamp columns
-        timestamp_cols = []
+        # Stored datasets carry a single parsed timestamp column
+        series = profile['series']
+        timestamp_cols = ['timestamp'] if profile['time_coverage'] else []
         time_series_plots = {}
         
-        for col in df.columns:
-            if 'time' in col.lower() or 'date' in col.lower():
-                try:
-                    # Convert to datetime and check if successful
-                    df[col] = pd.to_datetime(df[col])
-                    timestamp_cols.append(col)
-                except:
-                    pass
-        
-        # Generate time series plots for numeric columns with timestamp
-        if timestamp_cols and numeric_cols:
-            timestamp_col = timestamp_cols[0]  # Use first timestamp column
-            
+        # Generate time series plots from the downsampled series
+        if series and numeric_cols:
             for col in numeric_cols[:3]:  # Limit to first 3 numeric columns
-                fig = px.line(df.sort_values(timestamp_col), x=timestamp_col, y=col,
-                             title=f'Time Series of {col}',
-                             labels={col: col, timestamp_col: 'Time'},
-                             color_discrete_sequence=['#4b7bec'])
+                fig = go.Figure(go.Scatter(x=series['timestamps'], y=series['values'][col],
+                                           mode='lines', line=dict(color='#4b7bec')))
                 
                 fig.update_layout(
+                    title=f'Time Series of {col}',
+                    xaxis_title='Time',
+                    yaxis_title=col,
                     plot_bgcolor='rgba(30, 39, 46, 0.8)',
                     paper_bgcolor='rgba(30, 39, 46, 0)',
                     font=dict(color='white'),
@@ -168,6 +160,10 @@ def dataset_insights(dataset_id):
 @login_required
 def analysis_insights(analysis_id):
     """View insights for a specific analysis result."""
+    # Plotly is only imported by the pages that draw charts
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     # Get the analysis result
     analysis = AnalysisResult.query.get_or_404(analysis_id)
     
@@ -190,21 +186,15 @@ def analysis_insights(analysis_id):
             flash('Dataset file not found.', 'danger')
             return redirect(url_for('insights.index'))
         
-        # Get file extension
-        _, ext = os.path.splitext(dataset.filename)
-        ext = ext.lower()
+        # Only the timestamp and the analysed column are plotted, optionally within a time window
+        target_col = (analysis.parameters or {}).get('target_column')
+        time_range = (request.args.get('start'), request.args.get('end'))
+        time_range = time_range if any(time_range) else None
+        df = load_dataset(dataset, columns=['timestamp', target_col] if target_col else ['timestamp'],
+                          time_range=time_range).copy()
         
-        if ext == '.csv':
-            df = pd.read_csv(dataset.file_path)
-        elif ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(dataset.file_path)
-        elif ext == '.json':
-            df = pd.read_json(dataset.file_path)
-        elif ext == '.txt':
-            df = pd.read_csv(dataset.file_path, sep=None, engine='python')
-        else:
-            flash(f'Unsupported file format: {ext}', 'danger')
-            return redirect(url_for('insights.index'))
+        # Rows keep their position in the dataset as index, so anomalies outside the window drop out
+        anomalies = [anomaly for anomaly in anomalies if anomaly.index in df.index]
         
         # Add anomaly column to dataframe
         df['anomaly'] = 0
@@ -212,7 +202,7 @@ def analysis_insights(analysis_id):
         
         # Set anomaly flags and scores
         for anomaly in anomalies:
-            if 0 <= anomaly.index < len(df):
+            if anomaly.index in df.index:
                 df.loc[anomaly.index, 'anomaly'] = 1
                 df.loc[anomaly.index, 'anomaly_score'] = anomaly.score
         
@@ -234,7 +224,7 @@ def analysis_insights(analysis_id):
             if 'time' in col.lower() or 'date' in col.lower():
                 try:
                     # Convert to datetime and check if successful
-                    df[col] = pd.to_datetime(df[col])
+                    df[col] = parse_timestamps(df[col])
                     timestamp_cols.append(col)
                 except:
                     pass
@@ -245,8 +235,9 @@ def analysis_insights(analysis_id):
             target_col = analysis.parameters['target_column']
             
             if target_col in df.columns:
-                # Create filtered dataframes
-                normal_df = df[df['anomaly'] == 0]
+                # Plot the series rolled up to fit the chart, and anomalies at their raw readings
+                series, _ = chart_series(dataset, target_col, time_range=time_range,
+                                         width=request.args.get('width', DEFAULT_CHART_WIDTH, type=int))
                 anomaly_df = df[df['anomaly'] == 1]
                 
                 # Create figure
@@ -254,8 +245,8 @@ def analysis_insights(analysis_id):
                 
                 # Add normal points
                 fig.add_trace(go.Scatter(
-                    x=normal_df[timestamp_col],
-                    y=normal_df[target_col],
+                    x=series['timestamp'],
+                    y=series[target_col],
                     mode='lines',
                     name='Normal Data',
                     line=dict(color='#4b7bec')
@@ -363,43 +354,29 @@ def api_dataset_summary(dataset_id):
         if not os.path.exists(dataset.file_path):
             return jsonify({'error': 'Dataset file not found'}), 404
         
-        # Get file extension
-        _, ext = os.path.splitext(dataset.filename)
-        ext = ext.lower()
-        
-        if ext == '.csv':
-            df = pd.read_csv(dataset.file_path)
-        elif ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(dataset.file_path)
-        elif ext == '.json':
-            df = pd.read_json(dataset.file_path)
-        elif ext == '.txt':
-            df = pd.read_csv(dataset.file_path, sep=None, engine='python')
-        else:
-            return jsonify({'error': f'Unsupported file format: {ext}'}), 400
+        profile = dataset_profile(dataset)
+        db.session.commit()
+        column_stats = profile['column_stats']
         
         # Numeric column summary
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        numeric_cols = profile['numeric_columns']
         numeric_summary = {}
         for col in numeric_cols:
             numeric_summary[col] = {
-                'min': float(df[col].min()),
-                'max': float(df[col].max()),
-                'mean': float(df[col].mean()),
-                'median': float(df[col].median()),
-                'std': float(df[col].std())
+                stat: column_stats[col][stat] for stat in ['min', 'max', 'mean', 'median', 'std']
             }
         
         # Basic dataset statistics
         summary = {
-            'row_count': len(df),
-            'column_count': len(df.columns),
+            'row_count': profile['row_count'],
+            'column_count': profile['column_count'],
             'numeric_columns': len(numeric_cols),
-            'missing_values': int(df.isna().sum().sum()),
-            'memory_usage': float(df.memory_usage(deep=True).sum() / (1024 * 1024)),  # MB
-            'columns': df.columns.tolist(),
+            'missing_values': profile['null_count'],
+            'memory_usage': profile['memory_usage'] / (1024 * 1024),  # MB
+            'columns': profile['columns'],
             'numeric_cols': numeric_cols,
-            'numeric_summary': numeric_summary
+            'numeric_summary': numeric_summary,
+            'time_coverage': profile['time_coverage']
         }
         
         return jsonify(summary)
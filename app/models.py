@@ -50,6 +50,7 @@ class Dataset(db.Model):
     row_count = db.Column(db.Integer, nullable=True)
     column_count = db.Column(db.Integer, nullable=True)
     has_timestamps = db.Column(db.Boolean, default=False)
+    dataset_metadata = db.Column(db.JSON, nullable=True)  # Detected format, time period, etc.
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     last_accessed = db.Column(db.DateTime, nullable=True)
     
@@ -9,6 +9,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from app.models import Dataset, AnalysisResult, Anomaly
+from utils.dataset_store import load_dataset
 from datetime import datetime, timedelta
 import random
 
@@ -113,9 +114,7 @@ def generate_recommendations(analysis):
     
     # Try to load the dataset
     try:
-        df = pd.read_csv(dataset.file_path)
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = load_dataset(dataset, columns=['timestamp', 'consumption'])
         
         # Get anomaly indices
         anomaly_indices = [a.index for a in anomalies]
@@ -10,6 +10,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from app.models import Dataset, AnalysisResult, Anomaly
+from utils.dataset_store import dataset_columns, read_row_positions, read_rows, time_slice
+from utils.dataset_rollups import chart_series, DEFAULT_CHART_WIDTH
+from models.registry import analysis_detector_path, delete_detector
 from datetime import datetime, timedelta
 
 # Create blueprint
@@ -165,16 +168,12 @@ def view_anomaly(id):
     context_data = None
     if dataset and os.path.exists(dataset.file_path):
         try:
-            df = pd.read_csv(dataset.file_path)
-            
             # Get the index of the anomaly in the original data
             anomaly_index = anomaly.index
             
-            # Get a window of data around the anomaly
+            # Read only the window of data around the anomaly
             start_idx = max(0, anomaly_index - 5)
-            end_idx = min(len(df), anomaly_index + 6)
-            
-            context_data = df.iloc[start_idx:end_idx].to_dict('records')
+            context_data = read_rows(dataset.file_path, start_idx, anomaly_index + 6).to_dict('records')
             
             # Mark the anomaly row
             for i, row in enumerate(context_data):
@@ -295,13 +294,6 @@ def get_chart_data(id):
         return jsonify({'error': 'Dataset not found'}), 404
     
     try:
-        # Load dataset
-        df = pd.read_csv(dataset.file_path)
-        
-        # Parse timestamp if available
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
         # Get anomalies
         anomalies = Anomaly.query.filter_by(analysis_result_id=analysis.id).all()
         anomaly_indices = [a.index for a in anomalies]
@@ -310,17 +302,25 @@ def get_chart_data(id):
         data = {
             'timestamps': [],
             'consumption': [],
-            'anomalies': []
+            'anomalies': [],
+            'resolution': None
         }
         
-        # Extract timestamps and consumption
-        if 'timestamp' in df.columns and 'consumption' in df.columns:
-            data['timestamps'] = df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
-            data['consumption'] = df['consumption'].tolist()
+        # Extract timestamps and consumption, rolled up to fit the chart width
+        if {'timestamp', 'consumption'} <= set(dataset_columns(dataset.file_path)):
+            width = request.args.get('width', DEFAULT_CHART_WIDTH, type=int)
+            time_range = (request.args.get('start'), request.args.get('end'))
+            series, data['resolution'] = chart_series(dataset, 'consumption', width=width,
+                                                      time_range=time_range if any(time_range) else None)
+            data['timestamps'] = series['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
+            data['consumption'] = series['consumption'].tolist()
             
-            # Mark anomalies
-            data['anomalies'] = [{'x': data['timestamps'][idx], 'y': data['consumption'][idx]} 
-                               for idx in anomaly_indices if idx < len(df)]
+            # Mark anomalies at their raw readings, within the requested window,
+            # reading only the anomalous rows
+            points = read_row_positions(dataset.file_path, anomaly_indices, columns=['timestamp', 'consumption'])
+            points = time_slice(points, *time_range)
+            data['anomalies'] = [{'x': ts.strftime('%Y-%m-%d %H:%M:%S'), 'y': value}
+                                 for ts, value in zip(points['timestamp'], points['consumption'])]
             
         return jsonify(data)
         
@@ -342,6 +342,9 @@ def delete(id):
         db.session.delete(analysis)
         db.session.commit()
         
+        # Delete its saved model
+        delete_detector(analysis_detector_path(current_app.config['MODEL_FOLDER'], id))
+        
         flash('Analysis deleted successfully', 'success')
     except Exception as e:
         flash(f'Error deleting analysis: {str(e)}', 'danger')
@@ -148,6 +148,17 @@ def preferences():
                           prefs=user_prefs)
 
 
+@settings_bp.route('/api/cache')
+@login_required
+def api_cache_stats():
+    """API endpoint reporting dataset cache usage (administrators only)."""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    from utils.dataset_store import dataset_cache
+    return jsonify(dataset_cache.stats())
+
+
 @settings_bp.route('/api/preferences', methods=['GET', 'PUT'])
 @login_required
 def api_preferences():
@@ -3,7 +3,7 @@ Upload forms for the Energy Anomaly Detection System.
 """
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, TextAreaField, BooleanField, SubmitField
+from wtforms import StringField, TextAreaField, BooleanField, SelectField, SubmitField
 from wtforms.validators import DataRequired, Length, Optional
 
 class UploadForm(FlaskForm):
@@ -20,9 +20,22 @@ class UploadForm(FlaskForm):
     
     file = FileField('CSV File', validators=[
         FileRequired(),
-        FileAllowed(['csv'], 'CSV files only')
+        FileAllowed(['csv', 'gz', 'bz2', 'xz', 'zip'], 'CSV files (optionally compressed) only')
     ])
     
     has_header = BooleanField('File has header row', default=True)
     
-    submit = SubmitField('Upload')
\ No newline at end of file
+    submit = SubmitField('Upload')
+
+class AppendForm(FlaskForm):
+    """Form for appending new readings to an existing dataset."""
+    dataset_id = SelectField('Dataset', coerce=int, validators=[DataRequired()])
+    
+    file = FileField('CSV File', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'gz', 'bz2', 'xz', 'zip'], 'CSV files (optionally compressed) only')
+    ])
+    
+    has_header = BooleanField('File has header row', default=True)
+    
+    submit = SubmitField('Append')
\ No newline at end of file
@@ -1,56 +1,141 @@
 """
 Upload routes for the Energy Anomaly Detection System.
 """
+import io
 import os
+import re
+import tempfile
 import pandas as pd
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Dataset
-from app.upload.forms import UploadForm
+from app.models import Dataset, AnalysisResult
+from app.upload.forms import UploadForm, AppendForm
+from utils.data_processing import (
+    detect_csv_format, ingest_energy_csv, append_energy_csv, is_supported_csv, open_energy_csv
+)
+from utils.dataset_store import stored_dataset_path, remove_stored_dataset, row_positions
+from utils.dataset_profile import dataset_profile
+from utils.upload_spool import (
+    create_spool, load_spool, append_to_spool, remove_spool, read_sample, ReplayStream
+)
 from datetime import datetime
 import uuid
 
 # Create blueprint
 upload_bp = Blueprint('upload', __name__)
 
+# Bytes read from a streamed upload to detect its format
+STREAM_SAMPLE_BYTES = 64 * 1024
+
 def allowed_file(filename):
-    """Check if the file extension is allowed."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'csv'
+    """Check if the file extension is allowed (CSV, optionally gzip/bz2/xz/zip compressed)."""
+    return is_supported_csv(filename)
 
-def validate_dataset(df):
+def _ingest_upload(source, format_info, name, description, original_filename):
     """
-    Validate that the uploaded dataset contains required columns.
+    Ingest an uploaded CSV file into a new stored dataset and record it.
     
     Args:
-        df (pandas.DataFrame): The dataset to validate
+        source: Path to the spooled upload, or a binary stream of it
+        format_info: Format information from detect_csv_format
+        name: Dataset name
+        description: Dataset description
+        original_filename: Sanitized name of the uploaded file
         
     Returns:
-        tuple: (is_valid, message)
+        The new Dataset record
     """
-    # Check if required columns exist
-    required_columns = ['timestamp', 'consumption']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    # Create a unique filename to avoid conflicts
+    file_path = stored_dataset_path(current_app.config['UPLOAD_FOLDER'],
+                                    f"{uuid.uuid4().hex}_{original_filename}")
     
-    if missing_columns:
-        return False, f"Missing required columns: {', '.join(missing_columns)}"
+    # Standardize, validate and store a typed columnar copy chunk by chunk
+    summary = ingest_energy_csv(
+        source,
+        file_path,
+        format_info,
+        chunksize=current_app.config['INGEST_CHUNK_SIZE'],
+        min_rows=10
+    )
     
-    # Check if timestamp column can be parsed
+    # Get time period of the dataset
     try:
-        pd.to_datetime(df['timestamp'])
-    except Exception:
-        return False, "Timestamp column could not be parsed. Please ensure it's in a standard date-time format."
+        time_period = f"{summary['start'].strftime('%b %Y')} - {summary['end'].strftime('%b %Y')}"
+    except:
+        time_period = "Unknown"
     
-    # Check if consumption column is numeric
-    if not pd.api.types.is_numeric_dtype(df['consumption']):
-        return False, "Consumption column must contain numeric values."
+    columns = summary['columns']
+    
+    # Create database record
+    dataset = Dataset(
+        name=name,
+        description=description,
+        filename=original_filename,
+        file_path=file_path,
+        file_size=os.path.getsize(file_path),
+        file_type='parquet',
+        row_count=summary['row_count'],
+        column_count=len(columns),
+        has_timestamps=summary['format_info']['timestamp_column'] != 'Generated timestamp',
+        user_id=current_user.id,
+        dataset_metadata={
+            'columns': columns,
+            'time_period': time_period,
+            'format_info': summary['format_info'],
+            'profile': summary['profile']
+        }
+    )
     
-    # Check if there's enough data
-    if len(df) < 10:
-        return False, "Dataset contains too few rows (minimum 10 required)."
+    db.session.add(dataset)
+    db.session.commit()
     
-    return True, "Dataset is valid."
+    return dataset
+
+def _rekey_anomalies(dataset, summary):
+    """
+    Point the anomalies of a dataset's analyses back at their readings after an append.
+    
+    When the append moved stored rows, each anomaly's row index is looked up
+    again from its timestamp. An analysis is marked stale in its metrics when
+    one of its anomalies has no timestamp to re-key by, or its reading was
+    replaced by the append. The caller commits the session.
+    
+    Args:
+        dataset: Dataset record that was appended to
+        summary: Summary returned by append_energy_csv
+        
+    Returns:
+        Number of analyses marked stale
+    """
+    replaced = set(summary['replaced_timestamps'].tolist())
+    if not summary['positions_changed'] and not replaced:
+        return 0
+    
+    analyses = AnalysisResult.query.filter_by(dataset_id=dataset.id).all()
+    stale = set()
+    anomalies = [anomaly for analysis in analyses for anomaly in analysis.anomalies]
+    timed = [anomaly for anomaly in anomalies if anomaly.timestamp is not None]
+    
+    if summary['positions_changed']:
+        stale.update(anomaly.analysis_result_id for anomaly in anomalies if anomaly.timestamp is None)
+        positions = row_positions(dataset.file_path, [anomaly.timestamp for anomaly in timed]) if timed else []
+        for anomaly, position in zip(timed, positions):
+            if position < 0:
+                stale.add(anomaly.analysis_result_id)
+            else:
+                anomaly.index = int(position)
+    
+    stale.update(anomaly.analysis_result_id for anomaly in timed
+                 if pd.Timestamp(anomaly.timestamp).value in replaced)
+    
+    for analysis in analyses:
+        if analysis.id in stale:
+            # Reassign so the JSON column is flagged as modified
+            analysis.result_metrics = {**(analysis.result_metrics or {}), 'stale': True}
+    
+    return len(stale)
 
 @upload_bp.route('/upload')
 @login_required
@@ -62,11 +147,16 @@ def index():
     # Get user's datasets
     datasets = Dataset.query.filter_by(user_id=current_user.id).all()
     
-    # Render upload page with form and datasets
+    # Initialize append form with the user's datasets
+    append_form = AppendForm()
+    append_form.dataset_id.choices = [(dataset.id, dataset.name) for dataset in datasets]
+    
+    # Render upload page with forms and datasets
     return render_template(
         'upload/index.html',
         active_page='upload',
         form=form,
+        append_form=append_form,
         datasets=datasets
     )
 
@@ -86,74 +176,116 @@ def upload_file():
         
         # Check if the file is allowed
         if not allowed_file(file.filename):
-            flash('Only CSV files are allowed', 'danger')
+            flash('Only CSV files (optionally compressed as .gz, .bz2, .xz or .zip) are allowed', 'danger')
             return redirect(url_for('upload.index'))
         
+        original_filename = secure_filename(file.filename)
+        
+        # Create the upload directory if it doesn't exist
+        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'])
+        os.makedirs(upload_dir, exist_ok=True)
+        
+        raw_path = os.path.join(upload_dir, f"raw_{uuid.uuid4().hex}_{original_filename}")
+        
         try:
-            # Read the file into a pandas DataFrame
-            df = pd.read_csv(file, header=0 if form.has_header.data else None)
+            # Spool the upload to disk so it can be parsed in chunks
+            file.save(raw_path)
             
-            # If file doesn't have headers, assign default ones
-            if not form.has_header.data:
-                df.columns = [f'col_{i}' for i in range(len(df.columns))]
-                # Try to rename the first two columns to defaults if they exist
-                if len(df.columns) >= 2:
-                    df = df.rename(columns={'col_0': 'timestamp', 'col_1': 'consumption'})
+            # Detect the column layout from a small sample of the file
+            format_info = detect_csv_format(raw_path, has_header=form.has_header.data)
             
-            # Validate the dataset
-            is_valid, message = validate_dataset(df)
-            if not is_valid:
-                flash(message, 'danger')
-                return redirect(url_for('upload.index'))
+            dataset = _ingest_upload(raw_path, format_info, form.name.data, form.description.data,
+                                     original_filename)
+            
+            flash(f'Dataset "{dataset.name}" uploaded successfully with {dataset.row_count} rows '
+                  f'and {dataset.column_count} columns.', 'success')
+            return redirect(url_for('upload.index'))
             
-            # Create a unique filename to avoid conflicts
-            original_filename = secure_filename(file.filename)
-            filename = f"{uuid.uuid4().hex}_{original_filename}"
+        except Exception as e:
+            flash(f'Error processing file: {str(e)}', 'danger')
+            return redirect(url_for('upload.index'))
+        
+        finally:
+            # The raw upload is no longer needed once it has been ingested
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+    
+    # If form validation failed
+    for field, errors in form.errors.items():
+        for error in errors:
+            flash(f'{getattr(form, field).label.text}: {error}', 'danger')
+    
+    return redirect(url_for('upload.index'))
+
+@upload_bp.route('/upload/append', methods=['POST'])
+@login_required
+def append_file():
+    """Handle appending new readings to an existing dataset."""
+    form = AppendForm()
+    form.dataset_id.choices = [(dataset.id, dataset.name)
+                               for dataset in Dataset.query.filter_by(user_id=current_user.id).all()]
+    
+    if form.validate_on_submit():
+        dataset = Dataset.query.filter_by(id=form.dataset_id.data, user_id=current_user.id).first_or_404()
+        file = form.file.data
+        
+        # Check if the file is allowed
+        if not allowed_file(file.filename):
+            flash('Only CSV files (optionally compressed as .gz, .bz2, .xz or .zip) are allowed', 'danger')
+            return redirect(url_for('upload.index'))
+        
+        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'])
+        raw_path = os.path.join(upload_dir, f"raw_{uuid.uuid4().hex}_{secure_filename(file.filename)}")
+        
+        try:
+            # Spool the upload to disk so it can be parsed in chunks
+            file.save(raw_path)
             
-            # Create the upload directory if it doesn't exist
-            upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'])
-            os.makedirs(upload_dir, exist_ok=True)
+            # Detect the column layout from a small sample of the file
+            format_info = detect_csv_format(raw_path, has_header=form.has_header.data)
             
-            # Save file to disk
-            file_path = os.path.join(upload_dir, filename)
-            df.to_csv(file_path, index=False)
+            # Validate the new rows and merge them into the stored dataset
+            metadata = dataset.dataset_metadata or {}
+            summary = append_energy_csv(
+                raw_path,
+                dataset.file_path,
+                profile=metadata.get('profile'),
+                format_info=format_info,
+                chunksize=current_app.config['INGEST_CHUNK_SIZE']
+            )
             
             # Get time period of the dataset
             try:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                start_date = df['timestamp'].min()
-                end_date = df['timestamp'].max()
-                time_period = f"{start_date.strftime('%b %Y')} - {end_date.strftime('%b %Y')}"
+                time_period = f"{summary['start'].strftime('%b %Y')} - {summary['end'].strftime('%b %Y')}"
             except:
                 time_period = "Unknown"
             
-            # Create database record
-            dataset = Dataset(
-                name=form.name.data,
-                description=form.description.data,
-                filename=original_filename,
-                file_path=file_path,
-                file_size=os.path.getsize(file_path),
-                file_type='csv',
-                row_count=len(df),
-                column_count=len(df.columns),
-                has_timestamps=True,
-                user_id=current_user.id,
-                dataset_metadata={
-                    'columns': df.columns.tolist(),
-                    'time_period': time_period
-                }
-            )
-            
-            db.session.add(dataset)
+            # Update database record
+            dataset.row_count = summary['row_count']
+            dataset.file_size = os.path.getsize(dataset.file_path)
+            dataset.dataset_metadata = {
+                **metadata,
+                'time_period': time_period,
+                'profile': summary['profile']
+            }
+            stale = _rekey_anomalies(dataset, summary)
             db.session.commit()
             
-            flash(f'Dataset "{form.name.data}" uploaded successfully with {len(df)} rows and {len(df.columns)} columns.', 'success')
+            flash(f'Appended {summary["added"]} new rows to "{dataset.name}" '
+                  f'({summary["replaced"]} existing rows replaced).', 'success')
+            if stale:
+                flash(f'{stale} analyses of "{dataset.name}" refer to readings that were replaced or could '
+                      f'not be located again; run them again for up-to-date results.', 'warning')
             return redirect(url_for('upload.index'))
-            
+        
         except Exception as e:
-            flash(f'Error processing file: {str(e)}', 'danger')
+            flash(f'Error appending file: {str(e)}', 'danger')
             return redirect(url_for('upload.index'))
+        
+        finally:
+            # The raw upload is no longer needed once it has been merged
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
     
     # If form validation failed
     for field, errors in form.errors.items():
@@ -162,6 +294,240 @@ def upload_file():
     
     return redirect(url_for('upload.index'))
 
+def _stream_upload_fields(values):
+    """
+    Validate the dataset details sent with a streamed or chunked upload.
+    
+    Args:
+        values: Mapping with name, description, filename and has_header
+        
+    Returns:
+        dict: The validated details
+    """
+    name = (values.get('name') or '').strip()
+    if not 3 <= len(name) <= 100:
+        raise ValueError('Dataset Name must be between 3 and 100 characters.')
+    
+    description = (values.get('description') or '').strip()
+    if len(description) > 500:
+        raise ValueError('Description must be at most 500 characters.')
+    
+    filename = secure_filename(values.get('filename') or 'upload.csv')
+    if not allowed_file(filename):
+        raise ValueError('Only CSV files (optionally compressed as .gz, .bz2, .xz or .zip) are allowed')
+    
+    has_header = str(values.get('has_header', 'true')).lower() not in ['0', 'false', 'no', 'n']
+    
+    return {'name': name, 'description': description, 'filename': filename, 'has_header': has_header}
+
+def _detect_sample_format(sample, has_header):
+    """
+    Detect the column layout of a streamed upload from its first bytes.
+    
+    Args:
+        sample: Leading bytes of the upload
+        has_header: Whether the first row holds column names
+        
+    Returns:
+        dict: Format information from detect_csv_format
+    """
+    # Only pass complete lines to the detector
+    if b'\n' in sample:
+        sample = sample[:sample.rindex(b'\n') + 1]
+    
+    with tempfile.NamedTemporaryFile(dir=current_app.config['UPLOAD_FOLDER'], suffix='.csv', delete=False) as f:
+        f.write(sample)
+    
+    try:
+        return detect_csv_format(f.name, has_header=has_header)
+    finally:
+        os.remove(f.name)
+
+@upload_bp.route('/upload/stream', methods=['POST'])
+@login_required
+def stream_upload():
+    """
+    Ingest a CSV file sent as the raw request body while it is still arriving.
+    
+    Dataset details are passed as query parameters. The body, plain or
+    gzip/bz2/xz compressed, is parsed and stored chunk by chunk straight from
+    the request stream, so the upload is
+    never held in memory and may exceed MAX_CONTENT_LENGTH up to
+    MAX_STREAM_UPLOAD_LENGTH.
+    """
+    try:
+        fields = _stream_upload_fields(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Lift the form upload limit for this request only
+    request.max_content_length = current_app.config['MAX_STREAM_UPLOAD_LENGTH']
+    
+    try:
+        # Decompress gzip, bz2 and xz bodies on the fly
+        with open_energy_csv(io.BufferedReader(request.stream)) as stream:
+            # Detect the format from the first bytes, then replay them into the parser
+            sample = read_sample(stream, STREAM_SAMPLE_BYTES)
+            if not sample:
+                raise ValueError('The uploaded file is empty.')
+            format_info = _detect_sample_format(sample, fields['has_header'])
+            
+            dataset = _ingest_upload(io.BufferedReader(ReplayStream(sample, stream)), format_info,
+                                     fields['name'], fields['description'], fields['filename'])
+    except Exception as e:
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 400
+    
+    return jsonify({
+        'dataset_id': dataset.id,
+        'row_count': dataset.row_count,
+        'column_count': dataset.column_count
+    }), 201
+
+def _owned_spool(upload_id):
+    """Look up a partial upload that belongs to the current user."""
+    state = load_spool(current_app.config['UPLOAD_FOLDER'], upload_id)
+    if state is None or state['user_id'] != current_user.id:
+        return None
+    return state
+
+@upload_bp.route('/upload/chunked', methods=['POST'])
+@login_required
+def start_chunked_upload():
+    """
+    Start a resumable upload of a large CSV file.
+    
+    The file is then sent as a series of PUT requests, each appending one
+    chunk and each within MAX_CONTENT_LENGTH, and finished with a POST to
+    the complete endpoint.
+    """
+    values = request.get_json(silent=True) or request.form
+    try:
+        fields = _stream_upload_fields(values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    size = values.get('size')
+    if size is not None:
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'size must be a whole number of bytes'}), 400
+        if size < 0:
+            return jsonify({'error': 'size must not be negative'}), 400
+    
+    upload_id = create_spool(current_app.config['UPLOAD_FOLDER'], {
+        **fields,
+        'size': size,
+        'user_id': current_user.id
+    })
+    
+    return jsonify({
+        'upload_id': upload_id,
+        'received': 0,
+        'max_chunk_size': current_app.config['MAX_CONTENT_LENGTH']
+    }), 201
+
+@upload_bp.route('/upload/chunked/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    """Report how many bytes of a resumable upload have been received."""
+    state = _owned_spool(upload_id)
+    if state is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    return jsonify({'upload_id': upload_id, 'received': state['received'], 'size': state['size']})
+
+@upload_bp.route('/upload/chunked/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """
+    Append one chunk to a resumable upload.
+    
+    The chunk's position is taken from a ``Content-Range: bytes start-end/total``
+    header if present. A chunk that does not start where the received bytes
+    end is rejected with 409 and the number of bytes received, so the client
+    can resume from there. A range whose total differs from the size given
+    when the upload started, or that reaches past that size, is rejected
+    with 400; no more than the declared range is read from the request.
+    """
+    state = _owned_spool(upload_id)
+    if state is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    offset = state['received']
+    length = request.content_length
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range.strip())
+        if not match:
+            return jsonify({'error': 'Invalid Content-Range header'}), 400
+        offset, end = int(match.group(1)), int(match.group(2))
+        if end < offset:
+            return jsonify({'error': 'Invalid Content-Range header'}), 400
+        length = end - offset + 1
+        if request.content_length is not None and request.content_length != length:
+            return jsonify({'error': 'Content-Range does not match the chunk length'}), 400
+        total = match.group(3)
+        if total != '*' and state['size'] is not None and int(total) != state['size']:
+            return jsonify({
+                'error': f"Content-Range total {total} does not match the upload size of {state['size']} bytes"
+            }), 400
+    
+    if state['size'] is not None:
+        if length is not None and offset + length > state['size']:
+            return jsonify({'error': f"Chunk ends past the upload size of {state['size']} bytes"}), 400
+        # Never read past the declared size, even without a length
+        length = state['size'] - offset if length is None else length
+    
+    try:
+        received = append_to_spool(current_app.config['UPLOAD_FOLDER'], upload_id, request.stream, offset,
+                                   length=length)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'received': os.path.getsize(state['path'])}), 409
+    
+    return jsonify({'upload_id': upload_id, 'received': received})
+
+@upload_bp.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """Ingest a fully received resumable upload into a new dataset."""
+    state = _owned_spool(upload_id)
+    if state is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if state['size'] is not None and state['received'] != state['size']:
+        return jsonify({
+            'error': f"Upload is incomplete: {state['received']} of {state['size']} bytes received",
+            'received': state['received']
+        }), 409
+    
+    try:
+        # Detect the column layout from a small sample of the file
+        format_info = detect_csv_format(state['path'], has_header=state['has_header'])
+        
+        dataset = _ingest_upload(state['path'], format_info, state['name'], state['description'],
+                                 state['filename'])
+    except Exception as e:
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 400
+    finally:
+        remove_spool(current_app.config['UPLOAD_FOLDER'], upload_id)
+    
+    return jsonify({
+        'dataset_id': dataset.id,
+        'row_count': dataset.row_count,
+        'column_count': dataset.column_count
+    }), 201
+
+@upload_bp.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_chunked_upload(upload_id):
+    """Abandon a resumable upload and delete the bytes received so far."""
+    if _owned_spool(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    remove_spool(current_app.config['UPLOAD_FOLDER'], upload_id)
+    return jsonify({'upload_id': upload_id, 'cancelled': True})
+
 @upload_bp.route('/upload/preview/<int:id>')
 @login_required
 def preview_dataset(id):
@@ -169,20 +535,21 @@ def preview_dataset(id):
     dataset = Dataset.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     
     try:
-        # Read the dataset file
-        df = pd.read_csv(dataset.file_path)
+        # Render from the profile computed at upload time
+        profile = dataset_profile(dataset)
+        db.session.commit()
         
         # Get basic stats
         stats = {
-            'row_count': len(df),
-            'column_count': len(df.columns),
-            'columns': df.columns.tolist(),
-            'has_nulls': df.isnull().any().any(),
-            'null_count': df.isnull().sum().sum()
+            'row_count': profile['row_count'],
+            'column_count': profile['column_count'],
+            'columns': profile['columns'],
+            'has_nulls': profile['null_count'] > 0,
+            'null_count': profile['null_count']
         }
         
         # Get preview data (first 10 rows)
-        preview_data = df.head(10).to_dict('records')
+        preview_data = profile['head']
         
         return render_template(
             'upload/preview.html',
@@ -190,7 +557,7 @@ def preview_dataset(id):
             dataset=dataset,
             stats=stats,
             preview_data=preview_data,
-            columns=df.columns.tolist()
+            columns=profile['columns']
         )
     except Exception as e:
         flash(f'Error previewing dataset: {str(e)}', 'danger')
@@ -203,9 +570,8 @@ def delete_dataset(id):
     dataset = Dataset.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     
     try:
-        # Delete the file from disk
-        if os.path.exists(dataset.file_path):
-            os.remove(dataset.file_path)
+        # Delete the file and its sidecar files from disk
+        remove_stored_dataset(dataset.file_path)
         
         # Delete database record
         db.session.delete(dataset)
@@ -0,0 +1,101 @@
+"""
+Startup-time benchmark for the Flask and Streamlit frontends.
+
+Each target is started several times in a fresh interpreter, and the median
+wall time is reported along with the heavy libraries the startup imported:
+
+- run_flask.py: the script's imports plus create_app(), on an in-memory
+  database, so the demo data is not touched
+- app.py and pages/04_Run_Detection.py: the module-level imports of the
+  Streamlit script; the page itself needs a Streamlit session to render
+
+With --eager, TensorFlow, scikit-learn and plotly are imported before each
+target. This reproduces the startup from before these libraries were loaded
+lazily, so one run shows the improvement side by side.
+
+Usage:
+    python benchmark_startup.py [--runs N] [--eager]
+"""
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Libraries that should only be imported once an algorithm or chart is used
+HEAVY_MODULES = ['tensorflow', 'sklearn', 'plotly']
+
+# Imports done at startup before the heavy libraries were loaded lazily
+EAGER_IMPORTS = 'import tensorflow, sklearn.ensemble, sklearn.cluster, plotly.express, plotly.graph_objects'
+
+# Runs in the child interpreter: times the startup code, reports the heavy modules loaded
+CHILD_TEMPLATE = """
+import sys, time, json
+sys.path.insert(0, {base_dir!r})
+start = time.perf_counter()
+{prelude}
+{startup}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def script_imports(path):
+    """Module-level import statements of a script, as source code."""
+    with open(os.path.join(BASE_DIR, path), 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def startup_code(target):
+    """Code that reproduces the startup of a target."""
+    if target == 'run_flask.py':
+        return script_imports(target) + "\ncreate_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})"
+    return script_imports(target)
+
+
+def measure(target, runs, eager):
+    """Start a target in fresh interpreters and collect the startup times."""
+    code = CHILD_TEMPLATE.format(
+        base_dir=BASE_DIR,
+        prelude=EAGER_IMPORTS if eager else '',
+        startup=startup_code(target),
+        heavy=HEAVY_MODULES
+    )
+
+    times = []
+    heavy = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{target} failed to start:\n{completed.stderr}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        heavy = result['heavy']
+
+    return statistics.median(times), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters started per target')
+    parser.add_argument('--eager', action='store_true', help='Also time startup with the heavy libraries imported up front')
+    args = parser.parse_args()
+
+    targets = ['run_flask.py', 'app.py', 'pages/04_Run_Detection.py']
+    modes = [('lazy', False)] + ([('eager', True)] if args.eager else [])
+
+    print(f"{'Target':<28} {'Mode':<6} {'Median (s)':>10}  Heavy libraries imported")
+    for target in targets:
+        for mode, eager in modes:
+            seconds, heavy = measure(target, args.runs, eager)
+            print(f"{target:<28} {mode:<6} {seconds:>10.3f}  {', '.join(heavy) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,56 @@
 """
 Machine learning models for the Energy Anomaly Detection System.
-"""
\ No newline at end of file
+
+Detector modules pull in scikit-learn or TensorFlow, so they are imported
+through load_algorithm when an algorithm is first run rather than when a
+frontend starts.
+"""
+from importlib import import_module
+
+# Module of each algorithm; it defines run_<name>, and fit_<name> for the
+# single detectors
+ALGORITHMS = {
+    'isolation_forest': 'models.isolation_forest',
+    'autoencoder': 'models.autoencoder',
+    'kmeans': 'models.kmeans',
+    'ensemble': 'models.ensemble'
+}
+
+# Algorithms that can be combined in an ensemble
+DETECTORS = ['isolation_forest', 'autoencoder', 'kmeans']
+
+
+def _algorithm_function(name, prefix):
+    """Import an algorithm's module and return one of its entry points."""
+    if name not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm: {name}")
+    return getattr(import_module(ALGORITHMS[name]), f"{prefix}_{name}")
+
+
+def load_algorithm(name):
+    """
+    Import the detector of an algorithm on first use.
+
+    Args:
+        name (str): Algorithm name, e.g. 'isolation_forest'
+
+    Returns:
+        callable: The algorithm's run function, e.g. run_isolation_forest
+    """
+    return _algorithm_function(name, 'run')
+
+
+def load_fit_function(name):
+    """
+    Import the function fitting a detector on a scaled feature matrix.
+
+    Args:
+        name (str): Detector name, one of DETECTORS
+
+    Returns:
+        callable: The detector's fit function, e.g. fit_isolation_forest,
+            returning (anomaly_indices, anomaly_scores, model, threshold)
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Not a single detector: {name}")
+    return _algorithm_function(name, 'fit')
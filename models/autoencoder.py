@@ -2,24 +2,88 @@
 AutoEncoder anomaly detection algorithm for the Energy Anomaly Detection System.
 """
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Input
 from tensorflow.keras.optimizers import Adam
 import logging
 
-def run_autoencoder(df, params=None):
+from models.features import get_feature_matrix
+from models.registry import FittedDetector
+from models.dense_autoencoder import reconstruction_errors
+
+# Most rows the network is trained on; larger inputs are sampled down to this
+MAX_TRAINING_ROWS = 200000
+
+# Share of the training rows held out to decide when to stop
+VALIDATION_SPLIT = 0.1
+
+# Epochs without validation improvement before training stops
+EARLY_STOPPING_PATIENCE = 5
+
+# Fewest held-out rows for which early stopping is used
+MIN_VALIDATION_ROWS = 64
+
+# Bounds of the batch size chosen from the number of training rows
+MIN_BATCH_SIZE = 32
+MAX_BATCH_SIZE = 1024
+
+def adaptive_batch_size(n_rows):
     """
-    Run AutoEncoder algorithm on the dataset.
+    Choose a batch size that gives roughly 200 steps per epoch.
     
     Args:
-        df (pandas.DataFrame): The dataset to analyze
-        params (dict, optional): Algorithm parameters
+        n_rows (int): Number of training rows
+        
+    Returns:
+        int: A power of two between MIN_BATCH_SIZE and MAX_BATCH_SIZE
+    """
+    target = max(n_rows / 200, 1)
+    return int(np.clip(2 ** int(np.round(np.log2(target))), MIN_BATCH_SIZE, MAX_BATCH_SIZE))
+
+def training_sample(n_rows, size, seed=42):
+    """
+    Draw a uniform sample of row positions to train on.
+    
+    Every subset of ``size`` rows is equally likely, as with reservoir
+    sampling; since the feature matrix is already in memory the sample is
+    drawn in one step rather than by streaming over the rows.
+    
+    Args:
+        n_rows (int): Number of rows
+        size (int): Sample size
+        seed (int): Random seed
         
     Returns:
-        tuple: (anomaly_indices, anomaly_scores)
+        numpy.ndarray: Sorted row positions (all rows if size >= n_rows)
+    """
+    if size >= n_rows:
+        return np.arange(n_rows)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n_rows, size=size, replace=False))
+
+def _training_dataset(X, batch_size, shuffle):
+    """tf.data pipeline feeding (input, target) batches from a float32 array."""
+    dataset = tf.data.Dataset.from_tensor_slices(X)
+    if shuffle:
+        dataset = dataset.shuffle(min(len(X), 10 * batch_size), seed=42, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).map(lambda batch: (batch, batch)).prefetch(tf.data.AUTOTUNE)
+
+def fit_autoencoder(X_scaled, params=None):
+    """
+    Train an autoencoder on a scaled feature matrix and score its rows.
+    
+    Falls back to PCA reconstruction if TensorFlow fails.
+    
+    Args:
+        X_scaled (numpy.ndarray): Scaled features
+        params (dict, optional): Algorithm parameters; 'epochs' is the most
+            epochs trained, as training stops early once the validation loss
+            stops improving, and 'batch_size' defaults to a size adapted to
+            the number of training rows
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores, model, threshold)
     """
     # Set default parameters if not provided
     if params is None:
@@ -27,55 +91,15 @@ def run_autoencoder(df, params=None):
             'threshold_percentile': 95,
             'components': 2,
             'epochs': 50,
-            'batch_size': 32,
             'learning_rate': 0.001
         }
     
     threshold_percentile = params.get('threshold_percentile', 95)
     components = params.get('components', 2)
     epochs = params.get('epochs', 50)
-    batch_size = params.get('batch_size', 32)
+    batch_size = params.get('batch_size')
     learning_rate = params.get('learning_rate', 0.001)
-    
-    # Extract features for anomaly detection
-    feature_cols = []
-    
-    # Use consumption as a feature
-    if 'consumption' in df.columns:
-        feature_cols.append('consumption')
-    
-    # Use temperature as a feature if available
-    if 'temperature' in df.columns:
-        feature_cols.append('temperature')
-    
-    # Use humidity as a feature if available
-    if 'humidity' in df.columns:
-        feature_cols.append('humidity')
-    
-    # If we have timestamp, add time-based features
-    if 'timestamp' in df.columns and pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-        # Extract hour of day
-        df['hour'] = df['timestamp'].dt.hour
-        feature_cols.append('hour')
-        
-        # Extract day of week
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        feature_cols.append('day_of_week')
-    
-    # Ensure we have at least one feature
-    if not feature_cols:
-        # If no specific features, use all numeric columns
-        feature_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    
-    # Prepare features
-    X = df[feature_cols].copy()
-    
-    # Handle missing values
-    X = X.fillna(X.mean())
-    
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    max_training_rows = params.get('max_training_rows', MAX_TRAINING_ROWS)
     
     # Input dimension
     input_dim = X_scaled.shape[1]
@@ -100,18 +124,37 @@ def run_autoencoder(df, params=None):
         # Compile the model
         model.compile(optimizer=Adam(learning_rate=learning_rate), loss='mean_squared_error')
         
+        # Train on a uniform sample of at most max_training_rows rows, holding
+        # out part of it to stop training once the validation loss levels off
+        sample = X_scaled[training_sample(len(X_scaled), max_training_rows)]
+        n_validation = int(len(sample) * VALIDATION_SPLIT)
+        if n_validation < MIN_VALIDATION_ROWS:
+            n_validation = 0
+        rows = np.random.default_rng(42).permutation(len(sample))
+        X_train = sample[rows[n_validation:]]
+        X_validation = sample[rows[:n_validation]]
+        
+        if batch_size is None:
+            batch_size = adaptive_batch_size(len(X_train))
+        
+        callbacks = [tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss' if n_validation else 'loss',
+            patience=EARLY_STOPPING_PATIENCE,
+            min_delta=1e-4,
+            restore_best_weights=True
+        )]
+        
         # Train the model
         model.fit(
-            X_scaled, X_scaled,
+            _training_dataset(X_train, batch_size, shuffle=True),
+            validation_data=_training_dataset(X_validation, batch_size, shuffle=False) if n_validation else None,
             epochs=epochs,
-            batch_size=batch_size,
-            shuffle=True,
+            callbacks=callbacks,
             verbose=0
         )
         
         # Get reconstruction error
-        reconstructions = model.predict(X_scaled, verbose=0)
-        mse = np.mean(np.power(X_scaled - reconstructions, 2), axis=1)
+        mse = reconstruction_errors(model, X_scaled)
         
         # Determine threshold for anomalies
         threshold = np.percentile(mse, threshold_percentile)
@@ -120,7 +163,7 @@ def run_autoencoder(df, params=None):
         anomaly_mask = mse > threshold
         anomaly_indices = np.where(anomaly_mask)[0]
         
-        return anomaly_indices, mse
+        return anomaly_indices, mse, model, threshold
         
     except Exception as e:
         # In case of TF errors, fall back to a simpler approach
@@ -131,11 +174,10 @@ def run_autoencoder(df, params=None):
         
         # Use PCA as a fallback
         pca = PCA(n_components=min(encoding_dim, input_dim))
-        X_pca = pca.fit_transform(X_scaled)
-        X_reconstructed = pca.inverse_transform(X_pca)
+        pca.fit(X_scaled)
         
         # Calculate reconstruction error
-        mse = np.mean(np.power(X_scaled - X_reconstructed, 2), axis=1)
+        mse = reconstruction_errors(pca, X_scaled)
         
         # Determine threshold for anomalies
         threshold = np.percentile(mse, threshold_percentile)
@@ -144,4 +186,31 @@ def run_autoencoder(df, params=None):
         anomaly_mask = mse > threshold
         anomaly_indices = np.where(anomaly_mask)[0]
         
-        return anomaly_indices, mse
\ No newline at end of file
+        return anomaly_indices, mse, pca, threshold
+
+def run_autoencoder(df, params=None, version=None, columns=None, return_model=False):
+    """
+    Run AutoEncoder algorithm on the dataset.
+    
+    Args:
+        df (pandas.DataFrame): The dataset to analyze
+        params (dict, optional): Algorithm parameters (see fit_autoencoder)
+        version (tuple, optional): Version of the stored dataset df was loaded
+            from, used to cache its feature matrix
+        columns (list, optional): Feature columns (the default feature set if None)
+        return_model (bool): Also return the fitted detector, so it can be
+            saved and reused to score new data
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores), plus the FittedDetector
+            if return_model is set
+    """
+    # Scaled features, shared with other detectors run on the same data
+    matrix = get_feature_matrix(df, columns=columns, version=version)
+    
+    anomaly_indices, mse, model, threshold = fit_autoencoder(matrix.values, params)
+    
+    if return_model:
+        return anomaly_indices, mse, FittedDetector.from_matrix('autoencoder', model, matrix, threshold, params)
+    
+    return anomaly_indices, mse
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+TensorFlow-free inference for trained autoencoders.
+
+The autoencoder is a stack of Dense layers, so once trained its weights can
+be exported as NumPy arrays and the forward pass run with plain matrix
+products. Scoring with an exported model never imports TensorFlow.
+"""
+import os
+import json
+import numpy as np
+
+# File listing the layer activations of saved weights
+LAYERS_FILE = 'layers.json'
+
+# Rows reconstructed per chunk when scoring
+PREDICT_CHUNK_SIZE = 65536
+
+# Dense layer activations the NumPy forward pass supports
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: np.divide(1, 1 + np.exp(-x, out=x), out=x),
+    'tanh': lambda x: np.tanh(x, out=x)
+}
+
+
+class DenseAutoencoder:
+    """
+    NumPy forward pass of a trained stack of Dense layers.
+
+    ``weights`` and ``biases`` hold one kernel and bias per layer, in order,
+    and ``activations`` the name of each layer's activation. float32 arrays,
+    including memory-mapped ones, are used as given without a copy.
+    """
+
+    def __init__(self, weights, biases, activations):
+        unsupported = [name for name in activations if name not in ACTIVATIONS]
+        if unsupported:
+            raise ValueError(f"Unsupported activations: {', '.join(unsupported)}")
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = list(activations)
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Export the weights of a trained Keras model made of Dense layers.
+
+        Args:
+            model: Trained Keras Sequential model
+
+        Returns:
+            DenseAutoencoder: The exported network
+        """
+        weights, biases, activations = [], [], []
+        for layer in model.layers:
+            layer_weights = layer.get_weights()
+            if not layer_weights:
+                continue
+            config = layer.get_config()
+            if len(layer_weights) != 2 or 'activation' not in config:
+                raise ValueError(f"Layer {layer.name} is not a Dense layer with a bias")
+            weights.append(layer_weights[0])
+            biases.append(layer_weights[1])
+            activations.append(config['activation'])
+        return cls(weights, biases, activations)
+
+    def predict(self, X):
+        """
+        Run the forward pass.
+
+        Args:
+            X (numpy.ndarray): Inputs, one row per point
+
+        Returns:
+            numpy.ndarray: float32 outputs
+        """
+        out = np.asarray(X, dtype=np.float32)
+        for W, b, activation in zip(self.weights, self.biases, self.activations):
+            out = out @ W
+            out += b
+            out = ACTIVATIONS[activation](out)
+        return out
+
+    def save(self, path):
+        """
+        Save the weights to a directory, one .npy file per array.
+
+        Each array is stored on its own so that it can be memory-mapped when
+        loaded; the activations are listed in ``layers.json``.
+
+        Args:
+            path (str): Directory to write; it is created if needed
+        """
+        os.makedirs(path, exist_ok=True)
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            np.save(os.path.join(path, f'W{i}.npy'), np.ascontiguousarray(W))
+            np.save(os.path.join(path, f'b{i}.npy'), np.ascontiguousarray(b))
+        with open(os.path.join(path, LAYERS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'activations': self.activations}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Load weights saved with save().
+
+        Args:
+            path (str): Directory of the saved weights
+            mmap_mode (str, optional): 'r' to memory-map the arrays read-only,
+                so processes scoring with the same model share their pages
+
+        Returns:
+            DenseAutoencoder: The network
+        """
+        with open(os.path.join(path, LAYERS_FILE), 'r', encoding='utf-8') as f:
+            activations = json.load(f)['activations']
+        weights = [np.load(os.path.join(path, f'W{i}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                   for i in range(len(activations))]
+        biases = [np.load(os.path.join(path, f'b{i}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for i in range(len(activations))]
+        return cls(weights, biases, activations)
+
+
+def reconstruction_errors(model, X, chunk_size=PREDICT_CHUNK_SIZE):
+    """
+    Mean squared reconstruction error of each point.
+
+    Points are reconstructed in large chunks. Keras models are called
+    directly rather than through predict(), which batches by 32 and builds a
+    pipeline per call.
+
+    Args:
+        model: DenseAutoencoder, trained Keras autoencoder, or the fitted PCA
+            used as fallback
+        X (numpy.ndarray): Scaled features
+        chunk_size (int): Rows reconstructed per chunk
+
+    Returns:
+        numpy.ndarray: Reconstruction errors
+    """
+    if hasattr(model, 'inverse_transform'):
+        reconstructions = model.inverse_transform(model.transform(X))
+        return np.mean(np.power(X - reconstructions, 2), axis=1)
+
+    errors = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        if isinstance(model, DenseAutoencoder):
+            reconstructions = model.predict(chunk)
+        else:
+            reconstructions = np.asarray(model(chunk, training=False))
+        errors[start:start + len(chunk)] = np.mean(np.power(chunk - reconstructions, 2), axis=1)
+    return errors
@@ -0,0 +1,200 @@
+"""
+Ensemble anomaly detection for the Energy Anomaly Detection System.
+
+Several detectors are fitted concurrently on one shared feature matrix and
+their scores are normalized and fused into a single score. Each detector
+runs in its own worker thread. The fits spend their time in compiled code
+that releases the GIL, so they run in parallel while reading the same
+matrix, and the ensemble takes about as long as its slowest detector.
+Threads are used rather than forked processes because forking the
+multithreaded web servers (or a process whose OpenMP/BLAS pools are
+running) can deadlock the child.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from models import DETECTORS, load_fit_function
+from models.features import get_feature_matrix
+
+# Ways of putting the detectors' scores on a common scale
+NORMALIZATIONS = ['rank', 'robust_z']
+
+# Ways of combining the normalized scores
+FUSION_METHODS = ['mean', 'max', 'vote']
+
+# Scales the median absolute deviation to the standard deviation of normal data
+MAD_SCALE = 1.4826
+
+def _fit_member(name, X, params):
+    """Fit one detector and return its anomalies and scores."""
+    anomaly_indices, scores, _, _ = load_fit_function(name)(X, params)
+    return anomaly_indices, np.asarray(scores, dtype=np.float64)
+
+def rank_normalize(scores):
+    """
+    Replace scores by their rank, scaled to (0, 1].
+
+    Args:
+        scores (numpy.ndarray): Anomaly scores (higher is more anomalous)
+
+    Returns:
+        numpy.ndarray: Rank percentiles; tied scores share their average rank
+    """
+    return pd.Series(scores).rank(method='average', pct=True).to_numpy()
+
+def robust_zscore(scores):
+    """
+    Standardize scores with their median and median absolute deviation.
+
+    Unlike a plain z-score, the scale is not inflated by the anomalies
+    themselves.
+
+    Args:
+        scores (numpy.ndarray): Anomaly scores (higher is more anomalous)
+
+    Returns:
+        numpy.ndarray: Robust z-scores
+    """
+    median = np.median(scores)
+    scale = np.median(np.abs(scores - median)) * MAD_SCALE
+    if scale == 0:
+        scale = np.std(scores) or 1.0
+    return (scores - median) / scale
+
+def normalize_scores(scores, method='rank'):
+    """
+    Put one detector's scores on the common ensemble scale.
+
+    Args:
+        scores (numpy.ndarray): Anomaly scores
+        method (str): One of NORMALIZATIONS
+
+    Returns:
+        numpy.ndarray: Normalized scores
+    """
+    if method == 'rank':
+        return rank_normalize(scores)
+    if method == 'robust_z':
+        return robust_zscore(scores)
+    raise ValueError(f"Unknown normalization: {method}")
+
+def fuse_scores(member_results, normalization='rank', fusion='mean', threshold_percentile=95, min_votes=None):
+    """
+    Fuse the results of several detectors into one.
+
+    The fused score is the mean or maximum of the normalized scores. With
+    'mean' and 'max' the anomalies are the points above the given percentile
+    of the fused score; with 'vote' they are the points that at least
+    ``min_votes`` detectors flagged (a majority by default), ranked by the
+    mean normalized score.
+
+    Args:
+        member_results (list): (anomaly_indices, anomaly_scores) of each detector
+        normalization (str): One of NORMALIZATIONS
+        fusion (str): One of FUSION_METHODS
+        threshold_percentile (float): Fused score percentile above which
+            points are anomalies, for 'mean' and 'max'
+        min_votes (int, optional): Detectors that must agree, for 'vote'
+
+    Returns:
+        tuple: (anomaly_indices, fused_scores)
+    """
+    if fusion not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {fusion}")
+
+    normalized = np.vstack([normalize_scores(scores, normalization) for _, scores in member_results])
+    fused = normalized.max(axis=0) if fusion == 'max' else normalized.mean(axis=0)
+
+    if fusion == 'vote':
+        votes = np.zeros(normalized.shape[1], dtype=np.int32)
+        for anomaly_indices, _ in member_results:
+            votes[anomaly_indices] += 1
+        if min_votes is None:
+            min_votes = len(member_results) // 2 + 1
+        anomaly_mask = votes >= min_votes
+    else:
+        anomaly_mask = fused > np.percentile(fused, threshold_percentile)
+
+    return np.where(anomaly_mask)[0], fused
+
+def fit_parallel(X, tasks, max_workers=None):
+    """
+    Fit detectors concurrently on one feature matrix.
+
+    Each task runs in a worker thread of this process, so all of them read
+    the same matrix without copying it.
+
+    Args:
+        X (numpy.ndarray): Scaled features
+        tasks (list): (detector name, parameters) of each fit
+        max_workers (int, optional): Worker threads (one per task, up to the CPU count, by default)
+
+    Returns:
+        list: (anomaly_indices, anomaly_scores) of each task, in task order
+    """
+    workers = max(1, min(max_workers or len(tasks), len(tasks) or 1, os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_fit_member, name, X, params) for name, params in tasks]
+        return [future.result() for future in futures]
+
+def fit_members(X, algorithms, member_params=None, max_workers=None):
+    """
+    Fit several detectors concurrently on one feature matrix.
+
+    Args:
+        X (numpy.ndarray): Scaled features
+        algorithms (list): Detector names, from models.DETECTORS
+        member_params (dict, optional): Parameters of each detector, by name
+        max_workers (int, optional): Worker threads (one per detector by default)
+
+    Returns:
+        dict: (anomaly_indices, anomaly_scores) of each detector, by name
+    """
+    member_params = member_params or {}
+    results = fit_parallel(X, [(name, member_params.get(name)) for name in algorithms], max_workers)
+    return dict(zip(algorithms, results))
+
+def run_ensemble(df, params=None, version=None, columns=None, return_model=False):
+    """
+    Run several detectors on the dataset and fuse their scores.
+
+    Args:
+        df (pandas.DataFrame): The dataset to analyze
+        params (dict, optional): Ensemble parameters: 'algorithms' (detectors
+            to combine, all by default), 'normalization', 'fusion',
+            'threshold_percentile', 'min_votes', 'members' (parameters of
+            each detector, by name) and 'n_jobs' (worker threads)
+        version (tuple, optional): Version of the stored dataset df was loaded
+            from, used to cache its feature matrix
+        columns (list, optional): Feature columns (the default feature set if None)
+        return_model (bool): Also return a fitted detector; ensembles are not
+            saved, so it is None
+
+    Returns:
+        tuple: (anomaly_indices, fused_scores), plus None if return_model is set
+    """
+    params = params or {}
+    algorithms = params.get('algorithms') or DETECTORS
+    unknown = [name for name in algorithms if name not in DETECTORS]
+    if unknown:
+        raise ValueError(f"Unknown detectors: {', '.join(unknown)}")
+
+    # Scaled features, built once and shared by every detector
+    matrix = get_feature_matrix(df, columns=columns, version=version)
+
+    results = fit_members(matrix.values, algorithms, params.get('members'), params.get('n_jobs'))
+
+    anomaly_indices, fused = fuse_scores(
+        list(results.values()),
+        normalization=params.get('normalization', 'rank'),
+        fusion=params.get('fusion', 'mean'),
+        threshold_percentile=params.get('threshold_percentile', 95),
+        min_votes=params.get('min_votes')
+    )
+
+    if return_model:
+        return anomaly_indices, fused, None
+
+    return anomaly_indices, fused
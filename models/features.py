@@ -0,0 +1,207 @@
+"""
+Shared feature engineering for the anomaly detection algorithms.
+
+Every detector works on the same scaled feature matrix: consumption,
+temperature and humidity where available, plus hour of day and day of week
+when the dataset has timestamps. The matrix is built once per dataset
+version and feature spec and kept in a process-wide cache, so running
+several algorithms, or re-running one with new parameters, reuses it.
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUCache
+from utils.data_processing import numeric_feature_columns
+
+# Measured columns used as features when present
+MEASURED_FEATURES = ['consumption', 'temperature', 'humidity']
+
+# Features derived from the timestamp
+TIME_FEATURES = ['hour', 'day_of_week']
+
+
+class FeatureMatrix:
+    """
+    Scaled feature matrix of a dataset.
+
+    ``values`` is a read-only, C-contiguous float32 array with one row per
+    dataset row and one column per entry of ``columns``. ``scaler`` is the
+    StandardScaler fitted on the unscaled features, and ``fill_values`` the
+    column means used to fill missing values.
+    """
+
+    def __init__(self, values, columns, scaler, fill_values):
+        self.values = values
+        self.columns = columns
+        self.scaler = scaler
+        self.fill_values = fill_values
+
+    @property
+    def nbytes(self):
+        """Memory used by the matrix."""
+        return self.values.nbytes
+
+
+def feature_columns(df, columns=None):
+    """
+    Choose the feature columns of a dataset.
+
+    Args:
+        df (pandas.DataFrame): The dataset
+        columns (list, optional): Explicit feature columns; time features
+            in this list are derived from the timestamp
+
+    Returns:
+        list: Feature column names
+    """
+    if columns is not None:
+        return list(columns)
+
+    selected = [col for col in MEASURED_FEATURES if col in df.columns]
+
+    # If we have timestamp, add time-based features
+    if 'timestamp' in df.columns and pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        selected += TIME_FEATURES
+
+    # If no specific features, use all numeric columns other than labels and flags
+    if not selected:
+        selected = numeric_feature_columns(df)
+
+    return selected
+
+
+def _feature_values(df, col):
+    """Values of one feature as float64, deriving time features from the timestamp."""
+    if col == 'hour' and 'hour' not in df.columns:
+        return df['timestamp'].dt.hour.to_numpy(dtype=np.float64)
+    if col == 'day_of_week' and 'day_of_week' not in df.columns:
+        return df['timestamp'].dt.dayofweek.to_numpy(dtype=np.float64)
+    return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _unscaled_features(df, columns):
+    """Unscaled float64 feature matrix, with NaN for missing values."""
+    X = np.empty((len(df), len(columns)), dtype=np.float64)
+    for i, col in enumerate(columns):
+        X[:, i] = _feature_values(df, col)
+    return X
+
+
+def _fill_missing(X, fill_values):
+    """Replace missing values in place with the value of their column."""
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(fill_values, np.nonzero(missing)[1])
+
+
+def build_feature_matrix(df, columns=None):
+    """
+    Build the scaled feature matrix of a dataset without modifying it.
+
+    Missing values are filled with the column mean and every column is
+    scaled to zero mean and unit variance.
+
+    Args:
+        df (pandas.DataFrame): The dataset
+        columns (list, optional): Explicit feature columns
+
+    Returns:
+        FeatureMatrix: The feature matrix
+    """
+    columns = feature_columns(df, columns)
+    X = _unscaled_features(df, columns)
+
+    # Handle missing values
+    with np.errstate(all='ignore'):
+        fill_values = np.nanmean(X, axis=0) if len(X) else np.zeros(len(columns))
+    fill_values = np.where(np.isnan(fill_values), 0.0, fill_values)
+    _fill_missing(X, fill_values)
+
+    # Scale features; scikit-learn is imported once features are first built
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    values = np.ascontiguousarray(scaler.fit_transform(X), dtype=np.float32)
+    values.flags.writeable = False
+
+    return FeatureMatrix(values, columns, scaler, fill_values)
+
+
+def transform_features(df, columns, scaler, fill_values):
+    """
+    Build the feature matrix of new data with the preprocessing of a fitted model.
+
+    Missing values are filled with ``fill_values`` and the columns scaled
+    with ``scaler``, both taken from the data the model was trained on, so
+    new rows land in the same feature space.
+
+    Args:
+        df (pandas.DataFrame): The data to score
+        columns (list): Feature columns the model was trained on
+        scaler (StandardScaler): Scaler fitted on the training features
+        fill_values (numpy.ndarray): Training column means
+
+    Returns:
+        numpy.ndarray: C-contiguous float32 feature matrix
+    """
+    missing_columns = [col for col in columns if col not in df.columns
+                       and not (col in TIME_FEATURES and 'timestamp' in df.columns)]
+    if missing_columns:
+        raise ValueError(f"Data is missing the model's feature columns: {', '.join(missing_columns)}")
+
+    X = _unscaled_features(df, columns)
+    _fill_missing(X, np.asarray(fill_values, dtype=np.float64))
+    return np.ascontiguousarray(scaler.transform(X), dtype=np.float32)
+
+
+# Process-wide cache of feature matrices, keyed on (dataset version, feature columns)
+feature_cache = LRUCache(
+    max_bytes=int(os.environ.get('FEATURE_CACHE_MAX_MB', 256)) * 1024 * 1024,
+    sizeof=lambda matrix: matrix.nbytes
+)
+
+
+def _frame_version(df, columns):
+    """
+    Version key of an in-memory frame without a stored dataset version.
+
+    The key is a hash of the frame's contents in the columns the features
+    are built from, so any edit to those values yields a new key, while
+    frames holding the same values share one cache entry.
+    """
+    sources = [col for col in columns if col in df.columns]
+    if 'timestamp' in df.columns and any(col in TIME_FEATURES and col not in df.columns for col in columns):
+        sources.append('timestamp')
+    row_hashes = pd.util.hash_pandas_object(df[sources], index=False).to_numpy()
+    return 'frame', len(df), hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def get_feature_matrix(df, columns=None, version=None):
+    """
+    Get the scaled feature matrix of a dataset, building it on first use.
+
+    Args:
+        df (pandas.DataFrame): The dataset
+        columns (list, optional): Explicit feature columns
+        version (tuple, optional): Version of the stored dataset the frame
+            was loaded from (see utils.dataset_store.dataset_version); frames
+            without one are cached by a hash of their feature columns
+
+    Returns:
+        FeatureMatrix: The feature matrix, shared with other callers; its
+            values must not be modified
+    """
+    columns = feature_columns(df, columns)
+    stored = version is not None
+    key = (version if stored else _frame_version(df, columns), tuple(columns))
+
+    matrix = feature_cache.get(key)
+    if matrix is None:
+        if stored:
+            # Older versions of the same dataset will not be asked for again
+            feature_cache.invalidate(lambda cached_key: cached_key[0][0] == version[0] and cached_key[0] != version)
+        matrix = build_feature_matrix(df, columns)
+        feature_cache.put(key, matrix)
+
+    return matrix
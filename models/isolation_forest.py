@@ -3,18 +3,46 @@ Isolation Forest anomaly detection algorithm for the Energy Anomaly Detection Sy
 """
 import numpy as np
 from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
 
-def run_isolation_forest(df, params=None):
+from models.features import get_feature_matrix
+from models.registry import FittedDetector
+
+# Rows scored per chunk, bounding the per-tree temporary arrays
+SCORE_CHUNK_SIZE = 65536
+
+def isolation_scores(model, X, chunk_size=SCORE_CHUNK_SIZE):
     """
-    Run Isolation Forest algorithm on the dataset.
+    Score points with a fitted Isolation Forest in fixed-size chunks.
+    
+    The score is the negated decision function, so a point is an anomaly
+    (predict() returns -1) exactly when its score is positive. Each point
+    passes through the trees once.
     
     Args:
-        df (pandas.DataFrame): The dataset to analyze
-        params (dict, optional): Algorithm parameters
+        model (IsolationForest): Fitted model
+        X (numpy.ndarray): Scaled features
+        chunk_size (int): Rows per chunk
         
     Returns:
-        tuple: (anomaly_indices, anomaly_scores)
+        numpy.ndarray: Anomaly scores
+    """
+    scores = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), chunk_size):
+        stop = start + chunk_size
+        scores[start:stop] = model.offset_ - model.score_samples(X[start:stop])
+    return scores
+
+def fit_isolation_forest(X_scaled, params=None):
+    """
+    Fit Isolation Forest on a scaled feature matrix and score its rows.
+    
+    Args:
+        X_scaled (numpy.ndarray): Scaled features
+        params (dict, optional): Algorithm parameters, including optional
+            'max_samples' (rows drawn per tree) and 'n_jobs' (cores to use)
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores, model, threshold)
     """
     # Set default parameters if not provided
     if params is None:
@@ -25,63 +53,50 @@ def run_isolation_forest(df, params=None):
     
     n_estimators = params.get('n_estimators', 100)
     contamination = params.get('contamination', 0.05)
-    
-    # Extract features for anomaly detection
-    feature_cols = []
-    
-    # Use consumption as a feature
-    if 'consumption' in df.columns:
-        feature_cols.append('consumption')
-    
-    # Use temperature as a feature if available
-    if 'temperature' in df.columns:
-        feature_cols.append('temperature')
-    
-    # Use humidity as a feature if available
-    if 'humidity' in df.columns:
-        feature_cols.append('humidity')
-    
-    # If we have timestamp, add time-based features
-    if 'timestamp' in df.columns and isinstance(df['timestamp'].iloc[0], np.datetime64):
-        # Extract hour of day
-        df['hour'] = df['timestamp'].dt.hour
-        feature_cols.append('hour')
-        
-        # Extract day of week
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        feature_cols.append('day_of_week')
-    
-    # Ensure we have at least one feature
-    if not feature_cols:
-        # If no specific features, use all numeric columns
-        feature_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    
-    # Prepare features
-    X = df[feature_cols].copy()
-    
-    # Handle missing values
-    X = X.fillna(X.mean())
-    
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    max_samples = params.get('max_samples', 'auto')
+    n_jobs = params.get('n_jobs')
     
     # Train the model
     model = IsolationForest(
         n_estimators=n_estimators,
         contamination=contamination,
+        max_samples=max_samples if max_samples == 'auto' else min(max_samples, len(X_scaled)),
+        n_jobs=n_jobs,
         random_state=42
     )
     model.fit(X_scaled)
     
-    # Predict anomalies (-1 for anomaly, 1 for normal)
-    predictions = model.predict(X_scaled)
-    anomaly_mask = predictions == -1
+    # Anomaly scores from a single pass over the trees (higher is more anomalous)
+    scores = isolation_scores(model, X_scaled)
+    
+    # Anomalies are the points predict() would label -1
+    anomaly_indices = np.where(scores > 0)[0]
+    
+    return anomaly_indices, scores, model, 0.0
+
+def run_isolation_forest(df, params=None, version=None, columns=None, return_model=False):
+    """
+    Run Isolation Forest algorithm on the dataset.
+    
+    Args:
+        df (pandas.DataFrame): The dataset to analyze
+        params (dict, optional): Algorithm parameters (see fit_isolation_forest)
+        version (tuple, optional): Version of the stored dataset df was loaded
+            from, used to cache its feature matrix
+        columns (list, optional): Feature columns (the default feature set if None)
+        return_model (bool): Also return the fitted detector, so it can be
+            saved and reused to score new data
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores), plus the FittedDetector
+            if return_model is set
+    """
+    # Scaled features, shared with other detectors run on the same data
+    matrix = get_feature_matrix(df, columns=columns, version=version)
     
-    # Get decision function scores (negative for anomalies)
-    scores = -model.decision_function(X_scaled)
+    anomaly_indices, scores, model, threshold = fit_isolation_forest(matrix.values, params)
     
-    # Get indices of anomalies
-    anomaly_indices = np.where(anomaly_mask)[0]
+    if return_model:
+        return anomaly_indices, scores, FittedDetector.from_matrix('isolation_forest', model, matrix, threshold, params)
     
-    return anomaly_indices, scores
\ No newline at end of file
+    return anomaly_indices, scores
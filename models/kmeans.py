@@ -2,21 +2,54 @@
 K-Means clustering anomaly detection algorithm for the Energy Anomaly Detection System.
 """
 import numpy as np
-import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from scipy.spatial.distance import cdist
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
-def run_kmeans(df, params=None):
+from models.features import get_feature_matrix
+from models.registry import FittedDetector
+
+# Row count above which MiniBatchKMeans is used in 'auto' mode
+MINIBATCH_THRESHOLD = 100000
+
+# Rows per mini-batch in MiniBatchKMeans mode
+MINIBATCH_SIZE = 4096
+
+# Rows per chunk when computing distances to the cluster centres
+DISTANCE_CHUNK_SIZE = 65536
+
+def centroid_distances(X, centers, labels, chunk_size=DISTANCE_CHUNK_SIZE):
     """
-    Run K-Means clustering algorithm on the dataset.
+    Compute the distance of every point to the centre of its cluster.
+    
+    Points are processed in chunks, so the temporary differences stay
+    bounded by the chunk size.
     
     Args:
-        df (pandas.DataFrame): The dataset to analyze
-        params (dict, optional): Algorithm parameters
+        X (numpy.ndarray): Points, one per row
+        centers (numpy.ndarray): Cluster centres, one per row
+        labels (numpy.ndarray): Cluster of each point
+        chunk_size (int): Points per chunk
         
     Returns:
-        tuple: (anomaly_indices, anomaly_scores)
+        numpy.ndarray: Euclidean distances
+    """
+    distances = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), chunk_size):
+        stop = start + chunk_size
+        diff = X[start:stop] - centers[labels[start:stop]]
+        distances[start:stop] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+    return distances
+
+def fit_kmeans(X_scaled, params=None):
+    """
+    Fit K-Means on a scaled feature matrix and score its rows.
+    
+    Args:
+        X_scaled (numpy.ndarray): Scaled features
+        params (dict, optional): Algorithm parameters; 'mode' is 'auto'
+            (MiniBatchKMeans above MINIBATCH_THRESHOLD rows), 'full' or 'minibatch'
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores, model, threshold)
     """
     # Set default parameters if not provided
     if params is None:
@@ -27,46 +60,7 @@ def run_kmeans(df, params=None):
     
     n_clusters = params.get('n_clusters', 5)
     threshold_percentile = params.get('threshold_percentile', 95)
-    
-    # Extract features for anomaly detection
-    feature_cols = []
-    
-    # Use consumption as a feature
-    if 'consumption' in df.columns:
-        feature_cols.append('consumption')
-    
-    # Use temperature as a feature if available
-    if 'temperature' in df.columns:
-        feature_cols.append('temperature')
-    
-    # Use humidity as a feature if available
-    if 'humidity' in df.columns:
-        feature_cols.append('humidity')
-    
-    # If we have timestamp, add time-based features
-    if 'timestamp' in df.columns and pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-        # Extract hour of day
-        df['hour'] = df['timestamp'].dt.hour
-        feature_cols.append('hour')
-        
-        # Extract day of week
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        feature_cols.append('day_of_week')
-    
-    # Ensure we have at least one feature
-    if not feature_cols:
-        # If no specific features, use all numeric columns
-        feature_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    
-    # Prepare features
-    X = df[feature_cols].copy()
-    
-    # Handle missing values
-    X = X.fillna(X.mean())
-    
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    mode = params.get('mode', 'auto')
     
     # Ensure we don't have more clusters than data points
     n_clusters = min(n_clusters, len(X_scaled) - 1)
@@ -75,22 +69,24 @@ def run_kmeans(df, params=None):
     if n_clusters < 2:
         n_clusters = 2
     
-    # Train the model
-    kmeans = KMeans(
-        n_clusters=n_clusters,
-        random_state=42,
-        n_init=10
-    )
+    # Train the model, in mini-batches for large datasets
+    if mode == 'minibatch' or (mode == 'auto' and len(X_scaled) > MINIBATCH_THRESHOLD):
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            random_state=42,
+            batch_size=params.get('batch_size', MINIBATCH_SIZE),
+            n_init=3
+        )
+    else:
+        kmeans = KMeans(
+            n_clusters=n_clusters,
+            random_state=42,
+            n_init=10
+        )
     kmeans.fit(X_scaled)
     
-    # Get cluster assignments
-    clusters = kmeans.predict(X_scaled)
-    
     # Calculate distance to assigned cluster center
-    distances = np.zeros(len(X_scaled))
-    for i in range(len(X_scaled)):
-        cluster_idx = clusters[i]
-        distances[i] = np.linalg.norm(X_scaled[i] - kmeans.cluster_centers_[cluster_idx])
+    distances = centroid_distances(X_scaled, kmeans.cluster_centers_, kmeans.labels_)
     
     # Determine threshold for anomalies
     threshold = np.percentile(distances, threshold_percentile)
@@ -99,4 +95,31 @@ def run_kmeans(df, params=None):
     anomaly_mask = distances > threshold
     anomaly_indices = np.where(anomaly_mask)[0]
     
-    return anomaly_indices, distances
\ No newline at end of file
+    return anomaly_indices, distances, kmeans, threshold
+
+def run_kmeans(df, params=None, version=None, columns=None, return_model=False):
+    """
+    Run K-Means clustering algorithm on the dataset.
+    
+    Args:
+        df (pandas.DataFrame): The dataset to analyze
+        params (dict, optional): Algorithm parameters (see fit_kmeans)
+        version (tuple, optional): Version of the stored dataset df was loaded
+            from, used to cache its feature matrix
+        columns (list, optional): Feature columns (the default feature set if None)
+        return_model (bool): Also return the fitted detector, so it can be
+            saved and reused to score new data
+        
+    Returns:
+        tuple: (anomaly_indices, anomaly_scores), plus the FittedDetector
+            if return_model is set
+    """
+    # Scaled features, shared with other detectors run on the same data
+    matrix = get_feature_matrix(df, columns=columns, version=version)
+    
+    anomaly_indices, distances, kmeans, threshold = fit_kmeans(matrix.values, params)
+    
+    if return_model:
+        return anomaly_indices, distances, FittedDetector.from_matrix('kmeans', kmeans, matrix, threshold, params)
+    
+    return anomaly_indices, distances
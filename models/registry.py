@@ -0,0 +1,326 @@
+"""
+Registry of fitted anomaly detectors for the Energy Anomaly Detection System.
+
+A detection run saves its fitted model together with the preprocessing it
+was trained with (feature columns, scaler and missing value fills) and its
+anomaly threshold, so new data can be scored with the same model without
+training it again. Scikit-learn models are stored with joblib. Keras
+autoencoders are stored in the native Keras format and their weights are
+also exported as NumPy arrays, which are what gets loaded for scoring, so
+scoring an autoencoder does not import TensorFlow.
+
+Loaded detectors are kept in a process-wide LRU cache. Exported
+autoencoder weights are saved one array per .npy file and memory-mapped
+when loaded, so worker processes serving the same autoencoder share its
+pages through the OS page cache. The joblib file is memory-mapped too, but
+this only spares a copy of arrays the estimators keep as they are, such as
+k-means centroids; scikit-learn rebuilds Isolation Forest trees from the
+stored node arrays, so each process holds its own copy of them.
+"""
+import os
+import json
+import shutil
+import logging
+from datetime import datetime
+import joblib
+import numpy as np
+
+from models.features import transform_features
+from models.dense_autoencoder import DenseAutoencoder, reconstruction_errors
+from utils.cache import LRUCache
+
+# Directory holding saved detectors, shared by the Flask app and the
+# Streamlit pages; anchored to the project root rather than the working directory
+MODEL_REGISTRY_DIR = os.environ.get(
+    'MODEL_REGISTRY_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trained_models')
+)
+
+# Files of a saved detector
+DETECTOR_FILE = 'detector.joblib'
+KERAS_MODEL_FILE = 'model.keras'
+DENSE_WEIGHTS_DIR = 'weights'
+METADATA_FILE = 'detector.json'
+
+
+class FittedDetector:
+    """
+    A trained anomaly detector with everything needed to score new data.
+
+    ``model`` is the fitted estimator, ``columns``, ``scaler`` and
+    ``fill_values`` the feature spec it was trained on, and ``threshold``
+    the anomaly score above which a point is an anomaly.
+    """
+
+    def __init__(self, algorithm, model, columns, scaler, fill_values, threshold, params=None):
+        self.algorithm = algorithm
+        self.model = model
+        self.columns = list(columns)
+        self.scaler = scaler
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.threshold = float(threshold)
+        self.params = dict(params or {})
+        # Size of the saved detector, used to weigh it in the model cache
+        self.nbytes = 0
+
+    @classmethod
+    def from_matrix(cls, algorithm, model, matrix, threshold, params=None):
+        """
+        Wrap a model trained on a feature matrix.
+
+        Args:
+            algorithm (str): Algorithm name, e.g. 'isolation_forest'
+            model: The fitted model
+            matrix (FeatureMatrix): Feature matrix the model was trained on
+            threshold (float): Anomaly score threshold
+            params (dict, optional): Parameters the model was trained with
+
+        Returns:
+            FittedDetector: The detector
+        """
+        return cls(algorithm, model, matrix.columns, matrix.scaler, matrix.fill_values, threshold, params)
+
+    def anomaly_scores(self, X):
+        """
+        Score scaled features with the fitted model.
+
+        Args:
+            X (numpy.ndarray): Scaled features in the detector's column order
+
+        Returns:
+            numpy.ndarray: Anomaly scores (higher is more anomalous)
+        """
+        # Detector modules are imported on demand, so scoring never loads
+        # TensorFlow unless the model itself is a Keras model
+        if self.algorithm == 'isolation_forest':
+            from models.isolation_forest import isolation_scores
+            return isolation_scores(self.model, X)
+        if self.algorithm == 'kmeans':
+            from models.kmeans import centroid_distances
+            return centroid_distances(X, self.model.cluster_centers_, self.model.predict(X))
+        if self.algorithm == 'autoencoder':
+            return reconstruction_errors(self.model, X)
+        raise ValueError(f"Unknown algorithm: {self.algorithm}")
+
+    def score(self, df):
+        """
+        Score new data without retraining.
+
+        Args:
+            df (pandas.DataFrame): The data to score; it needs the feature
+                columns the detector was trained on
+
+        Returns:
+            tuple: (anomaly_indices, anomaly_scores)
+        """
+        X = transform_features(df, self.columns, self.scaler, self.fill_values)
+        scores = self.anomaly_scores(X)
+        return np.where(scores > self.threshold)[0], scores
+
+    def metadata(self):
+        """Summary of the detector that can be stored as JSON."""
+        return {
+            'algorithm': self.algorithm,
+            'columns': self.columns,
+            'threshold': self.threshold,
+            'params': self.params
+        }
+
+
+def _is_keras_model(model):
+    """Whether a model is a Keras model rather than a scikit-learn estimator."""
+    return not hasattr(model, 'get_params') and hasattr(model, 'save')
+
+
+def analysis_detector_path(root, analysis_id):
+    """
+    Directory of the detector saved for an analysis result.
+
+    Args:
+        root (str): Directory holding saved detectors
+        analysis_id (int): Id of the analysis result
+
+    Returns:
+        str: Path of the detector directory
+    """
+    return os.path.join(root, f"analysis_{analysis_id}")
+
+
+def save_detector(detector, path, name=None):
+    """
+    Save a fitted detector to a directory.
+
+    Args:
+        detector (FittedDetector): The detector to save
+        path (str): Directory to write; it is created if needed
+        name (str, optional): Display name stored with the metadata
+
+    Returns:
+        str: The directory path
+    """
+    os.makedirs(path, exist_ok=True)
+
+    model = detector.model
+    if isinstance(model, DenseAutoencoder):
+        model.save(os.path.join(path, DENSE_WEIGHTS_DIR))
+        model = None
+    elif _is_keras_model(model):
+        model.save(os.path.join(path, KERAS_MODEL_FILE))
+        model = None
+        # Export the weights for TensorFlow-free scoring
+        try:
+            DenseAutoencoder.from_keras(detector.model).save(os.path.join(path, DENSE_WEIGHTS_DIR))
+        except ValueError as e:
+            logging.warning(f"Could not export NumPy weights to {path}: {str(e)}")
+
+    # Stored uncompressed, so its arrays can be memory-mapped when loaded
+    joblib.dump({
+        'algorithm': detector.algorithm,
+        'model': model,
+        'columns': detector.columns,
+        'scaler': detector.scaler,
+        'fill_values': detector.fill_values,
+        'threshold': detector.threshold,
+        'params': detector.params
+    }, os.path.join(path, DETECTOR_FILE))
+
+    metadata = detector.metadata()
+    metadata.update({'name': name, 'saved_at': datetime.utcnow().isoformat()})
+    with open(os.path.join(path, METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, default=str)
+
+    return path
+
+
+def _directory_size(path):
+    """Total size of the files in a directory and its subdirectories."""
+    return sum(entry.stat().st_size if entry.is_file() else _directory_size(entry.path)
+               for entry in os.scandir(path))
+
+
+def load_detector(path, mmap_mode=None):
+    """
+    Load a detector saved with save_detector.
+
+    Autoencoders are loaded from their exported NumPy weights when present;
+    only detectors saved before weights were exported need TensorFlow.
+
+    Args:
+        path (str): Directory of the saved detector
+        mmap_mode (str, optional): 'r' to memory-map the saved NumPy arrays
+            read-only instead of reading them into memory; see the module
+            docstring for which arrays this covers
+
+    Returns:
+        FittedDetector: The detector
+    """
+    state = joblib.load(os.path.join(path, DETECTOR_FILE), mmap_mode=mmap_mode)
+    if state['model'] is None:
+        weights_path = os.path.join(path, DENSE_WEIGHTS_DIR)
+        if os.path.isdir(weights_path):
+            state['model'] = DenseAutoencoder.load(weights_path, mmap_mode=mmap_mode)
+        else:
+            from tensorflow.keras.models import load_model
+            state['model'] = load_model(os.path.join(path, KERAS_MODEL_FILE), compile=False)
+    detector = FittedDetector(**state)
+    detector.nbytes = _directory_size(path)
+    return detector
+
+
+# Process-wide cache of loaded detectors, keyed on (detector directory, save time)
+model_cache = LRUCache(
+    max_bytes=int(os.environ.get('MODEL_CACHE_MAX_MB', 512)) * 1024 * 1024,
+    sizeof=lambda detector: detector.nbytes
+)
+
+
+def get_detector(path):
+    """
+    Get a saved detector through the process-wide model cache.
+
+    The detector is loaded with its arrays memory-mapped on first use and
+    stays resident until it is evicted. Saving a detector again to the same
+    directory changes its key, so the new one is loaded.
+
+    Args:
+        path (str): Directory of the saved detector
+
+    Returns:
+        FittedDetector: The detector, shared with other callers
+    """
+    path = os.path.abspath(path)
+    key = (path, os.stat(os.path.join(path, DETECTOR_FILE)).st_mtime_ns)
+
+    detector = model_cache.get(key)
+    if detector is None:
+        # Older saves of the same detector will not be asked for again
+        model_cache.invalidate(lambda cached_key: cached_key[0] == path)
+        detector = load_detector(path, mmap_mode='r')
+        model_cache.put(key, detector)
+
+    return detector
+
+
+def warm_model_cache(paths):
+    """
+    Preload saved detectors into the model cache.
+
+    Detectors that are missing or fail to load are logged and skipped, so a
+    stale entry in the list does not stop the process from starting.
+
+    Args:
+        paths (list): Directories of the detectors to preload
+
+    Returns:
+        int: Number of detectors loaded
+    """
+    loaded = 0
+    for path in paths:
+        if not has_detector(path):
+            logging.warning(f"Model to preload not found: {path}")
+            continue
+        try:
+            get_detector(path)
+            loaded += 1
+        except Exception as e:
+            logging.error(f"Could not preload model {path}: {str(e)}")
+    return loaded
+
+
+def has_detector(path):
+    """Whether a directory holds a saved detector."""
+    return os.path.exists(os.path.join(path, DETECTOR_FILE))
+
+
+def list_detectors(root):
+    """
+    List the detectors saved under a directory, newest first.
+
+    Args:
+        root (str): Directory holding saved detectors
+
+    Returns:
+        list: Metadata dicts of the detectors, each with its 'path'
+    """
+    detectors = []
+    if not os.path.isdir(root):
+        return detectors
+
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if not has_detector(path) or not os.path.exists(metadata_path):
+            continue
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        metadata['path'] = path
+        detectors.append(metadata)
+
+    return sorted(detectors, key=lambda metadata: metadata.get('saved_at') or '', reverse=True)
+
+
+def delete_detector(path):
+    """Remove a saved detector, if there is one, and drop it from the model cache."""
+    path = os.path.abspath(path)
+    model_cache.invalidate(lambda cached_key: cached_key[0] == path)
+    shutil.rmtree(path, ignore_errors=True)
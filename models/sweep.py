@@ -0,0 +1,292 @@
+"""
+Hyperparameter sweeps for the Energy Anomaly Detection System.
+
+A sweep evaluates every configuration of a grid of detector parameters on
+one feature matrix, built once and cached like any detection run. Only the
+parameters that change the fitted model need a fit of their own; these fits
+run in parallel in worker threads that share the matrix. Parameters that
+only move the anomaly threshold (the contamination factor or threshold
+percentile) are applied to each fit's stored scores afterwards, so a grid
+of ten thresholds costs one fit rather than ten.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+
+from models import DETECTORS
+from models.features import get_feature_matrix
+from models.ensemble import fit_parallel
+
+# Parameters that can be swept for each detector, with their types
+SWEEP_PARAMS = {
+    'isolation_forest': {'n_estimators': int, 'max_samples': int, 'contamination': float},
+    'autoencoder': {'components': int, 'epochs': int, 'threshold_percentile': float},
+    'kmeans': {'n_clusters': int, 'threshold_percentile': float}
+}
+
+# Allowed (min, max) of each swept parameter, the same limits as single detection runs
+SWEEP_LIMITS = {
+    'isolation_forest': {'n_estimators': (50, 500), 'max_samples': (16, 1000000), 'contamination': (0.01, 0.2)},
+    'autoencoder': {'components': (1, 10), 'epochs': (10, 100), 'threshold_percentile': (90, 99)},
+    'kmeans': {'n_clusters': (2, 20), 'threshold_percentile': (90, 99)}
+}
+
+# Parameter of each detector that only sets its anomaly threshold
+THRESHOLD_PARAMS = {
+    'isolation_forest': 'contamination',
+    'autoencoder': 'threshold_percentile',
+    'kmeans': 'threshold_percentile'
+}
+
+# Largest number of models a sweep may fit
+MAX_FITS = 50
+
+# Label of a point that has not been validated
+UNLABELLED = -1
+
+
+def parse_values(text, cast=float, limits=None):
+    """
+    Parse a comma-separated list of parameter values.
+
+    Args:
+        text (str): Values, e.g. "0.01, 0.05, 0.1"
+        cast (type): Type of the values
+        limits (tuple, optional): (min, max) every value must lie within
+
+    Returns:
+        list: The distinct values, in the order given
+    """
+    values = []
+    for item in (text or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            value = cast(float(item)) if cast is int else cast(item)
+        except (ValueError, OverflowError):
+            raise ValueError(f"Not a valid {cast.__name__}: {item}")
+        if limits is not None and not limits[0] <= value <= limits[1]:
+            raise ValueError(f"{item} is not between {limits[0]} and {limits[1]}")
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def check_grid(algorithm, grid):
+    """
+    Check that every value of a parameter grid is within SWEEP_LIMITS.
+
+    Args:
+        algorithm (str): Detector name
+        grid (dict): Candidate values of each parameter, by name
+
+    Raises:
+        ValueError: If a parameter cannot be swept or a value is out of range
+    """
+    unknown = [name for name in grid if name not in SWEEP_PARAMS[algorithm]]
+    if unknown:
+        raise ValueError(f"Parameters that cannot be swept for {algorithm}: {', '.join(unknown)}")
+    for name, values in grid.items():
+        low, high = SWEEP_LIMITS[algorithm][name]
+        out_of_range = [value for value in values if not low <= value <= high]
+        if out_of_range:
+            raise ValueError(f"{name} must be between {low} and {high}, not {out_of_range[0]}")
+
+
+def expand_grid(grid):
+    """
+    Every combination of the values in a parameter grid.
+
+    Args:
+        grid (dict): Candidate values of each parameter, by name
+
+    Returns:
+        list: Parameter dicts, one per combination
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def threshold_anomalies(algorithm, scores, value):
+    """
+    Anomalies of a fitted detector at another threshold setting.
+
+    Args:
+        algorithm (str): Detector name
+        scores (numpy.ndarray): Anomaly scores of the fit
+        value (float): Value of the detector's threshold parameter
+
+    Returns:
+        numpy.ndarray: Indices of the anomalies
+    """
+    if THRESHOLD_PARAMS[algorithm] == 'contamination':
+        # The expected share of anomalies is the share of points flagged
+        percentile = 100 * (1 - value)
+    else:
+        percentile = value
+    return np.where(scores > np.percentile(scores, percentile))[0]
+
+
+def label_vector(n_rows, is_anomaly=None, validated=None):
+    """
+    Build the labels a sweep is evaluated against.
+
+    Args:
+        n_rows (int): Number of points
+        is_anomaly (array-like, optional): 0/1 label of every point; missing
+            values leave a point unlabelled and other nonzero values count
+            as anomalies
+        validated (dict, optional): Whether each validated point is a true
+            anomaly, by row index; these override ``is_anomaly``
+
+    Returns:
+        numpy.ndarray: 1 for anomalies, 0 for normal points and UNLABELLED
+            for unknown points, or None if no point is labelled
+    """
+    labels = np.full(n_rows, UNLABELLED, dtype=np.int8)
+    if is_anomaly is not None:
+        values = pd.to_numeric(pd.Series(np.asarray(is_anomaly, dtype=object)), errors='coerce')
+        values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        known = ~np.isnan(values)
+        labels[known] = values[known] != 0
+    for index, is_true in (validated or {}).items():
+        if 0 <= index < n_rows:
+            labels[index] = 1 if is_true else 0
+    if not np.any(labels != UNLABELLED):
+        return None
+    return labels
+
+
+def score_separation(scores, anomaly_mask):
+    """
+    How far the anomalies' scores stand out from the rest.
+
+    Args:
+        scores (numpy.ndarray): Anomaly scores
+        anomaly_mask (numpy.ndarray): Whether each point is an anomaly
+
+    Returns:
+        float: Difference between the mean score of the anomalies and of the
+            normal points, in standard deviations of all scores, or None if
+            either group is empty
+    """
+    if anomaly_mask.all() or not anomaly_mask.any():
+        return None
+    spread = np.std(scores)
+    if spread == 0:
+        return 0.0
+    return float((scores[anomaly_mask].mean() - scores[~anomaly_mask].mean()) / spread)
+
+
+def evaluate_configuration(scores, anomaly_indices, labels=None):
+    """
+    Metrics of one configuration.
+
+    Precision and recall are computed over the labelled points only: with
+    validated anomalies, precision is the share of validated points flagged
+    that are true anomalies and recall the share of true anomalies flagged.
+
+    Args:
+        scores (numpy.ndarray): Anomaly scores
+        anomaly_indices (numpy.ndarray): Points flagged as anomalies
+        labels (numpy.ndarray, optional): Labels from label_vector
+
+    Returns:
+        dict: anomaly_count, anomaly_rate and score_separation, plus
+            precision, recall, f1 and labelled_points if there are labels
+    """
+    anomaly_mask = np.zeros(len(scores), dtype=bool)
+    anomaly_mask[anomaly_indices] = True
+    anomaly_count = int(anomaly_mask.sum())
+
+    metrics = {
+        'anomaly_count': anomaly_count,
+        'anomaly_rate': anomaly_count / len(scores) if len(scores) > 0 else 0.0,
+        'score_separation': score_separation(scores, anomaly_mask)
+    }
+
+    if labels is not None:
+        positives = labels == 1
+        negatives = labels == 0
+        true_positives = int((anomaly_mask & positives).sum())
+        flagged_labelled = true_positives + int((anomaly_mask & negatives).sum())
+
+        precision = true_positives / flagged_labelled if flagged_labelled else None
+        recall = true_positives / int(positives.sum()) if positives.any() else None
+        if precision is None or recall is None:
+            f1 = None
+        else:
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+        metrics.update({
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'labelled_points': int((positives | negatives).sum())
+        })
+
+    return metrics
+
+
+def _ranking_key(result):
+    """Sort key putting the best configuration first: by F1 if known, else by separation."""
+    for metric in ('f1', 'score_separation'):
+        value = result.get(metric)
+        if value is not None:
+            return (metric == 'f1', value)
+    return (False, float('-inf'))
+
+
+def run_sweep(df, algorithm, grid, base_params=None, version=None, columns=None, labels=None, n_jobs=None):
+    """
+    Evaluate every configuration of a parameter grid for one detector.
+
+    The feature matrix is built once and shared by all fits. The grid is
+    split into the parameters that need a fit of their own, whose
+    combinations are fitted in parallel, and the detector's threshold
+    parameter, which is applied to each fit's scores without retraining.
+
+    Args:
+        df (pandas.DataFrame): The dataset to analyze
+        algorithm (str): Detector name, one of DETECTORS
+        grid (dict): Candidate values of each parameter, by name; see SWEEP_PARAMS
+        base_params (dict, optional): Parameters shared by all configurations
+        version (tuple, optional): Version of the stored dataset df was loaded
+            from, used to cache its feature matrix
+        columns (list, optional): Feature columns (the default feature set if None)
+        labels (numpy.ndarray, optional): Labels from label_vector, to report
+            precision and recall
+        n_jobs (int, optional): Worker threads (one per fit, up to the CPU count, by default)
+
+    Returns:
+        list: One dict per configuration with its 'params' and the metrics
+            of evaluate_configuration, best configuration first
+    """
+    if algorithm not in DETECTORS:
+        raise ValueError(f"Not a single detector: {algorithm}")
+    check_grid(algorithm, grid)
+
+    grid = {name: list(values) for name, values in grid.items() if values}
+    threshold_param = THRESHOLD_PARAMS[algorithm]
+    threshold_values = grid.pop(threshold_param, None)
+
+    fits = [dict(base_params or {}, **combination) for combination in expand_grid(grid)]
+    if len(fits) > MAX_FITS:
+        raise ValueError(f"The grid needs {len(fits)} model fits; at most {MAX_FITS} are allowed")
+
+    # Scaled features, built once and shared by every fit
+    matrix = get_feature_matrix(df, columns=columns, version=version)
+    fitted = fit_parallel(matrix.values, [(algorithm, params) for params in fits], n_jobs)
+
+    results = []
+    for params, (anomaly_indices, scores) in zip(fits, fitted):
+        if not threshold_values:
+            results.append(dict(evaluate_configuration(scores, anomaly_indices, labels), params=params))
+            continue
+        for value in threshold_values:
+            anomalies = threshold_anomalies(algorithm, scores, value)
+            results.append(dict(evaluate_configuration(scores, anomalies, labels),
+                                params=dict(params, **{threshold_param: value})))
+
+    return sorted(results, key=_ranking_key, reverse=True)
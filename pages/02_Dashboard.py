@@ -19,6 +19,8 @@ if __name__ == "__main__" or os.path.basename(sys.argv[0]) == "pages":
 # Now we can import from the project packages
 from utils.auth import is_authenticated
 from utils.visualization import plot_consumption_overview, plot_anomaly_distribution
+from utils.dataset_store import load_dataset
+from utils.dataset_rollups import chart_series
 from styles.custom import apply_custom_styles
 
 # Page configuration
@@ -80,6 +82,7 @@ def generate_sample_data():
         energy_data.loc[anomaly_indices, 'is_anomaly'] = 1
         
         # Store the data in session state
+        st.session_state.raw_data = energy_data
         st.session_state.current_data = energy_data
     
     return st.session_state.current_data
@@ -108,11 +111,11 @@ def main():
             
             # Filter data based on selection
             if selected_time == "Last 24 hours":
-                filtered_data = data[data['timestamp'] >= (data['timestamp'].max() - pd.Timedelta(days=1))]
+                filtered_data = load_dataset(data, time_range=(data['timestamp'].max() - pd.Timedelta(days=1), None))
             elif selected_time == "Last 7 days":
-                filtered_data = data[data['timestamp'] >= (data['timestamp'].max() - pd.Timedelta(days=7))]
+                filtered_data = load_dataset(data, time_range=(data['timestamp'].max() - pd.Timedelta(days=7), None))
             elif selected_time == "Last 30 days":
-                filtered_data = data[data['timestamp'] >= (data['timestamp'].max() - pd.Timedelta(days=30))]
+                filtered_data = load_dataset(data, time_range=(data['timestamp'].max() - pd.Timedelta(days=30), None))
             else:
                 filtered_data = data
         
@@ -127,6 +130,7 @@ def main():
         with col3:
             # Refresh button
             if st.button("Refresh Dashboard"):
+                st.session_state.raw_data = None
                 st.session_state.current_data = None
                 st.rerun()
     
@@ -154,9 +158,10 @@ def main():
     # Main charts
     st.markdown("### Energy Consumption Patterns")
     
-    # Time series chart
+    # Time series chart, rolled up to the coarsest resolution that still fills the chart
+    series, resolution = chart_series(filtered_data, 'consumption')
     fig_timeseries = px.line(
-        filtered_data, 
+        series, 
         x='timestamp', 
         y='consumption',
         title="Energy Consumption Over Time",
@@ -248,7 +253,7 @@ def main():
     st.markdown("### Correlation Analysis")
     
     # Prepare correlation data
-    corr_data = filtered_data[['consumption', 'temperature', 'humidity', 'occupancy']].corr()
+    corr_data = load_dataset(filtered_data, columns=['consumption', 'temperature', 'humidity', 'occupancy']).corr()
     
     # Create heatmap
     fig_corr = px.imshow(
@@ -10,7 +10,8 @@ from utils.auth import is_authenticated
 from utils.data_processing import (
     validate_dataset, preprocess_data, 
     detect_csv_format, read_energy_csv, 
-    list_energy_csv_files, save_processed_data
+    infer_timestamp_format, parse_timestamps,
+    list_energy_csv_files, save_processed_data, open_energy_csv
 )
 from styles.custom import apply_custom_styles
 
@@ -43,7 +44,7 @@ def main():
     st.markdown("""
     ## Upload Your Energy Consumption Data
     
-    Upload a CSV file containing your energy consumption data. The system expects the following columns:
+    Upload a CSV file (optionally compressed as .gz, .bz2, .xz or .zip) containing your energy consumption data. The system expects the following columns:
     
     - **timestamp**: Date and time of the measurement (required)
     - **consumption**: Energy consumption value (required)
@@ -55,27 +56,34 @@ def main():
     """)
     
     # File uploader
-    uploaded_file = st.file_uploader("Upload CSV file", type=["csv"])
+    uploaded_file = st.file_uploader("Upload CSV file", type=["csv", "gz", "bz2", "xz", "zip"])
     
     if uploaded_file is not None:
         try:
-            # Load the data
-            data = pd.read_csv(uploaded_file)
+            # Load the data, decompressing it if needed
+            with open_energy_csv(uploaded_file) as stream:
+                data = pd.read_csv(stream)
             
             # Display raw data sample
             st.markdown("### Raw Data Preview")
             st.dataframe(data.head(10), use_container_width=True)
             
-            # Validate the dataset
-            validation_result, validation_message = validate_dataset(data)
+            # Validate the dataset, inferring the timestamp encoding once
+            format_info = infer_timestamp_format(data['timestamp']) if 'timestamp' in data.columns else None
+            validation_result, validation_message = validate_dataset(data, format_info)
             
             if validation_result:
                 st.success(validation_message)
                 
+                # Parse the timestamps so later files can be merged with these rows
+                data['timestamp'] = parse_timestamps(data['timestamp'], format_info)
+                
                 # Process data
                 with st.spinner("Processing data..."):
-                    processed_data = preprocess_data(data)
+                    processed_data = preprocess_data(data, format_info=format_info)
                 
+                # Keep the validated rows so later files can be appended to them
+                st.session_state.raw_data = data
                 st.session_state.current_data = processed_data
                 
                 # Display processed data sample
@@ -204,6 +212,15 @@ def main():
                     selected_file = st.selectbox("Select an energy data file to load:", 
                                                 options=energy_files)
                     
+                    # Optionally merge the file into the data already loaded
+                    append_mode = False
+                    if st.session_state.get('raw_data') is not None:
+                        append_mode = st.checkbox(
+                            "Append to the currently loaded data",
+                            value=False,
+                            help="Readings with a timestamp that is already loaded replace the loaded values"
+                        )
+                    
                     if st.button("Load Selected File"):
                         selected_path = os.path.join(data_dir, selected_file)
                         with st.spinner("Loading and processing file..."):
@@ -211,7 +228,11 @@ def main():
                             format_info = detect_csv_format(selected_path)
                             
                             # Read the file with the detected format
-                            data, info = read_energy_csv(selected_path, format_info)
+                            data, info = read_energy_csv(
+                                selected_path,
+                                format_info,
+                                append_to=st.session_state.raw_data if append_mode else None
+                            )
                             
                             if 'error' in info:
                                 st.error(f"Error loading file: {info['error']}")
@@ -226,6 +247,10 @@ def main():
                                     - Timestamp column: {info['timestamp_column']}
                                     - Consumption column: {info['consumption_column']}
                                     """
+                                    if info.get('timestamp_format'):
+                                        format_msg += f"- Timestamp format: {info['timestamp_format']}\n"
+                                    elif info.get('timestamp_unit'):
+                                        format_msg += f"- Timestamp format: epoch ({info['timestamp_unit']})\n"
                                     if info['temperature_column']:
                                         format_msg += f"- Temperature column: {info['temperature_column']}\n"
                                     if info['humidity_column']:
@@ -242,7 +267,8 @@ def main():
                                 # Process the data
                                 processed_data = preprocess_data(data)
                                 
-                                # Store in session state
+                                # Store in session state, keeping the standardized rows to append to
+                                st.session_state.raw_data = data
                                 st.session_state.current_data = processed_data
                                 
                                 # Display processed data sample
@@ -339,6 +365,7 @@ def main():
             sample_data.loc[anomaly_indices, 'is_anomaly'] = 1
             
             # Store in session state
+            st.session_state.raw_data = sample_data
             st.session_state.current_data = sample_data
         
         st.success(f"Generated sample data with {len(sample_data)} records and {num_anomalies} anomalies.")
@@ -1,15 +1,16 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
 import time
-import plotly.express as px
-import plotly.graph_objects as go
+from datetime import datetime
 from streamlit_extras.colored_header import colored_header
 
 from utils.auth import is_authenticated
-from models.isolation_forest import run_isolation_forest
-from models.autoencoder import run_autoencoder
-from models.kmeans import run_kmeans
+from utils.data_processing import numeric_feature_columns
+from models import load_algorithm
+from models.registry import MODEL_REGISTRY_DIR, save_detector, get_detector, list_detectors
+from models.sweep import SWEEP_PARAMS, SWEEP_LIMITS, parse_values, label_vector, run_sweep
 from styles.custom import apply_custom_styles
 
 # Page configuration
@@ -28,23 +29,42 @@ if not is_authenticated():
     st.warning("Please login to access this page")
     st.stop()
 
-def main():
-    st.title("⚡ Run Anomaly Detection")
-    
-    colored_header(
-        label="Anomaly Detection",
-        description="Detect energy consumption anomalies using machine learning algorithms",
-        color_name="blue-70"
-    )
-    
-    # Check if data is available
-    if st.session_state.current_data is None:
-        st.warning("No data available. Please upload or generate data first.")
-        st.stop()
-    
-    # Get the data
-    data = st.session_state.current_data
-    
+# Algorithms offered on this page and their registry names
+ALGORITHMS = {
+    "Isolation Forest": 'isolation_forest',
+    "AutoEncoder": 'autoencoder',
+    "K-Means": 'kmeans',
+    "Ensemble": 'ensemble'
+}
+
+# Candidate values first offered for each parameter in a sweep
+DEFAULT_SWEEP_GRIDS = {
+    'isolation_forest': {'n_estimators': "100, 200", 'max_samples': "", 'contamination': "0.01, 0.02, 0.05, 0.1"},
+    'autoencoder': {'components': "2, 4", 'epochs': "50", 'threshold_percentile': "90, 95, 99"},
+    'kmeans': {'n_clusters': "3, 5, 8", 'threshold_percentile': "90, 95, 99"}
+}
+
+def detection_frame(data, anomalies, scores):
+    """Copy of the data with the detected anomalies flagged and every row's score."""
+    result_data = data.copy()
+    flags = np.zeros(len(result_data), dtype=np.int8)
+    flags[anomalies] = 1
+    result_data['is_anomaly'] = flags
+    result_data['anomaly_score'] = scores
+    return result_data
+
+def model_metrics(detector, scores):
+    """Metrics of a detection run to show below the results."""
+    metrics = {
+        "Mean Anomaly Score": float(np.mean(scores)) if len(scores) > 0 else 0.0,
+        "Anomaly Score Std": float(np.std(scores)) if len(scores) > 0 else 0.0
+    }
+    if detector is not None:
+        metrics["Anomaly Threshold"] = detector.threshold
+    return metrics
+
+def train_new_model(data):
+    """Train the selected algorithm on the data, optionally saving the fitted model."""
     # Algorithm selection
     st.markdown("### Select Anomaly Detection Algorithm")
     
@@ -53,7 +73,7 @@ def main():
     with col1:
         algorithm = st.radio(
             "Algorithm",
-            ["Isolation Forest", "AutoEncoder", "K-Means"],
+            ["Isolation Forest", "AutoEncoder", "K-Means", "Ensemble"],
             index=0
         )
         
@@ -109,7 +129,7 @@ def main():
             )
             
             epochs = st.slider(
-                "Training epochs",
+                "Maximum training epochs (training stops early once it converges)",
                 min_value=10,
                 max_value=100,
                 value=50,
@@ -117,7 +137,7 @@ def main():
             )
             
             params = {
-                "threshold_percent": threshold_percent,
+                "threshold_percentile": threshold_percent,
                 "epochs": epochs
             }
             
@@ -148,15 +168,59 @@ def main():
             
             params = {
                 "n_clusters": n_clusters,
-                "threshold_percent": threshold_percent
+                "threshold_percentile": threshold_percent
+            }
+            
+        elif algorithm == "Ensemble":
+            st.markdown("""
+            **Ensemble** runs several detectors in parallel on the same features and fuses their
+            normalized anomaly scores, flagging the points the detectors agree on.
+            
+            Best for: Higher precision than any single detector, at about the run time of the slowest one.
+            """)
+            
+            # Algorithm parameters
+            members = st.multiselect(
+                "Detectors",
+                ["Isolation Forest", "AutoEncoder", "K-Means"],
+                default=["Isolation Forest", "K-Means"]
+            )
+            
+            normalization = st.selectbox(
+                "Score normalization",
+                ["rank", "robust_z"],
+                format_func=lambda name: {"rank": "Rank", "robust_z": "Robust z-score"}[name]
+            )
+            
+            fusion = st.selectbox(
+                "Score fusion",
+                ["mean", "max", "vote"],
+                format_func=lambda name: {"mean": "Mean", "max": "Maximum", "vote": "Majority vote"}[name]
+            )
+            
+            threshold_percent = st.slider(
+                "Anomaly threshold percentile (mean and maximum fusion)",
+                min_value=90,
+                max_value=99,
+                value=95,
+                step=1
+            )
+            
+            if len(members) < 2:
+                st.error("Please select at least two detectors for the ensemble.")
+                st.stop()
+            
+            params = {
+                "algorithms": [ALGORITHMS[name] for name in members],
+                "normalization": normalization,
+                "fusion": fusion,
+                "threshold_percentile": threshold_percent
             }
     
     # Feature selection
     st.markdown("### Select Features for Anomaly Detection")
     
-    all_features = list(data.columns)
-    non_selectable = ['timestamp', 'is_anomaly']
-    selectable_features = [f for f in all_features if f not in non_selectable]
+    selectable_features = numeric_feature_columns(data)
     
     selected_features = st.multiselect(
         "Features to use for detection",
@@ -168,143 +232,306 @@ def main():
         st.error("Please select at least one feature for anomaly detection.")
         st.stop()
     
+    # Ensembles have no single model to save
+    save_model = algorithm != "Ensemble" and st.checkbox("Save the trained model to score new data later", value=True)
+    
     # Run detection button
-    if st.button("Run Anomaly Detection", type="primary"):
-        with st.spinner(f"Running {algorithm} algorithm..."):
-            # Track start time
-            start_time = time.time()
-            
-            # Run the selected algorithm
-            if algorithm == "Isolation Forest":
-                result_data, model_info = run_isolation_forest(data, selected_features, params)
-            elif algorithm == "AutoEncoder":
-                result_data, model_info = run_autoencoder(data, selected_features, params)
-            elif algorithm == "K-Means":
-                result_data, model_info = run_kmeans(data, selected_features, params)
-            
-            # Calculate execution time
-            execution_time = time.time() - start_time
-            
-            # Store results in session state
-            st.session_state.detection_results = result_data
-            st.session_state.model_metrics = model_info
-        
-        # Display results summary
-        st.success(f"Anomaly detection completed in {execution_time:.2f} seconds.")
-        
-        # Count anomalies
-        anomaly_count = result_data['is_anomaly'].sum()
-        total_count = len(result_data)
-        anomaly_percent = (anomaly_count / total_count) * 100
-        
-        # Results metrics
-        st.markdown("### Detection Results")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric("Total Records", total_count)
-        
-        with col2:
-            st.metric("Anomalies Detected", anomaly_count)
-        
-        with col3:
-            st.metric("Anomaly Percentage", f"{anomaly_percent:.2f}%")
+    if not st.button("Run Anomaly Detection", type="primary"):
+        return None
+    
+    registry_name = ALGORITHMS[algorithm]
+    
+    with st.spinner(f"Running {algorithm} algorithm..."):
+        # Track start time
+        start_time = time.time()
         
-        # Display model-specific metrics
-        st.markdown("### Model Metrics")
+        # Run the selected algorithm; its libraries are imported on first use
+        run_detector = load_algorithm(registry_name)
+        anomalies, scores, detector = run_detector(data, params=params, columns=selected_features, return_model=True)
         
-        for metric_name, metric_value in model_info.items():
-            if isinstance(metric_value, (int, float)):
-                st.metric(metric_name, f"{metric_value:.4f}" if isinstance(metric_value, float) else metric_value)
+        # Calculate execution time
+        execution_time = time.time() - start_time
+    
+    if save_model:
+        path = os.path.join(MODEL_REGISTRY_DIR, f"{registry_name}_{datetime.now():%Y%m%d_%H%M%S}")
+        save_detector(detector, path, name=f"{algorithm} ({', '.join(selected_features)})")
+        st.caption(f"Trained model saved to {path}")
+    
+    return detection_frame(data, anomalies, scores), model_metrics(detector, scores), algorithm, execution_time
+
+def score_with_saved_model(data):
+    """Score the data with a previously saved model, without retraining."""
+    st.markdown("### Select a Saved Model")
+    
+    saved_models = list_detectors(MODEL_REGISTRY_DIR)
+    if not saved_models:
+        st.info("No saved models yet. Train a new model with 'Save the trained model' checked to score new data with it.")
+        return None
+    
+    selected = st.selectbox(
+        "Saved model",
+        saved_models,
+        format_func=lambda m: f"{m.get('name') or os.path.basename(m['path'])} - saved {(m.get('saved_at') or '')[:16]}"
+    )
+    
+    st.markdown(f"**Features:** {', '.join(selected['columns'])}")
+    
+    if not st.button("Score Data", type="primary"):
+        return None
+    
+    with st.spinner("Scoring with the saved model..."):
+        start_time = time.time()
         
-        # Visualization of results
-        st.markdown("### Anomaly Visualization")
+        try:
+            detector = get_detector(selected['path'])
+            anomalies, scores = detector.score(data)
+        except ValueError as e:
+            st.error(str(e))
+            return None
         
-        # Time series plot with anomalies
-        fig = px.line(
-            result_data, 
-            x='timestamp', 
-            y='consumption',
-            title=f"Energy Consumption with Detected Anomalies ({algorithm})",
-            labels={"consumption": "Energy (kWh)", "timestamp": "Time"}
+        execution_time = time.time() - start_time
+    
+    algorithm = next((name for name, registry_name in ALGORITHMS.items() if registry_name == detector.algorithm),
+                     detector.algorithm)
+    
+    return detection_frame(data, anomalies, scores), model_metrics(detector, scores), algorithm, execution_time
+
+def sweep_parameters(data):
+    """Evaluate a grid of parameters of one detector and show the configurations side by side."""
+    st.markdown("### Sweep Detector Parameters")
+    st.markdown("""
+    Enter comma-separated values for each parameter; every combination is evaluated on the same features.
+    Threshold settings are applied to the scores of each trained model, so only the other parameters
+    need a model of their own. Models are trained in parallel.
+    """)
+    
+    algorithm = st.selectbox("Algorithm", [name for name in ALGORITHMS if name != "Ensemble"])
+    registry_name = ALGORITHMS[algorithm]
+    
+    grid = {}
+    columns = st.columns(len(SWEEP_PARAMS[registry_name]))
+    for col, (param, cast) in zip(columns, SWEEP_PARAMS[registry_name].items()):
+        with col:
+            text = st.text_input(param.replace('_', ' ').capitalize(), DEFAULT_SWEEP_GRIDS[registry_name][param],
+                                 key=f"sweep_{registry_name}_{param}")
+        try:
+            grid[param] = parse_values(text, cast, SWEEP_LIMITS[registry_name][param])
+        except ValueError as e:
+            st.error(f"{param}: {str(e)}")
+            return
+    
+    selected_features = st.multiselect(
+        "Features to use for detection",
+        numeric_feature_columns(data),
+        default=['consumption'],
+        key="sweep_features"
+    )
+    
+    if not selected_features:
+        st.error("Please select at least one feature for anomaly detection.")
+        return
+    
+    if not st.button("Run Sweep", type="primary"):
+        return
+    
+    # Labelled data adds precision and recall to the comparison
+    is_anomaly = data['is_anomaly'] if 'is_anomaly' in data.columns and data['is_anomaly'].any() else None
+    labels = label_vector(len(data), is_anomaly=is_anomaly)
+    
+    with st.spinner(f"Sweeping {algorithm} parameters..."):
+        start_time = time.time()
+        try:
+            results = run_sweep(data, registry_name, grid, columns=selected_features, labels=labels)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        execution_time = time.time() - start_time
+    
+    st.success(f"Evaluated {len(results)} configurations in {execution_time:.2f} seconds")
+    
+    table = pd.DataFrame([dict(result.pop('params'), **result) for result in results])
+    table['anomaly_rate'] = table['anomaly_rate'] * 100
+    st.dataframe(table.rename(columns={
+        'anomaly_count': "Anomalies",
+        'anomaly_rate': "Anomaly Rate (%)",
+        'score_separation': "Score Separation",
+        'precision': "Precision",
+        'recall': "Recall",
+        'f1': "F1",
+        'labelled_points': "Labelled Points"
+    }), use_container_width=True)
+    
+    if labels is None:
+        st.caption("Configurations are ranked by score separation; data with an is_anomaly label column also gets precision and recall.")
+    else:
+        st.caption("Configurations are ranked by F1 score against the is_anomaly labels.")
+
+def show_detection_results(result_data, model_info, algorithm, execution_time):
+    """Show the summary, metrics and charts of a detection run."""
+    # Plotly is only imported once there are results to chart
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
+    # Display results summary
+    st.success(f"Anomaly detection completed in {execution_time:.2f} seconds.")
+    
+    # Count anomalies
+    anomaly_count = result_data['is_anomaly'].sum()
+    total_count = len(result_data)
+    anomaly_percent = (anomaly_count / total_count) * 100
+    
+    # Results metrics
+    st.markdown("### Detection Results")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Total Records", total_count)
+    
+    with col2:
+        st.metric("Anomalies Detected", anomaly_count)
+    
+    with col3:
+        st.metric("Anomaly Percentage", f"{anomaly_percent:.2f}%")
+    
+    # Display model-specific metrics
+    st.markdown("### Model Metrics")
+    
+    for metric_name, metric_value in model_info.items():
+        if isinstance(metric_value, (int, float)):
+            st.metric(metric_name, f"{metric_value:.4f}" if isinstance(metric_value, float) else metric_value)
+    
+    # Visualization of results
+    st.markdown("### Anomaly Visualization")
+    
+    # Time series plot with anomalies
+    fig = px.line(
+        result_data, 
+        x='timestamp', 
+        y='consumption',
+        title=f"Energy Consumption with Detected Anomalies ({algorithm})",
+        labels={"consumption": "Energy (kWh)", "timestamp": "Time"}
+    )
+    
+    # Add anomaly points to the chart
+    anomalies = result_data[result_data['is_anomaly'] == 1]
+    
+    fig.add_trace(
+        go.Scatter(
+            x=anomalies['timestamp'],
+            y=anomalies['consumption'],
+            mode='markers',
+            marker=dict(size=10, color='red', symbol='circle'),
+            name='Detected Anomalies'
         )
-        
-        # Add anomaly points to the chart
-        anomalies = result_data[result_data['is_anomaly'] == 1]
-        
-        fig.add_trace(
-            go.Scatter(
-                x=anomalies['timestamp'],
-                y=anomalies['consumption'],
-                mode='markers',
-                marker=dict(size=10, color='red', symbol='circle'),
-                name='Detected Anomalies'
-            )
+    )
+    
+    # Update layout for dark theme
+    fig.update_layout(
+        plot_bgcolor='rgba(30, 39, 46, 0.8)',
+        paper_bgcolor='rgba(30, 39, 46, 0)',
+        font=dict(color='white'),
+        xaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
+        yaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
+        height=500
+    )
+    
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Feature distribution with anomalies
+    if 'anomaly_score' in result_data.columns:
+        # Create histogram of anomaly scores
+        fig_hist = px.histogram(
+            result_data,
+            x='anomaly_score',
+            color='is_anomaly',
+            marginal='box',
+            title="Distribution of Anomaly Scores",
+            labels={"anomaly_score": "Anomaly Score", "is_anomaly": "Is Anomaly"},
+            color_discrete_map={0: "blue", 1: "red"}
         )
         
-        # Update layout for dark theme
-        fig.update_layout(
+        fig_hist.update_layout(
             plot_bgcolor='rgba(30, 39, 46, 0.8)',
             paper_bgcolor='rgba(30, 39, 46, 0)',
             font=dict(color='white'),
             xaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
             yaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
-            height=500
+            height=400
         )
         
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Feature distribution with anomalies
-        if 'anomaly_score' in result_data.columns:
-            # Create histogram of anomaly scores
-            fig_hist = px.histogram(
-                result_data,
-                x='anomaly_score',
-                color='is_anomaly',
-                marginal='box',
-                title="Distribution of Anomaly Scores",
-                labels={"anomaly_score": "Anomaly Score", "is_anomaly": "Is Anomaly"},
-                color_discrete_map={0: "blue", 1: "red"}
-            )
-            
-            fig_hist.update_layout(
-                plot_bgcolor='rgba(30, 39, 46, 0.8)',
-                paper_bgcolor='rgba(30, 39, 46, 0)',
-                font=dict(color='white'),
-                xaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
-                yaxis=dict(gridcolor='rgba(255, 255, 255, 0.1)'),
-                height=400
-            )
-            
-            st.plotly_chart(fig_hist, use_container_width=True)
+        st.plotly_chart(fig_hist, use_container_width=True)
+    
+    # Download results button
+    csv = result_data.to_csv(index=False)
+    st.download_button(
+        label="Download Detection Results",
+        data=csv,
+        file_name=f"anomaly_detection_results_{algorithm.lower().replace(' ', '_')}.csv",
+        mime="text/csv"
+    )
+    
+    # Guidance for next steps
+    st.info("You can now go to the Results page for more detailed analysis of the detected anomalies.")
+
+
+def main():
+    st.title("⚡ Run Anomaly Detection")
+    
+    colored_header(
+        label="Anomaly Detection",
+        description="Detect energy consumption anomalies using machine learning algorithms",
+        color_name="blue-70"
+    )
+    
+    # Check if data is available
+    if st.session_state.current_data is None:
+        st.warning("No data available. Please upload or generate data first.")
+        st.stop()
+    
+    # Get the data
+    data = st.session_state.current_data
+    
+    # Detection mode
+    mode = st.radio(
+        "Mode",
+        ["Train a new model", "Score with a saved model", "Sweep parameters"],
+        index=0,
+        horizontal=True
+    )
+    
+    if mode == "Train a new model":
+        detection = train_new_model(data)
+    elif mode == "Score with a saved model":
+        detection = score_with_saved_model(data)
+    else:
+        sweep_parameters(data)
+        detection = None
+    
+    if detection is not None:
+        result_data, model_info, algorithm, execution_time = detection
         
-        # Download results button
-        csv = result_data.to_csv(index=False)
-        st.download_button(
-            label="Download Detection Results",
-            data=csv,
-            file_name=f"anomaly_detection_results_{algorithm.lower().replace(' ', '_')}.csv",
-            mime="text/csv"
-        )
+        # Store results in session state
+        st.session_state.detection_results = result_data
+        st.session_state.model_metrics = model_info
         
-        # Guidance for next steps
-        st.info("You can now go to the Results page for more detailed analysis of the detected anomalies.")
+        show_detection_results(result_data, model_info, algorithm, execution_time)
     
     # Algorithm comparison info
     st.markdown("---")
     st.markdown("### Algorithm Comparison")
     
     comparison_data = {
-        'Algorithm': ['Isolation Forest', 'AutoEncoder', 'K-Means'],
+        'Algorithm': ['Isolation Forest', 'AutoEncoder', 'K-Means', 'Ensemble'],
         'Best For': [
             'General anomaly detection, works well with high-dimensional data',
             'Complex patterns, capturing temporal dependencies',
-            'Identifying distinct consumption patterns'
+            'Identifying distinct consumption patterns',
+            'Fewer false positives by combining detectors'
         ],
-        'Speed': ['Fast', 'Slow (training required)', 'Medium'],
-        'Explainability': ['Medium', 'Low', 'High'],
-        'Handles Noise': ['Excellent', 'Good', 'Fair']
+        'Speed': ['Fast', 'Slow (training required)', 'Medium', 'As slow as its slowest detector'],
+        'Explainability': ['Medium', 'Low', 'High', 'Low'],
+        'Handles Noise': ['Excellent', 'Good', 'Fair', 'Excellent']
     }
     
     comparison_df = pd.DataFrame(comparison_data)
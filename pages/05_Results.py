@@ -6,6 +6,7 @@ import plotly.graph_objects as go
 from streamlit_extras.colored_header import colored_header
 
 from utils.auth import is_authenticated
+from utils.dataset_rollups import chart_series
 from styles.custom import apply_custom_styles
 
 # Page configuration
@@ -66,9 +67,9 @@ def main():
     # Time series visualization with anomalies
     st.markdown("### Energy Consumption with Detected Anomalies")
     
-    # Create figure
+    # Create figure from the series rolled up to fit the chart
     fig = px.line(
-        results, 
+        chart_series(results, 'consumption')[0], 
         x='timestamp', 
         y='consumption',
         title=f"Energy Consumption Time Series with Anomalies ({algorithm})",
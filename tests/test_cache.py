@@ -0,0 +1,110 @@
+"""
+Tests for the LRUCache in utils/cache.py.
+"""
+import threading
+
+from utils.cache import LRUCache
+
+
+def sized_cache(max_bytes):
+    """Cache that weighs every value by its length."""
+    return LRUCache(max_bytes, sizeof=len)
+
+
+def test_get_returns_stored_value_and_counts_lookups():
+    cache = sized_cache(100)
+    cache.put('a', 'xx')
+
+    assert cache.get('a') == 'xx'
+    assert cache.get('b') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+    assert stats['entries'] == 1 and stats['current_bytes'] == 2
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = sized_cache(6)
+    cache.put('a', 'xx')
+    cache.put('b', 'xx')
+    cache.put('c', 'xx')
+    cache.get('a')
+    cache.put('d', 'xx')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'xx' and cache.get('c') == 'xx' and cache.get('d') == 'xx'
+    assert cache.stats()['evictions'] == 1
+    assert cache.current_bytes == 6
+
+
+def test_replacing_an_entry_updates_its_weight():
+    cache = sized_cache(10)
+    cache.put('a', 'xxxx')
+    cache.put('a', 'x')
+
+    assert cache.get('a') == 'x'
+    assert cache.current_bytes == 1
+
+
+def test_entry_larger_than_budget_is_not_stored():
+    cache = sized_cache(3)
+    cache.put('a', 'xx')
+    cache.put('a', 'xxxx')
+
+    assert cache.get('a') is None
+    assert cache.current_bytes == 0
+
+
+def test_configure_shrinks_budget_and_evicts():
+    cache = sized_cache(10)
+    for key in 'abcd':
+        cache.put(key, 'xx')
+    cache.configure(4)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.get('c') == 'xx' and cache.get('d') == 'xx'
+    assert cache.current_bytes == 4
+
+
+def test_get_or_load_calls_loader_once():
+    cache = sized_cache(10)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return 'value'
+
+    assert cache.get_or_load('k', loader) == 'value'
+    assert cache.get_or_load('k', loader) == 'value'
+    assert len(calls) == 1
+
+
+def test_invalidate_and_clear():
+    cache = sized_cache(10)
+    cache.put(('data.parquet', 1), 'x')
+    cache.put(('data.parquet', 2), 'x')
+    cache.put(('other.parquet', 1), 'x')
+
+    assert cache.invalidate(lambda key: key[0] == 'data.parquet') == 2
+    assert cache.stats()['entries'] == 1 and cache.current_bytes == 1
+
+    cache.clear()
+    assert cache.stats() == {'entries': 0, 'current_bytes': 0, 'max_bytes': 10, 'hits': 0,
+                             'misses': 0, 'evictions': 0, 'hit_rate': 0.0}
+
+
+def test_concurrent_puts_keep_budget():
+    cache = sized_cache(50)
+
+    def worker(offset):
+        for i in range(200):
+            cache.put((offset, i), 'xxxxx')
+            cache.get((offset, i - 1))
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.current_bytes <= 50
+    assert cache.current_bytes == 5 * cache.stats()['entries']
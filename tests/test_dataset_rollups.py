@@ -0,0 +1,108 @@
+"""
+Tests for the multi-resolution rollups in utils/dataset_rollups.py.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset_rollups import (ROLLUP_STATS, build_rollups, chart_series, load_rollup_manifest,
+                                   rollup_frame, rollup_path, select_resolution)
+from utils.dataset_store import write_stored_dataset
+
+
+def make_readings(n_rows, freq='15min'):
+    """Readings with a known pattern: consumption counts up from zero."""
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq=freq),
+        'consumption': np.arange(n_rows, dtype=np.float64),
+        'is_outage': np.zeros(n_rows, dtype=bool),
+    })
+
+
+def test_rollup_frame_statistics():
+    data = make_readings(8)
+    data.loc[5, 'consumption'] = np.nan
+    rollup = rollup_frame(data, 'hourly')
+
+    assert list(rollup.columns) == ['timestamp'] + [f"consumption_{stat}" for stat in ROLLUP_STATS]
+    assert rollup['timestamp'].tolist() == [pd.Timestamp('2024-01-01 00:00'), pd.Timestamp('2024-01-01 01:00')]
+    assert rollup['consumption_sum'].tolist() == [6.0, 17.0]
+    assert rollup['consumption_count'].tolist() == [4, 3]
+    assert rollup['consumption_mean'].tolist() == pytest.approx([1.5, 17.0 / 3])
+    assert rollup['consumption_min'].tolist() == [0.0, 4.0]
+    assert rollup['consumption_max'].tolist() == [3.0, 7.0]
+
+
+def test_rollup_frame_empty_bucket_has_no_sum():
+    data = make_readings(8)
+    data.loc[4:7, 'consumption'] = np.nan
+    rollup = rollup_frame(data, 'hourly')
+
+    assert rollup['consumption_count'].tolist() == [4, 0]
+    assert np.isnan(rollup['consumption_sum'].iloc[1])
+    assert np.isnan(rollup['consumption_mean'].iloc[1])
+
+
+def test_monthly_buckets_start_on_the_first():
+    data = make_readings(24 * 70, freq='h')
+    rollup = rollup_frame(data, 'monthly')
+
+    assert rollup['timestamp'].tolist() == list(pd.date_range('2024-01-01', periods=3, freq='MS'))
+    assert rollup['consumption_count'].tolist() == [24 * 31, 24 * 29, 24 * 10]
+
+
+def test_build_rollups_matches_in_memory_rollup(tmp_path):
+    path = str(tmp_path / 'readings.parquet')
+    # Stored flags become numeric columns, so roll up consumption alone
+    data = make_readings(4 * 24 * 40).drop(columns='is_outage')
+    write_stored_dataset(data, path, row_group_size=1000)
+    manifest = build_rollups(path)
+
+    assert manifest['resolutions'] == ['hourly', 'daily', 'monthly']
+    assert manifest['columns'] == ['consumption']
+    assert manifest['row_count'] == len(data)
+    assert pd.Timestamp(manifest['start']) == data['timestamp'].iloc[0]
+    assert not os.path.exists(rollup_path(path, '15min'))
+
+    for resolution in manifest['resolutions']:
+        stored = pd.read_parquet(rollup_path(path, resolution))
+        pd.testing.assert_frame_equal(stored, rollup_frame(data, resolution), check_dtype=False)
+
+
+def test_manifest_is_reused_until_dataset_changes(tmp_path):
+    path = str(tmp_path / 'readings.parquet')
+    write_stored_dataset(make_readings(400), path)
+    first = load_rollup_manifest(path)
+    assert load_rollup_manifest(path) == first
+
+    write_stored_dataset(make_readings(800), path)
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+    assert load_rollup_manifest(path)['row_count'] == 800
+
+
+def test_select_resolution():
+    start = pd.Timestamp('2024-01-01')
+
+    assert select_resolution(start, start + pd.Timedelta(days=2), width=100) == '15min'
+    assert select_resolution(start, start + pd.Timedelta(days=10), width=100) == 'hourly'
+    assert select_resolution(start, start + pd.Timedelta(days=400), width=100) == 'daily'
+    assert select_resolution(start, start + pd.Timedelta(hours=2), width=100) is None
+    assert select_resolution(start, start + pd.Timedelta(days=400), width=100, available=['hourly']) == 'hourly'
+    assert select_resolution(None, start) is None
+
+
+def test_chart_series_uses_coarsest_useful_rollup(tmp_path):
+    path = str(tmp_path / 'readings.parquet')
+    data = make_readings(4 * 24 * 40)
+    write_stored_dataset(data, path)
+
+    series, resolution = chart_series(path, 'consumption', width=30)
+    assert resolution == 'daily'
+    assert list(series.columns) == ['timestamp', 'consumption', 'consumption_min', 'consumption_max']
+    assert len(series) == 40
+
+    raw, resolution = chart_series(data, 'consumption', time_range=(None, data['timestamp'][50]), width=1000)
+    assert resolution is None
+    assert len(raw) == 51
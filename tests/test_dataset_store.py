@@ -0,0 +1,451 @@
+"""
+Tests for the columnar dataset store in utils/dataset_store.py.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from utils.data_processing import append_energy_csv, ingest_energy_csv
+from utils.dataset_profile import build_dataset_profile
+from utils.dataset_store import (DatasetWriter, RowIndex, TimeIndex, append_stored_dataset, iter_stored_dataset, load_dataset,
+                                 merge_timestamped_rows, read_row_positions, read_rows, read_stored_dataset,
+                                 read_time_window, row_index_path, row_positions, sort_stored_dataset, write_stored_dataset)
+
+
+def make_dataset(n_rows, start='2024-01-01', freq='h', seed=0):
+    """Hourly readings with a timestamp and two numeric columns."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=n_rows, freq=freq),
+        'consumption': rng.normal(100, 10, n_rows),
+        'temperature': rng.normal(20, 5, n_rows),
+    })
+
+
+@pytest.fixture
+def stored(tmp_path):
+    """A 100-row dataset stored in row groups of 10 rows."""
+    path = str(tmp_path / 'readings.parquet')
+    data = make_dataset(100)
+    write_stored_dataset(data, path, row_group_size=10)
+    return path, data
+
+
+def write_csv(path, data):
+    """Write readings as a CSV file with ISO timestamps."""
+    data.to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    return str(path)
+
+
+def test_ingest_streams_chunks_into_one_sorted_dataset(tmp_path):
+    data = make_dataset(250)
+    # Rows out of time order across chunk boundaries, as in some meter exports
+    shuffled = pd.concat([data.iloc[150:], data.iloc[:150]], ignore_index=True)
+    source = write_csv(tmp_path / 'readings.csv', shuffled)
+    output = str(tmp_path / 'readings.parquet')
+
+    summary = ingest_energy_csv(source, output, chunksize=100)
+
+    assert summary['row_count'] == 250
+    assert (summary['start'], summary['end']) == (data['timestamp'].iloc[0], data['timestamp'].iloc[-1])
+    stored = read_stored_dataset(output)
+    assert stored['timestamp'].is_monotonic_increasing
+    np.testing.assert_allclose(stored['consumption'].to_numpy(), data['consumption'].to_numpy())
+    assert RowIndex.load(output).row_count == 250
+
+
+def test_ingest_continues_generated_timestamps_across_chunks(tmp_path):
+    source = tmp_path / 'readings.csv'
+    pd.DataFrame({'consumption': np.arange(25.0), 'temperature': 20.5}).to_csv(source, index=False)
+    output = str(tmp_path / 'readings.parquet')
+
+    ingest_energy_csv(str(source), output, chunksize=10)
+
+    timestamps = read_stored_dataset(output)['timestamp']
+    assert timestamps.is_unique
+    assert (timestamps.diff().dropna() == pd.Timedelta(hours=1)).all()
+
+
+def test_ingest_failure_in_later_chunk_removes_output(tmp_path):
+    data = make_dataset(30)
+    data['consumption'] = data['consumption'].astype(object)
+    data.loc[25, 'consumption'] = 'offline'
+    source = write_csv(tmp_path / 'readings.csv', data)
+    output = str(tmp_path / 'readings.parquet')
+
+    with pytest.raises(ValueError):
+        ingest_energy_csv(source, output, chunksize=10)
+
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('readings.parquet')]
+
+
+def test_sort_stored_dataset_merges_several_runs_stably(tmp_path):
+    path = str(tmp_path / 'unsorted.parquet')
+    data = make_dataset(50)
+    data = pd.concat([data, data.iloc[:10].assign(consumption=-1.0)]).sample(frac=1, random_state=2)
+    data = data.reset_index(drop=True)
+    write_stored_dataset(data, path, row_group_size=7)
+
+    # Five runs of 13 rows, merged a few rows at a time
+    assert sort_stored_dataset(path, row_group_size=7, run_size=13)
+    assert not sort_stored_dataset(path)
+
+    expected = data.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(read_stored_dataset(path), expected)
+    metadata = pq.ParquetFile(path).metadata
+    assert all(metadata.row_group(i).num_rows <= 7 for i in range(metadata.num_row_groups))
+    assert RowIndex.load(path).row_count == len(data)
+    assert not [name for name in os.listdir(tmp_path) if '.run' in name or name.endswith('.tmp')]
+
+
+def test_sort_stored_dataset_puts_missing_timestamps_last(tmp_path):
+    path = str(tmp_path / 'unsorted.parquet')
+    data = make_dataset(20).iloc[::-1].reset_index(drop=True)
+    data.loc[3, 'timestamp'] = pd.NaT
+    write_stored_dataset(data, path, row_group_size=5)
+
+    sort_stored_dataset(path, row_group_size=5, run_size=6)
+
+    sorted_rows = read_stored_dataset(path)
+    assert sorted_rows['timestamp'].iloc[:-1].is_monotonic_increasing
+    assert pd.isna(sorted_rows['timestamp'].iloc[-1])
+
+
+def test_writer_widens_numeric_column_across_row_groups(tmp_path):
+    path = str(tmp_path / 'readings.parquet')
+    first, second = make_dataset(25), make_dataset(5, start='2024-02-01')
+    second['temperature'] = second['temperature'].astype(object)
+    second.loc[2, 'temperature'] = 'sensor offline'
+
+    with DatasetWriter(path, row_group_size=10) as writer:
+        writer.write(first)
+        writer.write(second)
+
+    stored = read_stored_dataset(path)
+    assert pd.api.types.is_string_dtype(stored['temperature'])
+    assert stored['temperature'].iloc[27] == 'sensor offline'
+    assert float(stored['temperature'].iloc[0]) == pytest.approx(first['temperature'][0])
+    assert pd.api.types.is_float_dtype(stored['consumption'])
+    assert pq.ParquetFile(path).metadata.num_row_groups == 4
+    assert RowIndex.load(path).offsets == [0, 10, 20, 25]
+    assert not os.path.exists(f"{path}.widen")
+
+
+def test_writer_widens_column_empty_in_first_chunk(tmp_path):
+    path = str(tmp_path / 'readings.parquet')
+    first = make_dataset(3).assign(note=np.nan)
+    second = make_dataset(2, start='2024-02-01').assign(note=['checked', None])
+
+    with DatasetWriter(path) as writer:
+        writer.write(first)
+        writer.write(second)
+
+    notes = read_stored_dataset(path)['note']
+    assert notes.isna().sum() == 4
+    assert notes.iloc[3] == 'checked'
+
+
+def test_append_widens_numeric_column_holding_text(stored):
+    path, data = stored
+    new = make_dataset(1, start=data['timestamp'].iloc[-1] + pd.Timedelta(hours=1))
+    new['temperature'] = new['temperature'].astype(object)
+    new.loc[0, 'temperature'] = 'sensor offline'
+    append_stored_dataset(path, new, row_group_size=10)
+
+    merged = read_stored_dataset(path)
+    assert merged['temperature'].iloc[-1] == 'sensor offline'
+    assert pd.api.types.is_string_dtype(merged['temperature'])
+    assert float(merged['temperature'].iloc[0]) == pytest.approx(data['temperature'][0])
+
+
+def test_row_index_records_row_groups(stored):
+    path, data = stored
+    index = RowIndex.load(path)
+
+    assert index.row_count == 100
+    assert index.offsets == list(range(0, 100, 10))
+    assert index.row_groups[3]['min_ts'] == data['timestamp'][30].value
+    assert index.row_groups[3]['max_ts'] == data['timestamp'][39].value
+
+
+def test_row_index_is_rebuilt_from_parquet_footer(stored):
+    path, _ = stored
+    saved = RowIndex.load(path)
+    os.remove(row_index_path(path))
+
+    rebuilt = RowIndex.load(path)
+    assert rebuilt.row_count == saved.row_count
+    assert rebuilt.row_groups == saved.row_groups
+    assert os.path.exists(row_index_path(path))
+
+
+def test_row_index_group_lookup():
+    index = RowIndex(30, [{'offset': 0, 'rows': 10, 'min_ts': 0, 'max_ts': 9},
+                          {'offset': 10, 'rows': 10, 'min_ts': 10, 'max_ts': 19},
+                          {'offset': 20, 'rows': 10, 'min_ts': None, 'max_ts': None}])
+
+    assert index.groups_for_rows(5, 15) == [0, 1]
+    assert index.groups_for_rows(10, 20) == [1]
+    assert index.groups_for_rows(5, 5) == []
+    assert index.groups_for_time(pd.Timestamp(12), pd.Timestamp(15)) == [1, 2]
+    assert index.groups_for_time(end=pd.Timestamp(3)) == [0, 2]
+
+
+def test_read_rows_by_position(stored):
+    path, data = stored
+    rows = read_rows(path, 15, 27)
+
+    assert list(rows.index) == list(range(15, 27))
+    pd.testing.assert_frame_equal(rows, data.iloc[15:27], check_index_type=False)
+
+
+def test_read_row_positions_reads_only_their_row_groups(stored, monkeypatch):
+    path, data = stored
+    read_groups = []
+    read_row_group = pq.ParquetFile.read_row_group
+    monkeypatch.setattr(pq.ParquetFile, 'read_row_group',
+                        lambda self, i, **kwargs: read_groups.append(i) or read_row_group(self, i, **kwargs))
+    rows = read_row_positions(path, [57, 3, 55, 3, 250, -1], columns=['timestamp', 'consumption'])
+
+    assert read_groups == [0, 5]
+    pd.testing.assert_frame_equal(rows, data.loc[[3, 55, 57], ['timestamp', 'consumption']], check_index_type=False)
+    assert read_row_positions(path, []).columns.tolist() == data.columns.tolist()
+
+
+def test_read_row_positions_from_csv(tmp_path):
+    data = make_dataset(30)
+    path = write_csv(tmp_path / 'readings.csv', data)
+    rows = read_row_positions(path, [29, 4], columns=['timestamp', 'consumption'])
+
+    pd.testing.assert_frame_equal(rows, data.loc[[4, 29], ['timestamp', 'consumption']], check_index_type=False)
+
+
+def test_read_time_window(stored):
+    path, data = stored
+    start, end = data['timestamp'][23], data['timestamp'][41]
+    window = read_time_window(path, start, end, columns=['consumption'])
+
+    assert list(window.columns) == ['consumption']
+    assert list(window.index) == list(range(23, 42))
+    np.testing.assert_array_equal(window['consumption'].to_numpy(), data['consumption'][23:42].to_numpy())
+
+
+def test_read_time_window_outside_data(stored):
+    path, _ = stored
+    window = read_time_window(path, pd.Timestamp('2030-01-01'))
+
+    assert window.empty
+    assert list(window.columns) == ['timestamp', 'consumption', 'temperature']
+
+
+def test_load_dataset_time_range_and_sample(stored):
+    path, data = stored
+    df = load_dataset(path, columns=['timestamp', 'consumption', 'missing'],
+                      time_range=(data['timestamp'][10], None), sample=9)
+
+    assert list(df.columns) == ['timestamp', 'consumption']
+    assert len(df) <= 9
+    assert df.index[0] == 10
+
+
+def test_load_dataset_builds_time_index_once_per_file_version(tmp_path, monkeypatch):
+    data = make_dataset(100)
+    path = write_csv(tmp_path / 'readings.csv', data)
+    builds = []
+    build = TimeIndex.__init__
+    monkeypatch.setattr(TimeIndex, '__init__', lambda self, timestamps: builds.append(1) or build(self, timestamps))
+    time_range = (data['timestamp'][10], data['timestamp'][19])
+
+    first = load_dataset(path, time_range=time_range)
+    second = load_dataset(path, time_range=time_range)
+    assert len(builds) == 1
+    pd.testing.assert_frame_equal(second, first)
+    assert list(first.index) == list(range(10, 20))
+
+    write_csv(tmp_path / 'readings.csv', make_dataset(50))
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+    assert len(load_dataset(path, time_range=time_range)) == 10
+    assert len(builds) == 2
+
+
+def test_append_after_end_is_in_order(stored):
+    path, data = stored
+    new = make_dataset(5, start=data['timestamp'].iloc[-1] + pd.Timedelta(hours=1), seed=1)
+    result = append_stored_dataset(path, new, row_group_size=10)
+
+    assert (result['added'], result['replaced'], result['row_count']) == (5, 0, 105)
+    assert result['in_order'] and not result['positions_changed']
+    assert len(result['replaced_timestamps']) == 0
+    assert result['end'] == new['timestamp'].iloc[-1]
+    pd.testing.assert_frame_equal(read_stored_dataset(path), pd.concat([data, new], ignore_index=True))
+
+
+def test_append_merges_and_replaces_rows(stored):
+    path, data = stored
+    new = pd.DataFrame({
+        'timestamp': [data['timestamp'][50], data['timestamp'][50] + pd.Timedelta(minutes=30),
+                      data['timestamp'][99] + pd.Timedelta(hours=1)],
+        'consumption': [1.0, 2.0, 3.0],
+        'temperature': [4.0, 5.0, 6.0],
+    })
+    result = append_stored_dataset(path, new, row_group_size=10)
+
+    assert (result['added'], result['replaced'], result['row_count']) == (2, 1, 102)
+    assert not result['in_order'] and result['positions_changed']
+    assert result['replaced_timestamps'].tolist() == [data['timestamp'][50].value]
+
+    merged = read_stored_dataset(path)
+    assert merged['timestamp'].is_monotonic_increasing and merged['timestamp'].is_unique
+    assert merged['consumption'][50] == 1.0
+    assert merged['consumption'][51] == 2.0
+    assert merged['consumption'][52] == data['consumption'][51]
+    assert RowIndex.load(path).row_count == 102
+
+
+def test_append_streams_unsorted_chunks_and_keeps_last_duplicate(stored):
+    path, data = stored
+    after = data['timestamp'].iloc[-1] + pd.Timedelta(hours=1)
+    late, early = make_dataset(4, start=after + pd.Timedelta(hours=4), seed=1), make_dataset(4, start=after, seed=2)
+    repeat = early.iloc[[1]].assign(consumption=-1.0)
+    result = append_stored_dataset(path, iter([late, early, repeat]), row_group_size=10)
+
+    assert (result['added'], result['replaced'], result['row_count']) == (8, 0, 108)
+    assert result['in_order'] and result['first_new_row'] == 100
+    merged = read_stored_dataset(path)
+    assert merged['timestamp'].is_monotonic_increasing and merged['timestamp'].is_unique
+    assert merged['consumption'][101] == -1.0
+    assert not [name for name in os.listdir(os.path.dirname(path)) if '.new' in name or '.tmp' in name]
+
+
+def test_append_to_unsorted_dataset_sorts_it(tmp_path):
+    path = str(tmp_path / 'unsorted.parquet')
+    data = make_dataset(60).sample(frac=1, random_state=0).reset_index(drop=True)
+    write_stored_dataset(data, path, row_group_size=10)
+
+    new = make_dataset(2, start='2024-02-01')
+    result = append_stored_dataset(path, new, row_group_size=10)
+
+    assert result['positions_changed'] and not result['in_order']
+    merged = read_stored_dataset(path)
+    assert merged['timestamp'].is_monotonic_increasing
+    assert len(merged) == 62
+
+
+def test_row_positions(stored):
+    path, data = stored
+    lookups = [data['timestamp'][0], data['timestamp'][57], pd.Timestamp('2030-01-01'), data['timestamp'][99]]
+
+    assert row_positions(path, lookups).tolist() == [0, 57, -1, 99]
+
+
+def test_merge_timestamped_rows_replaces_loaded_rows():
+    existing = make_dataset(4)
+    new = pd.DataFrame({'timestamp': existing['timestamp'][[2, 0]].tolist() + [pd.Timestamp('2024-01-01 00:30')],
+                        'consumption': [-2.0, -0.5, -1.0], 'temperature': 0.0})
+    merged = merge_timestamped_rows(existing, new)
+
+    assert merged['consumption'].tolist() == [-0.5, -1.0, existing['consumption'][1], -2.0,
+                                              existing['consumption'][3]]
+    assert list(merged.index) == list(range(5))
+
+
+def test_merge_timestamped_rows_keeps_order_of_equal_timestamps():
+    existing = make_dataset(2)
+    new = pd.DataFrame({'timestamp': [existing['timestamp'][1]] * 2, 'consumption': [1.0, 2.0],
+                        'temperature': 0.0})
+    merged = merge_timestamped_rows(existing, new)
+
+    assert merged['consumption'].tolist() == [existing['consumption'][0], 1.0, 2.0]
+
+
+def test_iter_stored_dataset_from_row(stored):
+    path, data = stored
+    batches = list(iter_stored_dataset(path, columns=['consumption'], batch_size=4, start=37))
+
+    assert all(len(batch) <= 4 for batch in batches)
+    np.testing.assert_array_equal(pd.concat(batches)['consumption'].to_numpy(), data['consumption'][37:].to_numpy())
+    assert list(iter_stored_dataset(path, start=100)) == []
+
+
+def test_append_energy_csv_merges_profile_of_appended_rows(stored, tmp_path):
+    path, data = stored
+    profile = build_dataset_profile(path)
+    new = make_dataset(30, start=data['timestamp'].iloc[-1] + pd.Timedelta(hours=1), seed=3)
+    source = write_csv(tmp_path / 'more.csv', new)
+
+    summary = append_energy_csv(source, path, profile=profile, chunksize=7)
+
+    assert (summary['added'], summary['row_count']) == (30, 130)
+    assert summary['profile']['row_count'] == 130
+    expected = build_dataset_profile(path)['column_stats']['consumption']
+    assert summary['profile']['column_stats']['consumption']['mean'] == pytest.approx(expected['mean'])
+
+
+@pytest.fixture
+def app_db():
+    """An application context with the models in an in-memory database."""
+    flask = pytest.importorskip('flask')
+    from app import db
+    from app import models  # noqa: F401  registers the tables
+
+    app = flask.Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield db
+
+
+def add_analysis(db, path, anomalies):
+    """A dataset record with one analysis holding anomalies given as (index, timestamp) pairs."""
+    from app.models import AnalysisResult, Anomaly, Dataset, User
+
+    user = User(username='meter', email='meter@example.com', password_hash='x', full_name='Meter Reader')
+    dataset = Dataset(name='readings', filename='readings.csv', file_path=path, file_size=1, file_type='parquet',
+                      owner=user)
+    analysis = AnalysisResult(name='run', algorithm='isolation_forest', dataset=dataset, user=user)
+    for index, timestamp in anomalies:
+        analysis.anomalies.append(Anomaly(index=index, timestamp=timestamp, score=1.0))
+    db.session.add(analysis)
+    db.session.commit()
+    return dataset, analysis
+
+
+def test_rekey_anomalies_after_rows_move(stored, app_db):
+    from app.upload.routes import _rekey_anomalies
+
+    path, data = stored
+    dataset, analysis = add_analysis(app_db, path, [(40, data['timestamp'][40].to_pydatetime()),
+                                                    (60, data['timestamp'][60].to_pydatetime())])
+    early = pd.DataFrame({'timestamp': [data['timestamp'][0] - pd.Timedelta(hours=1)],
+                          'consumption': [1.0], 'temperature': [2.0]})
+
+    assert _rekey_anomalies(dataset, append_stored_dataset(path, early, row_group_size=10)) == 0
+    assert sorted(anomaly.index for anomaly in analysis.anomalies) == [41, 61]
+    assert not (analysis.result_metrics or {}).get('stale')
+
+
+def test_rekey_anomalies_marks_replaced_readings_stale(stored, app_db):
+    from app.upload.routes import _rekey_anomalies
+
+    path, data = stored
+    dataset, analysis = add_analysis(app_db, path, [(40, data['timestamp'][40].to_pydatetime())])
+    replacement = data.iloc[[40]].assign(consumption=0.0)
+
+    assert _rekey_anomalies(dataset, append_stored_dataset(path, replacement, row_group_size=10)) == 1
+    assert analysis.result_metrics['stale']
+    assert analysis.anomalies[0].index == 40
+
+
+def test_rekey_anomalies_without_moved_rows_leaves_analyses(stored, app_db):
+    from app.upload.routes import _rekey_anomalies
+
+    path, data = stored
+    dataset, analysis = add_analysis(app_db, path, [(40, None)])
+    later = make_dataset(2, start=data['timestamp'].iloc[-1] + pd.Timedelta(hours=1))
+
+    assert _rekey_anomalies(dataset, append_stored_dataset(path, later, row_group_size=10)) == 0
+    assert analysis.result_metrics is None
@@ -0,0 +1,123 @@
+"""
+Tests for ensemble detection in models/ensemble.py.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+
+from models import load_fit_function
+from models.ensemble import (fit_members, fit_parallel, fuse_scores, normalize_scores, rank_normalize,
+                             robust_zscore, run_ensemble)
+
+# Detectors that run without TensorFlow
+SKLEARN_DETECTORS = ['isolation_forest', 'kmeans']
+
+
+def make_features(n_rows=400, seed=0):
+    """Normally distributed features with far outliers, in different directions, in the first three rows."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, 3))
+    X[:3] = 20 * np.eye(3)
+    return X
+
+
+def make_dataset(n_rows=400, seed=0):
+    """Hourly readings with consumption spikes at rows 100 and 300."""
+    rng = np.random.default_rng(seed)
+    consumption = rng.normal(100, 2, n_rows)
+    consumption[[100, 300]] = 400
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq='h'),
+        'consumption': consumption,
+        'temperature': rng.normal(20, 1, n_rows),
+    })
+
+
+def test_rank_normalize_shares_tied_ranks():
+    ranks = rank_normalize(np.array([3.0, 1.0, 3.0, 2.0]))
+
+    assert ranks.tolist() == [0.875, 0.25, 0.875, 0.5]
+
+
+def test_robust_zscore_ignores_outliers_in_scale():
+    scores = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 1000.0])
+    z = robust_zscore(scores)
+
+    assert z[2] == pytest.approx((3.0 - 3.5) / (1.5 * 1.4826))
+    assert z[-1] > 100
+
+
+def test_robust_zscore_of_constant_scores():
+    assert robust_zscore(np.full(5, 2.0)).tolist() == [0.0] * 5
+
+
+def test_normalize_scores_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        normalize_scores(np.arange(3.0), 'minmax')
+
+
+def test_fuse_scores_mean_and_max():
+    members = [(np.array([3]), np.array([0.1, 0.2, 0.3, 0.9])),
+               (np.array([0]), np.array([0.8, 0.1, 0.2, 0.3]))]
+
+    anomalies, fused = fuse_scores(members, fusion='mean', threshold_percentile=75)
+    assert fused.tolist() == pytest.approx([0.625, 0.375, 0.625, 0.875])
+    assert anomalies.tolist() == [3]
+
+    anomalies, fused = fuse_scores(members, fusion='max', threshold_percentile=50)
+    assert fused.tolist() == pytest.approx([1.0, 0.5, 0.75, 1.0])
+    assert anomalies.tolist() == [0, 3]
+
+
+def test_fuse_scores_vote():
+    scores = np.zeros(5)
+    members = [(np.array([0, 1]), scores), (np.array([1, 2]), scores), (np.array([1, 2, 4]), scores)]
+
+    assert fuse_scores(members, fusion='vote')[0].tolist() == [1, 2]
+    assert fuse_scores(members, fusion='vote', min_votes=1)[0].tolist() == [0, 1, 2, 4]
+
+    with pytest.raises(ValueError):
+        fuse_scores(members, fusion='median')
+
+
+def test_fit_parallel_matches_sequential_fits():
+    X = make_features()
+    tasks = [('isolation_forest', {'n_estimators': 50}), ('kmeans', {'n_clusters': 3}),
+             ('isolation_forest', {'n_estimators': 60})]
+    results = fit_parallel(X, tasks, max_workers=3)
+
+    assert len(results) == len(tasks)
+    for (name, params), (anomaly_indices, scores) in zip(tasks, results):
+        expected_indices, expected_scores, _, _ = load_fit_function(name)(X, params)
+        np.testing.assert_array_equal(anomaly_indices, expected_indices)
+        np.testing.assert_allclose(scores, expected_scores)
+        assert scores.dtype == np.float64
+
+
+def test_fit_members_passes_member_params():
+    X = make_features()
+    results = fit_members(X, SKLEARN_DETECTORS, {'kmeans': {'n_clusters': 3, 'threshold_percentile': 99}})
+
+    assert list(results) == SKLEARN_DETECTORS
+    assert len(results['kmeans'][0]) == 4
+    assert {0, 1, 2} <= set(results['isolation_forest'][0].tolist())
+    for _, scores in results.values():
+        assert len(scores) == len(X)
+
+
+def test_run_ensemble():
+    df = make_dataset()
+    anomaly_indices, fused = run_ensemble(df, {'algorithms': SKLEARN_DETECTORS, 'fusion': 'max'})
+
+    assert len(fused) == len(df)
+    assert {100, 300} <= set(anomaly_indices.tolist())
+
+    result = run_ensemble(df, {'algorithms': SKLEARN_DETECTORS}, return_model=True)
+    assert len(result) == 3 and result[2] is None
+
+
+def test_run_ensemble_rejects_unknown_detector():
+    with pytest.raises(ValueError):
+        run_ensemble(make_dataset(), {'algorithms': ['isolation_forest', 'svm']})
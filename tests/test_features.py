@@ -0,0 +1,65 @@
+"""
+Tests for the shared feature matrices in models/features.py.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+
+from models.features import build_feature_matrix, feature_cache, get_feature_matrix
+
+
+def make_dataset(n_rows=200, seed=0):
+    """Hourly readings with a timestamp and two measured columns."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq='h'),
+        'consumption': rng.normal(100, 10, n_rows),
+        'temperature': rng.normal(20, 5, n_rows),
+    })
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Start every test with an empty feature cache."""
+    feature_cache.clear()
+    yield
+    feature_cache.clear()
+
+
+def test_in_place_edit_of_a_middle_row_rebuilds_the_matrix():
+    df = make_dataset()
+    first = get_feature_matrix(df)
+    df.loc[100, 'consumption'] = 1000.0
+    second = get_feature_matrix(df)
+
+    assert second is not first
+    np.testing.assert_array_equal(second.values, build_feature_matrix(df).values)
+
+
+def test_frames_with_the_same_features_share_a_matrix():
+    df = make_dataset()
+    matrix = get_feature_matrix(df)
+
+    assert get_feature_matrix(df.copy()) is matrix
+    # Columns that are not features do not change the key
+    assert get_feature_matrix(df.assign(is_anomaly=1)) is matrix
+    assert get_feature_matrix(df, columns=['consumption']) is not matrix
+
+
+def test_time_features_follow_the_timestamp():
+    df = make_dataset()
+    matrix = get_feature_matrix(df)
+    shifted = df.assign(timestamp=df['timestamp'] + pd.Timedelta(hours=5))
+
+    assert matrix.columns == ['consumption', 'temperature', 'hour', 'day_of_week']
+    assert get_feature_matrix(shifted) is not matrix
+
+
+def test_stored_version_replaces_older_versions():
+    df = make_dataset()
+    get_feature_matrix(df, version=('readings.parquet', 1, 100))
+    get_feature_matrix(df, version=('readings.parquet', 2, 100))
+
+    assert feature_cache.stats()['entries'] == 1
@@ -0,0 +1,429 @@
+"""
+Tests for utils/data_processing.py: reading CSV files and preprocess_data's output schema and peak memory.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import tracemalloc
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_processing import (MAX_INSERTED_ROWS_FACTOR, MISSING_MASK_COLUMN, OUTAGE_COLUMN, compact_dtypes,
+                                   detect_csv_format, fill_gaps, infer_sampling_interval, infer_timestamp_format,
+                                   iter_energy_csv_chunks, missing_indicator, open_energy_csv, pack_bitmask,
+                                   pack_missing_indicators, parse_timestamps, preprocess_data, regularize_time_grid)
+
+# Peak memory allocated by preprocess_data, as a multiple of the input size;
+# its docstring states about twice, which this bound allows a margin on
+MAX_PEAK_FACTOR = 2.2
+
+EXPECTED_DTYPES = {
+    'timestamp': np.dtype('datetime64[ns]'),
+    'consumption': np.dtype(np.float32),
+    'temperature': np.dtype(np.float32),
+    'humidity': np.dtype(np.float32),
+    OUTAGE_COLUMN: np.dtype(bool),
+    'hour': np.dtype(np.int8),
+    'day_of_week': np.dtype(np.int8),
+    'is_weekend': np.dtype(bool),
+    'is_business_hours': np.dtype(bool),
+    MISSING_MASK_COLUMN: np.dtype(np.uint8),
+    'is_anomaly': np.dtype(np.int8),
+}
+
+
+def make_readings(n_rows, seed=0, drop=0.02, duplicates=0, shuffle=False):
+    """Hourly readings with dropped rows, missing values and optional duplicates."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=n_rows, freq='h')
+    timestamps = timestamps[rng.random(n_rows) >= drop]
+    data = pd.DataFrame({
+        'timestamp': timestamps,
+        # Whole numbers, so filled values are exact in float32
+        'consumption': np.full(len(timestamps), 100.0),
+        'temperature': np.full(len(timestamps), 20.0),
+        'humidity': np.full(len(timestamps), 50.0),
+    })
+    data.loc[rng.choice(len(data), len(data) // 100, replace=False), 'temperature'] = np.nan
+    if duplicates:
+        data = pd.concat([data, data.sample(duplicates, random_state=seed)])
+    if shuffle:
+        data = data.sample(frac=1, random_state=seed)
+    return data.reset_index(drop=True)
+
+
+def make_weekly_pattern(timestamps):
+    """Readings that repeat every week and change every hour, so linear and seasonal fills differ."""
+    hour_of_week = (timestamps - pd.Timestamp('2024-01-01')) // pd.Timedelta(hours=1) % 168
+    return pd.DataFrame({'timestamp': timestamps, 'consumption': (hour_of_week ** 2).astype(np.float64)})
+
+
+def peak_memory_factor(data):
+    """Peak memory preprocess_data allocates, as a multiple of the input size."""
+    input_size = data.memory_usage(deep=True, index=True).sum()
+    tracemalloc.start()
+    try:
+        preprocess_data(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / input_size
+
+
+def test_output_columns_and_dtypes():
+    data = make_readings(2000, duplicates=20, shuffle=True)
+    processed = preprocess_data(data)
+
+    assert dict(processed.dtypes) == EXPECTED_DTYPES
+    assert list(processed.columns) == list(EXPECTED_DTYPES)
+    assert processed.attrs['missing_mask_columns'] == ['consumption', 'temperature', 'humidity']
+
+
+def test_output_is_sorted_regular_and_filled():
+    data = make_readings(2000, duplicates=20, shuffle=True)
+    processed = preprocess_data(data)
+
+    assert processed['timestamp'].is_monotonic_increasing
+    assert processed['timestamp'].is_unique
+    assert (processed['timestamp'].diff().dropna() == pd.Timedelta(hours=1)).all()
+    assert not processed[['consumption', 'temperature', 'humidity']].isna().any().any()
+    assert isinstance(processed.index, pd.RangeIndex)
+
+
+def test_inserted_and_missing_readings_are_recorded():
+    data = make_readings(500)
+    processed = preprocess_data(data)
+
+    inserted = ~processed['timestamp'].isin(data['timestamp'])
+    assert inserted.any()
+    assert missing_indicator(processed, 'consumption').equals(inserted.rename('consumption_was_missing'))
+    assert missing_indicator(processed, 'temperature').sum() == inserted.sum() + data['temperature'].isna().sum()
+
+
+def test_duplicate_timestamps_are_averaged():
+    data = pd.DataFrame({
+        'timestamp': pd.to_datetime(['2024-01-01 02:00', '2024-01-01 00:00', '2024-01-01 01:00',
+                                     '2024-01-01 00:00', '2024-01-01 02:00']),
+        'consumption': [5.0, 1.0, 2.0, 3.0, np.nan],
+        'temperature': [20.0, 10.0, 11.0, 12.0, 22.0],
+    })
+    processed = preprocess_data(data)
+
+    assert processed['consumption'].tolist() == [2.0, 2.0, 5.0]
+    assert processed['temperature'].tolist() == [11.0, 11.0, 21.0]
+
+
+def test_anomaly_labels_are_kept():
+    data = pd.DataFrame({
+        'timestamp': pd.to_datetime(['2024-01-01 03:00', '2024-01-01 00:00', '2024-01-01 01:00',
+                                     '2024-01-01 00:00', '2024-01-01 05:00', '2024-01-01 04:00']),
+        'consumption': [4.0, 1.0, 2.0, 3.0, 6.0, 5.0],
+        'is_anomaly': [0, 0, None, 1, 'no', 1],
+    })
+    processed = preprocess_data(data)
+
+    # Duplicates are anomalies if any row is; the inserted 02:00 reading and unparsable labels are unlabelled
+    assert processed['timestamp'].dt.hour.tolist() == [0, 1, 2, 3, 4, 5]
+    assert processed['is_anomaly'].tolist() == pytest.approx([1.0, np.nan, np.nan, 0.0, 1.0, np.nan], nan_ok=True)
+    assert list(processed.columns)[-1] == 'is_anomaly'
+    assert processed.attrs['missing_mask_columns'] == ['consumption']
+
+
+def test_long_gaps_are_outages_not_rows():
+    timestamps = pd.date_range('2024-01-01', periods=100, freq='h')
+    data = pd.DataFrame({'timestamp': timestamps.delete(range(40, 70)), 'consumption': 100.0})
+    processed = preprocess_data(data, max_gap=12)
+
+    assert len(processed) == len(data)
+    assert processed[OUTAGE_COLUMN].sum() == 1
+    assert processed.loc[processed[OUTAGE_COLUMN], 'timestamp'].iloc[0] == timestamps[70]
+
+
+def test_infer_sampling_interval():
+    timestamps = pd.date_range('2024-01-01', periods=20, freq='15min')
+
+    assert infer_sampling_interval(timestamps.delete([3, 4, 9])) == pd.Timedelta(minutes=15)
+    assert infer_sampling_interval(timestamps[:2]) is None
+    assert infer_sampling_interval(pd.DatetimeIndex([timestamps[0]] * 3)) is None
+
+
+def test_regularize_time_grid_inserts_empty_rows():
+    timestamps = pd.date_range('2024-01-01', periods=20, freq='h')
+    # One reading slightly off the grid, which keeps its own timestamp
+    kept = timestamps.delete([2, 3, 12]).insert(5, timestamps[6] + pd.Timedelta(minutes=5)).delete(4)
+    data = pd.DataFrame({'timestamp': kept, 'consumption': np.arange(len(kept), dtype=np.float64)})
+    regular, interval = regularize_time_grid(data)
+
+    assert interval == pd.Timedelta(hours=1)
+    assert len(regular) == 20
+    assert regular['timestamp'].iloc[6] == timestamps[6] + pd.Timedelta(minutes=5)
+    assert regular['timestamp'].drop(6).tolist() == list(timestamps.delete(6))
+    assert regular.index[regular['consumption'].isna()].tolist() == [2, 3, 12]
+    assert len(data) == 17
+
+
+@pytest.mark.parametrize('missing, expanded', [(3, True), (4, False)])
+def test_regularize_time_grid_max_gap_boundary(missing, expanded):
+    timestamps = pd.date_range('2024-01-01', periods=20, freq='h')
+    data = pd.DataFrame({'timestamp': timestamps.delete(range(5, 5 + missing)), 'consumption': 1.0})
+    regular, _ = regularize_time_grid(data, max_gap=3)
+
+    if expanded:
+        assert len(regular) == 20
+        assert OUTAGE_COLUMN not in regular.columns
+    else:
+        assert len(regular) == len(data)
+        assert regular.loc[regular[OUTAGE_COLUMN], 'timestamp'].tolist() == [timestamps[5 + missing]]
+
+
+def test_regularize_time_grid_caps_inserted_rows():
+    timestamps = pd.date_range('2024-01-01', periods=60, freq='h')
+    # 21 readings with gaps of 8 and 15 missing readings, more than may be inserted
+    kept = timestamps[list(range(10)) + list(range(18, 28)) + [43]]
+    data = pd.DataFrame({'timestamp': kept, 'consumption': 1.0})
+    regular, _ = regularize_time_grid(data)
+
+    assert 8 + 15 > MAX_INSERTED_ROWS_FACTOR * len(data)
+    assert len(regular) == len(data) + 8
+    assert regular.loc[regular[OUTAGE_COLUMN], 'timestamp'].tolist() == [timestamps[43]]
+
+
+def test_fill_gaps_linear_and_seasonal():
+    data = make_weekly_pattern(pd.date_range('2024-01-01', periods=2 * 168, freq='h'))
+    expected = data['consumption'].copy()
+    data.loc[200:202, 'consumption'] = np.nan
+
+    linear = data.copy()
+    flags = fill_gaps(linear, ['consumption'], pd.Timedelta(hours=1))
+    assert flags[0].nonzero()[0].tolist() == [200, 201, 202]
+    assert linear['consumption'][200:203].tolist() == pytest.approx(np.linspace(expected[199], expected[203], 5)[1:4])
+
+    seasonal = data.copy()
+    fill_gaps(seasonal, ['consumption'], pd.Timedelta(hours=1), method='seasonal')
+    assert seasonal['consumption'].tolist() == expected.tolist()
+
+    with pytest.raises(ValueError):
+        fill_gaps(data.copy(), ['consumption'], method='cubic')
+
+
+def test_seasonal_fill_after_an_outage_matches_by_time():
+    timestamps = pd.date_range('2024-01-01', periods=3 * 168, freq='h')
+    # A day without readings in the first week is an outage, not inserted rows
+    data = make_weekly_pattern(timestamps.delete(range(20, 44)))
+    regular, interval = regularize_time_grid(data, max_gap=12)
+    assert len(regular) == len(data)
+
+    # One week before the first reading fell in the outage; before the others it exists
+    gap = regular.index[regular['timestamp'].isin(timestamps[[30 + 168, 220, 221]])]
+    expected = regular.loc[gap, 'consumption'].tolist()
+    regular.loc[gap, 'consumption'] = np.nan
+    fill_gaps(regular, ['consumption'], interval, method='seasonal', max_gap=12)
+
+    assert regular.loc[gap[1:], 'consumption'].tolist() == expected[1:]
+    neighbours = regular.loc[[gap[0] - 1, gap[0] + 1], 'consumption']
+    assert regular.loc[gap[0], 'consumption'] == pytest.approx(neighbours.mean())
+
+
+@pytest.mark.parametrize('missing, interpolated', [(3, True), (4, False)])
+def test_fill_gaps_max_gap_boundary(missing, interpolated):
+    data = pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=20, freq='h'),
+                         'consumption': np.arange(20, dtype=np.float64)})
+    data.loc[5:4 + missing, 'consumption'] = np.nan
+    fill_gaps(data, ['consumption'], max_gap=3)
+
+    filled = data['consumption'][5:5 + missing]
+    if interpolated:
+        assert filled.tolist() == list(range(5, 5 + missing))
+        assert not data[OUTAGE_COLUMN].any()
+    else:
+        assert (filled == data['consumption'].median()).all()
+        assert data[OUTAGE_COLUMN].tolist() == [5 <= i < 5 + missing for i in range(20)]
+
+
+@pytest.mark.parametrize('drop, duplicates, shuffle', [(0.02, 5, True), (0.0, 0, False)])
+def test_input_is_not_modified(drop, duplicates, shuffle):
+    # Without dropped rows or reordering the working frame shares the input's arrays
+    data = make_readings(500, drop=drop, duplicates=duplicates, shuffle=shuffle)
+    original = data.copy()
+    preprocess_data(data)
+
+    pd.testing.assert_frame_equal(data, original)
+
+
+@pytest.mark.parametrize('duplicates, shuffle', [(0, False), (0, True), (200, False), (200, True)])
+def test_peak_memory_within_stated_multiple(duplicates, shuffle):
+    data = make_readings(200_000, duplicates=duplicates, shuffle=shuffle)
+
+    assert peak_memory_factor(data) <= MAX_PEAK_FACTOR
+
+
+CSV_TEXT = b"timestamp,consumption,temperature\n2024-01-01 00:00:00,100.5,20.0\n2024-01-01 01:00:00,101.5,21.0\n"
+
+
+def zip_bytes(data):
+    """A ZIP archive holding a readme and the CSV data."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('readme.txt', 'Meter export')
+        archive.writestr('export/readings.csv', data)
+    return buffer.getvalue()
+
+
+COMPRESSORS = {
+    'plain': lambda data: data,
+    'gzip': gzip.compress,
+    'bz2': bz2.compress,
+    'xz': lzma.compress,
+    'zip': zip_bytes,
+}
+
+
+@pytest.mark.parametrize('compression', list(COMPRESSORS))
+def test_open_energy_csv_sniffs_compression_from_content(tmp_path, compression):
+    # The name says plain CSV whatever the content, so only the signature can tell
+    path = tmp_path / 'readings.csv'
+    path.write_bytes(COMPRESSORS[compression](CSV_TEXT))
+
+    with open_energy_csv(str(path)) as stream:
+        assert stream.read() == CSV_TEXT
+    with open(path, 'rb') as f, open_energy_csv(f) as stream:
+        assert stream.read() == CSV_TEXT
+
+
+@pytest.mark.parametrize('compression', list(COMPRESSORS))
+def test_compressed_csv_is_read_in_chunks(tmp_path, compression):
+    path = tmp_path / 'readings.csv'
+    path.write_bytes(COMPRESSORS[compression](CSV_TEXT))
+
+    chunks = list(iter_energy_csv_chunks(str(path), chunksize=1))
+
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert [chunk['consumption'].iloc[0] for chunk in chunks] == [100.5, 101.5]
+
+
+def test_zip_archive_must_be_seekable():
+    class Unseekable(io.RawIOBase):
+        def __init__(self, data):
+            self._data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return self._data.readinto(buffer)
+
+    with pytest.raises(ValueError, match='cannot be streamed'):
+        with open_energy_csv(Unseekable(zip_bytes(CSV_TEXT))):
+            pass
+
+
+HOURS = pd.date_range('2024-01-13', periods=30, freq='h')
+
+
+@pytest.mark.parametrize('values, expected', [
+    (HOURS.strftime('%Y-%m-%d %H:%M:%S'), {'timestamp_format': '%Y-%m-%d %H:%M:%S', 'timestamp_unit': None}),
+    (HOURS.strftime('%Y-%m-%dT%H:%M:%S'), {'timestamp_format': '%Y-%m-%dT%H:%M:%S', 'timestamp_unit': None}),
+    (HOURS.strftime('%d/%m/%Y %H:%M'), {'timestamp_format': '%d/%m/%Y %H:%M', 'timestamp_unit': None}),
+    (HOURS.asi8 // 10 ** 9, {'timestamp_format': None, 'timestamp_unit': 's'}),
+    ((HOURS.asi8 // 10 ** 6).astype(str), {'timestamp_format': None, 'timestamp_unit': 'ms'}),
+    (np.linspace(0.5, 40.0, 30), {'timestamp_format': None, 'timestamp_unit': None}),
+])
+def test_infer_timestamp_format(values, expected):
+    assert infer_timestamp_format(pd.Series(values)) == expected
+
+
+@pytest.mark.parametrize('values', [
+    HOURS.strftime('%Y-%m-%d %H:%M:%S'),
+    HOURS.strftime('%d/%m/%Y %H:%M'),
+    HOURS.asi8 // 10 ** 9,
+    HOURS.asi8 // 10 ** 6,
+])
+def test_parse_timestamps(values):
+    parsed = parse_timestamps(pd.Series(values))
+
+    assert parsed.tolist() == HOURS.tolist()
+
+
+def test_parse_timestamps_reinfers_a_stale_format():
+    # The first values looked month-first; later ones only fit day-first
+    format_info = {'timestamp_format': '%m/%d/%Y %H:%M'}
+    parsed = parse_timestamps(pd.Series(HOURS.strftime('%d/%m/%Y %H:%M')), format_info)
+
+    assert parsed.tolist() == HOURS.tolist()
+    assert format_info['timestamp_format'] == '%d/%m/%Y %H:%M'
+
+
+def write_columns(path, columns):
+    """Write columns of equal length as a CSV file."""
+    pd.DataFrame(columns).to_csv(path, index=False)
+    return str(path)
+
+
+def test_detect_csv_format_ignores_large_meter_readings(tmp_path):
+    # Wh meter readings pass the magnitude check for epoch seconds but are not times
+    path = write_columns(tmp_path / 'readings.csv', {'reading': 1.5 + np.arange(8),
+                                                     'meter_wh': 123456789 + 1000 * np.arange(8)})
+
+    assert detect_csv_format(path)['timestamp_column'] is None
+
+
+def test_detect_csv_format_accepts_epoch_columns(tmp_path):
+    seconds = HOURS.asi8[:8] // 10 ** 9
+    named = write_columns(tmp_path / 'named.csv', {'reading': 1.5 + np.arange(8), 'unix_ts': seconds[::-1]})
+    unnamed = write_columns(tmp_path / 'unnamed.csv', {'reading': 1.5 + np.arange(8), 'col': seconds})
+    decreasing = write_columns(tmp_path / 'decreasing.csv', {'reading': 1.5 + np.arange(8), 'col': seconds[::-1]})
+
+    assert detect_csv_format(named)['timestamp_column'] == 'unix_ts'
+    assert detect_csv_format(named)['timestamp_unit'] == 's'
+    assert detect_csv_format(unnamed)['timestamp_column'] == 'col'
+    assert detect_csv_format(decreasing)['timestamp_column'] is None
+
+
+@pytest.mark.parametrize('n_flags, dtype', [(0, np.uint8), (3, np.uint8), (8, np.uint8), (9, np.uint16),
+                                            (33, np.uint64), (64, np.uint64)])
+def test_pack_bitmask_round_trip(n_flags, dtype):
+    rng = np.random.default_rng(n_flags)
+    flags = [rng.random(50) < 0.3 for _ in range(n_flags)]
+    mask = pack_bitmask(flags)
+
+    assert mask.dtype == dtype
+    for bit, flag in enumerate(flags):
+        np.testing.assert_array_equal((mask >> dtype(bit)) & 1 == 1, flag)
+
+
+def test_packed_missing_indicators_round_trip():
+    rng = np.random.default_rng(0)
+    columns = [f'sensor_{i}' for i in range(10)]
+    data = pd.DataFrame({f'{col}_was_missing': rng.random(40) < 0.2 for col in columns})
+    data['consumption'] = 1.0
+    packed = pack_missing_indicators(data)
+
+    assert list(packed.columns) == ['consumption', MISSING_MASK_COLUMN]
+    assert packed[MISSING_MASK_COLUMN].dtype == np.uint16
+    assert packed.attrs['missing_mask_columns'] == columns
+    for col in columns:
+        pd.testing.assert_series_equal(missing_indicator(packed, col), data[f'{col}_was_missing'],
+                                       check_names=False)
+    assert not missing_indicator(packed, 'consumption').any()
+
+
+def test_compact_dtypes_round_trip():
+    data = pd.DataFrame({
+        'fraction': np.array([0.1, 1e-9, 3.0, 4.0, 5.0, np.nan]) + np.pi * 1e-7,
+        # Underflows to zero in float32
+        'tiny': np.array([1e-300, 1.0, 2.0, 3.0, 4.0, 5.0]),
+        'small': np.array([-3, 0, 1, 2, 3, 127]),
+        'medium': np.array([0, 1, 2, 3, 4, 40000]),
+        'large': np.array([0, 1, 2, 3, 4, 2 ** 40]),
+        'flag': np.array([True, False] * 3),
+        'nullable': pd.array([1, None, 3, 4, 5, 6], dtype='Int64'),
+    })
+    compact = compact_dtypes(data.copy())
+
+    assert dict(compact.dtypes) == {'fraction': np.float32, 'tiny': np.float64, 'small': np.int8, 'medium': np.int32,
+                                    'large': np.int64, 'flag': bool, 'nullable': pd.Int64Dtype()}
+    pd.testing.assert_frame_equal(compact.astype(data.dtypes.to_dict()), data)
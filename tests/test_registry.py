@@ -0,0 +1,218 @@
+"""
+Tests for saving, loading and caching fitted detectors in models/registry.py.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+
+from models import load_algorithm
+from models.dense_autoencoder import DenseAutoencoder, reconstruction_errors
+from models.features import build_feature_matrix
+from models.registry import (DETECTOR_FILE, METADATA_FILE, MODEL_REGISTRY_DIR, FittedDetector,
+                             analysis_detector_path, delete_detector, get_detector, has_detector, list_detectors,
+                             load_detector, model_cache, save_detector, warm_model_cache)
+
+
+def make_dataset(n_rows=300, seed=0):
+    """Hourly readings with consumption spikes at rows 100 and 200."""
+    rng = np.random.default_rng(seed)
+    consumption = rng.normal(100, 2, n_rows)
+    consumption[[100, 200]] = 400
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq='h'),
+        'consumption': consumption,
+        'temperature': rng.normal(20, 1, n_rows),
+    })
+
+
+def fit_detector(algorithm, df, params=None):
+    """Run an algorithm on a dataset and return its anomalies, scores and fitted detector."""
+    return load_algorithm(algorithm)(df, params, return_model=True)
+
+
+def make_dense_detector(df, seed=0):
+    """An autoencoder detector with random NumPy weights, fitted to a dataset's features."""
+    rng = np.random.default_rng(seed)
+    matrix = build_feature_matrix(df)
+    width = len(matrix.columns)
+    weights = [rng.normal(size=(width, 2)), rng.normal(size=(2, width))]
+    biases = [rng.normal(size=2), rng.normal(size=width)]
+    # float32 like exported Keras weights, so memory-mapped arrays are used as they are
+    model = DenseAutoencoder([W.astype(np.float32) for W in weights], [b.astype(np.float32) for b in biases],
+                             ['relu', 'linear'])
+    return FittedDetector.from_matrix('autoencoder', model, matrix, threshold=1.0)
+
+
+@pytest.fixture
+def empty_model_cache():
+    """Start with an empty model cache and restore its budget afterwards."""
+    max_bytes = model_cache.max_bytes
+    model_cache.clear()
+    yield model_cache
+    model_cache.configure(max_bytes)
+    model_cache.clear()
+
+
+def test_registry_dir_is_anchored_to_the_project_root():
+    if 'MODEL_REGISTRY_DIR' in os.environ:
+        pytest.skip('registry directory set in the environment')
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    assert MODEL_REGISTRY_DIR == os.path.join(project_root, 'trained_models')
+
+
+@pytest.mark.parametrize('algorithm, params', [('isolation_forest', {'n_estimators': 50}),
+                                               ('kmeans', {'n_clusters': 3})])
+def test_saved_detector_scores_like_the_fitted_one(tmp_path, algorithm, params):
+    df = make_dataset()
+    anomaly_indices, scores, detector = fit_detector(algorithm, df, params)
+    path = save_detector(detector, str(tmp_path / algorithm), name='Production')
+    loaded = load_detector(path)
+
+    assert loaded.algorithm == algorithm
+    assert loaded.columns == detector.columns
+    assert loaded.threshold == detector.threshold
+    assert loaded.params == detector.params
+    loaded_indices, loaded_scores = loaded.score(df)
+    np.testing.assert_allclose(loaded_scores, scores)
+    np.testing.assert_array_equal(loaded_indices, anomaly_indices)
+
+
+def test_saved_detector_scores_new_data(tmp_path):
+    detector = fit_detector('isolation_forest', make_dataset(), {'n_estimators': 50})[2]
+    loaded = load_detector(save_detector(detector, str(tmp_path / 'model')))
+    # Missing values are filled with the training means
+    new_data = make_dataset(seed=1).assign(temperature=np.nan)
+
+    anomaly_indices, scores = loaded.score(new_data)
+    assert len(scores) == len(new_data)
+    assert {100, 200} <= set(anomaly_indices.tolist())
+
+    with pytest.raises(ValueError, match='missing'):
+        loaded.score(new_data.drop(columns='consumption'))
+
+
+def test_list_and_delete_detectors(tmp_path):
+    root = str(tmp_path)
+    df = make_dataset()
+    for analysis_id, algorithm in [(1, 'isolation_forest'), (2, 'kmeans')]:
+        save_detector(fit_detector(algorithm, df)[2], analysis_detector_path(root, analysis_id), name=algorithm)
+    os.makedirs(os.path.join(root, 'not_a_detector'))
+
+    detectors = list_detectors(root)
+    assert [d['name'] for d in detectors] == ['kmeans', 'isolation_forest']
+    assert detectors[0]['path'] == analysis_detector_path(root, 2)
+    assert os.path.exists(os.path.join(detectors[0]['path'], METADATA_FILE))
+
+    delete_detector(analysis_detector_path(root, 1))
+    assert not has_detector(analysis_detector_path(root, 1))
+    assert [d['name'] for d in list_detectors(root)] == ['kmeans']
+    delete_detector(analysis_detector_path(root, 1))
+    assert list_detectors(str(tmp_path / 'missing')) == []
+
+
+def test_memory_mapped_load_scores_like_a_full_load(tmp_path):
+    df = make_dataset()
+    detectors = {'kmeans': fit_detector('kmeans', df, {'n_clusters': 3})[2], 'autoencoder': make_dense_detector(df)}
+
+    for algorithm, detector in detectors.items():
+        path = save_detector(detector, str(tmp_path / algorithm))
+        mapped = load_detector(path, mmap_mode='r')
+        np.testing.assert_allclose(mapped.score(df)[1], load_detector(path).score(df)[1])
+        np.testing.assert_allclose(mapped.score(df)[1], detector.score(df)[1], rtol=1e-6)
+
+    assert isinstance(load_detector(str(tmp_path / 'kmeans'), mmap_mode='r').model.cluster_centers_, np.memmap)
+    # Weights are views of the read-only mappings rather than copies
+    weights = load_detector(str(tmp_path / 'autoencoder'), mmap_mode='r').model.weights
+    assert all(isinstance(W.base, np.memmap) and not W.flags.writeable for W in weights)
+    assert load_detector(str(tmp_path / 'autoencoder')).model.weights[0].flags.writeable
+
+
+def test_get_detector_caches_until_saved_again(tmp_path, empty_model_cache):
+    df = make_dataset()
+    path = save_detector(make_dense_detector(df), str(tmp_path / 'model'))
+
+    detector = get_detector(path)
+    assert get_detector(path) is detector
+    assert detector.nbytes > 0
+
+    save_detector(make_dense_detector(df, seed=1), path)
+    os.utime(os.path.join(path, DETECTOR_FILE), ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+    reloaded = get_detector(path)
+    assert reloaded is not detector
+    assert empty_model_cache.stats()['entries'] == 1
+
+    delete_detector(path)
+    assert empty_model_cache.stats()['entries'] == 0
+
+
+def test_model_cache_evicts_least_recently_used(tmp_path, empty_model_cache):
+    df = make_dataset()
+    paths = [save_detector(make_dense_detector(df, seed), str(tmp_path / f"model_{seed}")) for seed in range(3)]
+    first = get_detector(paths[0])
+    empty_model_cache.configure(2 * first.nbytes + first.nbytes // 2)
+
+    get_detector(paths[1])
+    assert get_detector(paths[0]) is first
+    get_detector(paths[2])
+
+    # The second detector was the least recently used
+    assert empty_model_cache.stats()['evictions'] == 1
+    assert get_detector(paths[0]) is first
+    assert empty_model_cache.stats()['misses'] == 3
+    get_detector(paths[1])
+    assert empty_model_cache.stats()['misses'] == 4
+
+
+def test_warm_model_cache_skips_missing_detectors(tmp_path, empty_model_cache):
+    path = save_detector(make_dense_detector(make_dataset()), str(tmp_path / 'model'))
+
+    assert warm_model_cache([path, str(tmp_path / 'missing')]) == 1
+    assert empty_model_cache.stats()['entries'] == 1
+
+
+def test_dense_autoencoder_forward_pass():
+    model = DenseAutoencoder([np.array([[1.0, -1.0]]), np.array([[2.0], [3.0]])], [np.array([0.0, 1.0]),
+                             np.array([0.5])], ['relu', 'linear'])
+    X = np.array([[1.0], [-2.0]])
+
+    # relu([1, 0]) @ [2, 3] + 0.5 and relu([-2, 3]) @ [2, 3] + 0.5
+    np.testing.assert_allclose(model.predict(X), [[2.5], [9.5]])
+    np.testing.assert_allclose(reconstruction_errors(model, X, chunk_size=1), [1.5 ** 2, 11.5 ** 2])
+
+    with pytest.raises(ValueError, match='Unsupported activations'):
+        DenseAutoencoder([np.eye(1)], [np.zeros(1)], ['softmax'])
+
+
+def test_dense_autoencoder_save_and_load(tmp_path):
+    model = make_dense_detector(make_dataset()).model
+    model.save(str(tmp_path / 'weights'))
+    loaded = DenseAutoencoder.load(str(tmp_path / 'weights'))
+    X = np.random.default_rng(0).normal(size=(10, model.weights[0].shape[0]))
+
+    assert loaded.activations == model.activations
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+
+def test_dense_autoencoder_matches_keras(tmp_path):
+    keras = pytest.importorskip('tensorflow').keras
+    model = keras.Sequential([keras.Input(shape=(4,)), keras.layers.Dense(3, activation='relu'),
+                              keras.layers.Dense(2, activation='tanh'), keras.layers.Dense(4, activation='sigmoid')])
+    X = np.random.default_rng(0).normal(size=(50, 4)).astype(np.float32)
+    exported = DenseAutoencoder.from_keras(model)
+
+    np.testing.assert_allclose(exported.predict(X), model(X, training=False).numpy(), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(reconstruction_errors(exported, X), reconstruction_errors(model, X), rtol=1e-5)
+
+    # Saving a Keras detector exports NumPy weights, which are what gets loaded
+    columns = ['consumption', 'temperature', 'humidity', 'voltage']
+    matrix = build_feature_matrix(pd.DataFrame(X, columns=columns), columns=columns)
+    detector = FittedDetector.from_matrix('autoencoder', model, matrix, threshold=1.0)
+    loaded = load_detector(save_detector(detector, str(tmp_path / 'keras')))
+    assert isinstance(loaded.model, DenseAutoencoder)
+    np.testing.assert_allclose(loaded.anomaly_scores(matrix.values), detector.anomaly_scores(matrix.values),
+                               rtol=1e-5)
@@ -0,0 +1,143 @@
+"""
+Tests for hyperparameter sweeps in models/sweep.py.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.sweep import (MAX_FITS, SWEEP_LIMITS, UNLABELLED, check_grid, evaluate_configuration, expand_grid,
+                          label_vector, parse_values, run_sweep, score_separation, threshold_anomalies)
+
+
+def make_dataset(n_rows=400, seed=0):
+    """Hourly readings with consumption spikes at rows 100 and 300."""
+    rng = np.random.default_rng(seed)
+    consumption = rng.normal(100, 2, n_rows)
+    consumption[[100, 300]] = 400
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq='h'),
+        'consumption': consumption,
+        'temperature': rng.normal(20, 1, n_rows),
+    })
+
+
+def test_parse_values():
+    assert parse_values('0.01, 0.05,,0.01') == [0.01, 0.05]
+    assert parse_values('100, 2e2', cast=int) == [100, 200]
+    assert parse_values('') == []
+    assert parse_values(None) == []
+
+
+@pytest.mark.parametrize('text, cast', [('abc', float), ('1e400', int), ('nan', int)])
+def test_parse_values_rejects_invalid(text, cast):
+    with pytest.raises(ValueError, match='Not a valid'):
+        parse_values(text, cast=cast)
+
+
+def test_parse_values_checks_limits():
+    limits = SWEEP_LIMITS['isolation_forest']['n_estimators']
+
+    assert parse_values('50, 500', cast=int, limits=limits) == [50, 500]
+    with pytest.raises(ValueError, match='is not between 50 and 500'):
+        parse_values('100, 100000000', cast=int, limits=limits)
+
+
+def test_check_grid():
+    check_grid('kmeans', {'n_clusters': [2, 20], 'threshold_percentile': [95]})
+
+    with pytest.raises(ValueError, match='cannot be swept'):
+        check_grid('kmeans', {'n_estimators': [100]})
+    with pytest.raises(ValueError, match='contamination must be between'):
+        check_grid('isolation_forest', {'contamination': [0.05, 0.5]})
+
+
+def test_expand_grid():
+    combinations = expand_grid({'b': [1, 2], 'a': ['x']})
+
+    assert combinations == [{'a': 'x', 'b': 1}, {'a': 'x', 'b': 2}]
+    assert expand_grid({}) == [{}]
+
+
+def test_threshold_anomalies():
+    scores = np.arange(100, dtype=np.float64)
+
+    assert len(threshold_anomalies('isolation_forest', scores, 0.1)) == 10
+    assert threshold_anomalies('kmeans', scores, 95).tolist() == [95, 96, 97, 98, 99]
+
+
+def test_label_vector_keeps_missing_labels_unlabelled():
+    labels = label_vector(5, is_anomaly=pd.Series([1, 0, np.nan, None, 2], dtype=object))
+
+    assert labels.tolist() == [1, 0, UNLABELLED, UNLABELLED, 1]
+
+
+def test_label_vector_validated_points_override_labels():
+    labels = label_vector(4, is_anomaly=[0, 0, 1, 1], validated={0: True, 3: False, 10: True})
+
+    assert labels.tolist() == [1, 0, 1, 0]
+
+
+def test_label_vector_without_labels():
+    assert label_vector(3) is None
+    assert label_vector(3, is_anomaly=[np.nan] * 3) is None
+
+
+def test_score_separation():
+    scores = np.array([0.0, 0.0, 1.0, 1.0])
+
+    assert score_separation(scores, np.array([False, False, True, True])) == pytest.approx(2.0)
+    assert score_separation(scores, np.zeros(4, dtype=bool)) is None
+    assert score_separation(np.ones(4), np.array([True, False, False, False])) == 0.0
+
+
+def test_evaluate_configuration_with_labels():
+    scores = np.array([0.9, 0.8, 0.1, 0.2, 0.7])
+    labels = np.array([1, 0, 0, UNLABELLED, 1], dtype=np.int8)
+    metrics = evaluate_configuration(scores, np.array([0, 1]), labels)
+
+    assert metrics['anomaly_count'] == 2
+    assert metrics['anomaly_rate'] == pytest.approx(0.4)
+    assert (metrics['precision'], metrics['recall']) == (0.5, 0.5)
+    assert metrics['f1'] == pytest.approx(0.5)
+    assert metrics['labelled_points'] == 4
+
+
+def test_evaluate_configuration_without_labels():
+    metrics = evaluate_configuration(np.array([0.1, 0.9]), np.array([1]))
+
+    assert set(metrics) == {'anomaly_count', 'anomaly_rate', 'score_separation'}
+
+
+def test_run_sweep_fits_once_per_model_parameter():
+    df = make_dataset()
+    grid = {'n_clusters': [2, 3], 'threshold_percentile': [95, 99]}
+    results = run_sweep(df, 'kmeans', grid)
+
+    assert len(results) == 4
+    assert sorted((r['params']['n_clusters'], r['params']['threshold_percentile']) for r in results) == \
+        [(2, 95), (2, 99), (3, 95), (3, 99)]
+    separations = [r['score_separation'] for r in results]
+    assert separations == sorted(separations, reverse=True)
+
+
+def test_run_sweep_ranks_by_f1_with_labels():
+    df = make_dataset()
+    is_anomaly = np.zeros(len(df))
+    is_anomaly[[100, 300]] = 1
+    results = run_sweep(df, 'isolation_forest', {'contamination': [0.01, 0.2]},
+                        base_params={'n_estimators': 50}, labels=label_vector(len(df), is_anomaly))
+
+    assert [r['params']['contamination'] for r in results] == [0.01, 0.2]
+    assert results[0]['recall'] == 1.0
+    assert results[0]['f1'] > results[1]['f1']
+
+
+def test_run_sweep_rejects_invalid_grids():
+    df = make_dataset()
+
+    with pytest.raises(ValueError, match='Not a single detector'):
+        run_sweep(df, 'ensemble', {})
+    with pytest.raises(ValueError, match='must be between'):
+        run_sweep(df, 'kmeans', {'n_clusters': [1]})
+    with pytest.raises(ValueError, match=f'at most {MAX_FITS}'):
+        run_sweep(df, 'isolation_forest', {'n_estimators': list(range(50, 101)), 'max_samples': [16, 32]})
@@ -0,0 +1,139 @@
+"""
+Tests for resumable chunked uploads in app/upload/routes.py and utils/upload_spool.py.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('flask')
+
+from app import create_app, db
+from app.models import Dataset, User
+from utils.upload_spool import append_to_spool, copy_stream, create_spool, load_spool
+
+
+def make_csv(n_rows=48):
+    """Hourly readings as CSV bytes."""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n_rows, freq='h').strftime('%Y-%m-%d %H:%M:%S'),
+        'consumption': rng.normal(100, 10, n_rows).round(2),
+        'temperature': rng.normal(20, 5, n_rows).round(2),
+    })
+    return data.to_csv(index=False).encode()
+
+
+@pytest.fixture
+def client(tmp_path):
+    """A test client logged in as a new user."""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'MODEL_FOLDER': str(tmp_path / 'models'),
+        'INGEST_CHUNK_SIZE': 20,
+    })
+    with app.app_context():
+        user = User(username='meter', email='meter@example.com', full_name='Meter Reader')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    yield client
+
+    with app.app_context():
+        db.drop_all()
+
+
+def start_upload(client, size):
+    """Start a chunked upload of ``size`` bytes and return its id."""
+    response = client.post('/upload/chunked', json={'name': 'Meter readings', 'filename': 'readings.csv',
+                                                    'size': size})
+    assert response.status_code == 201
+    assert response.get_json()['received'] == 0
+    return response.get_json()['upload_id']
+
+
+def put_chunk(client, upload_id, body, start, total):
+    """Send one chunk with a Content-Range header."""
+    return client.put(f'/upload/chunked/{upload_id}', data=body,
+                      headers={'Content-Range': f'bytes {start}-{start + len(body) - 1}/{total}'})
+
+
+def test_chunked_upload_resumes_and_completes(client):
+    content = make_csv()
+    size = len(content)
+    upload_id = start_upload(client, size)
+
+    assert put_chunk(client, upload_id, content[:500], 0, size).get_json()['received'] == 500
+
+    # A re-sent chunk is refused with the byte count to resume from
+    response = put_chunk(client, upload_id, content[:500], 0, size)
+    assert response.status_code == 409
+    assert response.get_json()['received'] == 500
+
+    status = client.get(f'/upload/chunked/{upload_id}').get_json()
+    assert (status['received'], status['size']) == (500, size)
+
+    response = client.post(f'/upload/chunked/{upload_id}/complete')
+    assert response.status_code == 409
+    assert response.get_json()['received'] == 500
+
+    assert put_chunk(client, upload_id, content[500:], 500, size).get_json()['received'] == size
+    response = client.post(f'/upload/chunked/{upload_id}/complete')
+    assert response.status_code == 201
+    assert response.get_json()['row_count'] == 48
+
+    with client.application.app_context():
+        assert db.session.get(Dataset, response.get_json()['dataset_id']).row_count == 48
+    assert client.get(f'/upload/chunked/{upload_id}').status_code == 404
+
+
+@pytest.mark.parametrize('content_range', ['bytes 45-54/50', 'bytes 0-19/50', 'bytes 0-9/60', 'bytes 9-0/50',
+                                           'bytes 0-9'])
+def test_chunk_outside_declared_size_is_rejected(client, content_range):
+    upload_id = start_upload(client, 50)
+    response = client.put(f'/upload/chunked/{upload_id}', data=b'x' * 10, headers={'Content-Range': content_range})
+
+    assert response.status_code == 400
+    assert client.get(f'/upload/chunked/{upload_id}').get_json()['received'] == 0
+
+
+def test_chunk_longer_than_declared_size_is_rejected_without_range(client):
+    upload_id = start_upload(client, 50)
+    response = client.put(f'/upload/chunked/{upload_id}', data=b'x' * 60)
+
+    assert response.status_code == 400
+    assert client.get(f'/upload/chunked/{upload_id}').get_json()['received'] == 0
+
+
+def test_cancelled_upload_is_removed(client):
+    upload_id = start_upload(client, 50)
+
+    assert client.delete(f'/upload/chunked/{upload_id}').get_json()['cancelled']
+    assert client.get(f'/upload/chunked/{upload_id}').status_code == 404
+
+
+def test_copy_stream_stops_at_limit():
+    source, target = io.BytesIO(b'x' * 100), io.BytesIO()
+
+    assert copy_stream(source, target, buffer_size=7, limit=30) == 30
+    assert len(target.getvalue()) == 30
+    assert len(source.read()) == 70
+
+
+def test_append_to_spool_reads_at_most_length(tmp_path):
+    upload_dir = str(tmp_path)
+    upload_id = create_spool(upload_dir, {'size': 10})
+
+    assert append_to_spool(upload_dir, upload_id, io.BytesIO(b'abcdefgh'), 0, length=5) == 5
+    with pytest.raises(ValueError):
+        append_to_spool(upload_dir, upload_id, io.BytesIO(b'abc'), 3)
+    assert load_spool(upload_dir, upload_id)['received'] == 5
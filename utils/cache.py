@@ -0,0 +1,145 @@
+"""
+In-process caching utilities for the Energy Anomaly Detection System.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by a memory budget.
+
+    Each entry is weighed with ``sizeof`` when it is stored. When the total
+    weight exceeds ``max_bytes`` the least recently used entries are evicted.
+    An entry larger than the whole budget is returned to the caller but never
+    stored.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_bytes: int):
+        """
+        Change the memory budget, evicting entries if it shrank.
+
+        Parameters:
+            max_bytes (int): New memory budget in bytes
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up an entry and mark it as most recently used.
+
+        Parameters:
+            key: Cache key
+
+        Returns:
+            The cached value, or None if the key is not cached
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Store an entry, evicting least recently used entries as needed.
+
+        Parameters:
+            key: Cache key
+            value: Value to cache
+        """
+        size = self.sizeof(value)
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for a key, loading and caching it on a miss.
+
+        Parameters:
+            key: Cache key
+            loader (callable): Function returning the value to cache
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drop every entry whose key matches a predicate.
+
+        Parameters:
+            predicate (callable): Function returning True for keys to drop
+
+        Returns:
+            int: Number of entries dropped
+        """
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                self.current_bytes -= self._entries.pop(key)[1]
+            return len(stale)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report cache usage.
+
+        Returns:
+            dict: Entry count, memory use and hit/miss/eviction counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _evict(self):
+        """Evict least recently used entries until the budget is met."""
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
@@ -4,17 +4,29 @@ Data processing utilities for the Energy Anomaly Detection System.
 import pandas as pd
 import numpy as np
 import os
+import re
 import io
 import csv
+import bz2
+import gzip
+import lzma
+import zipfile
+import warnings
+import itertools
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Tuple, Dict, Optional, Union, Any
+from typing import List, Tuple, Dict, Optional, Union, Any, Iterable, Iterator, BinaryIO
 
-def validate_dataset(data):
+def validate_dataset(data, format_info=None):
     """
     Validate that the uploaded dataset has the required columns and structure.
     
+    The dataset is only checked: timestamps and numeric columns are parsed
+    into local values and the caller's frame is left unchanged.
+    
     Parameters:
         data (DataFrame): The dataset to validate
+        format_info (dict, optional): Format information holding the timestamp encoding
     
     Returns:
         tuple: (is_valid, message) where is_valid is a boolean and message is a string
@@ -32,16 +44,14 @@ def validate_dataset(data):
     
     # Check data types and formatting
     try:
-        # Attempt to convert timestamp column to datetime
-        pd.to_datetime(data['timestamp'])
+        timestamps = parse_timestamps(data['timestamp'], format_info)
     except Exception as e:
         return False, f"Error parsing timestamp column: {str(e)}"
     
     # Check consumption column
     if not pd.api.types.is_numeric_dtype(data['consumption']):
         try:
-            # Attempt to convert to numeric
-            data['consumption'] = pd.to_numeric(data['consumption'])
+            pd.to_numeric(data['consumption'])
         except Exception as e:
             return False, f"Consumption column must contain numeric values: {str(e)}"
     
@@ -50,71 +60,650 @@ def validate_dataset(data):
     for col in optional_columns:
         if col in data.columns and not pd.api.types.is_numeric_dtype(data[col]):
             try:
-                # Attempt to convert to numeric
-                data[col] = pd.to_numeric(data[col])
+                pd.to_numeric(data[col])
             except Exception as e:
                 return False, f"Column '{col}' must contain numeric values: {str(e)}"
     
     # Check for duplicates in timestamp
-    if data['timestamp'].duplicated().any():
+    if timestamps.duplicated().any():
         return True, "Warning: Duplicate timestamps found. Data will be aggregated."
     
     return True, "Dataset validation successful."
 
-def preprocess_data(data):
+def preprocess_data(data, fill_method='linear', max_gap=None, format_info=None):
     """
     Preprocess the dataset for anomaly detection.
     
+    The input frame is never modified. Each stage below works on the frame
+    produced by the previous one in place, replacing or releasing single
+    columns rather than copying the whole frame, and fills the columns it
+    rebuilt without copying them again. On top of the input, memory peaks
+    at about twice the input size, whether or not the data has to be
+    sorted: the working frame, one column being rebuilt from it, and the
+    temporaries of that column.
+    
+    Readings missing from the regular sampling grid are inserted as empty
+    rows and interpolated, for gaps of up to ``max_gap`` readings. Longer
+    gaps are not filled row by row; the reading after one is flagged in
+    ``is_outage``, as are runs of more than ``max_gap`` missing values in
+    the data, which are filled with the column median.
+    
+    An ``is_anomaly`` label column in the data is kept, with NaN for
+    inserted readings and for values that are not numbers, and is never
+    filled; without one, ``is_anomaly`` is all zeros.
+    
     Parameters:
         data (DataFrame): The raw dataset
+        fill_method (str): 'linear' or 'seasonal' (same time one week earlier)
+        max_gap (int, optional): Longest gap, in readings, that is interpolated
+        format_info (dict, optional): Format information holding the timestamp
+            encoding, as inferred at ingest; inferred from the data if None
     
     Returns:
         DataFrame: The processed dataset
     """
-    # Create a copy to avoid modifying the original
-    processed_data = data.copy()
+    processed_data = _sorted_by_time(data, format_info)
+    max_gap = MAX_INTERPOLATION_GAP if max_gap is None else max_gap
+    processed_data, interval = _regularize_time_grid(processed_data, max_gap=max_gap, release=True)
+    
+    numeric_columns = [col for col in _numeric_columns(processed_data) if col != 'is_anomaly']
+    # Float columns rebuilt above are filled in place; those still sharing
+    # the input's arrays are replaced by filled copies
+    in_place = [col for col in numeric_columns
+                if not (col in data.columns and data[col].dtype == np.float64
+                        and np.may_share_memory(processed_data[col].to_numpy(), data[col].to_numpy()))]
+    missing_flags = _fill_gaps(processed_data, numeric_columns, interval, method=fill_method,
+                               max_gap=max_gap, in_place=in_place)
+    
+    _add_time_features(processed_data)
+    
+    # Record which values were filled, packed as bits of one column
+    if missing_flags:
+        processed_data[MISSING_MASK_COLUMN] = pack_bitmask(missing_flags)
+        processed_data.attrs['missing_mask_columns'] = numeric_columns[:len(missing_flags)]
+    
+    # Keep the anomaly labels the data came with, last like a new column;
+    # readings inserted on the grid are unlabelled. Without labels, no
+    # reading is an anomaly yet.
+    if 'is_anomaly' in processed_data.columns:
+        processed_data['is_anomaly'] = _label_values(processed_data.pop('is_anomaly'))
+    else:
+        processed_data['is_anomaly'] = np.zeros(len(processed_data), dtype=np.int8)
+    
+    # Store every column in the smallest type that holds its values
+    return compact_dtypes(processed_data)
+
+def _sorted_by_time(data: pd.DataFrame, format_info: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Working frame ordered by timestamp, with a fresh index and the timestamp first.
     
-    # Convert timestamp to datetime
-    processed_data['timestamp'] = pd.to_datetime(processed_data['timestamp'])
+    The rows are only copied if they need sorting; otherwise the working
+    frame is a shallow copy sharing the input's column arrays. Sorted rows
+    are gathered a column at a time into separate arrays, so later stages
+    can release each column once they have replaced it. Rows that share a
+    timestamp are averaged straight from the input, so a frame with
+    duplicates is copied only once.
+    """
+    timestamps = parse_timestamps(data['timestamp'], format_info)
+    ts_ns = _timestamp_ns_array(timestamps)
+    order = None if timestamps.is_monotonic_increasing else np.argsort(ts_ns, kind='stable')
     
-    # Sort by timestamp
-    processed_data = processed_data.sort_values('timestamp')
+    # First row of each run of equal timestamps, in sorted order
+    sorted_ns = ts_ns if order is None else ts_ns[order]
+    first = np.ones(len(sorted_ns), dtype=bool)
+    np.not_equal(sorted_ns[1:], sorted_ns[:-1], out=first[1:])
+    del ts_ns, sorted_ns
     
-    # Handle duplicates by aggregating
-    if processed_data['timestamp'].duplicated().any():
-        processed_data = processed_data.groupby('timestamp').agg({
-            'consumption': 'mean',
-            'temperature': 'mean' if 'temperature' in processed_data.columns else None,
-            'humidity': 'mean' if 'humidity' in processed_data.columns else None,
-            'occupancy': 'mean' if 'occupancy' in processed_data.columns else None
-        }).reset_index()
+    if not first.all():
+        starts = np.flatnonzero(first)
+        del first
+        return _aggregate_duplicate_timestamps(data, timestamps, order, starts)
     
-    # Handle missing values
-    numeric_columns = processed_data.select_dtypes(include=[np.number]).columns
-    for col in numeric_columns:
-        # Fill missing values with the median
-        processed_data[col] = processed_data[col].fillna(processed_data[col].median())
+    if order is None:
+        processed_data = data.copy(deep=False)
+        processed_data['timestamp'] = timestamps
+        processed_data.index = pd.RangeIndex(len(processed_data))
+        if processed_data.columns[0] != 'timestamp':
+            processed_data.insert(0, 'timestamp', processed_data.pop('timestamp'))
+        return processed_data
     
-    # Add additional time-based features
-    processed_data['hour'] = processed_data['timestamp'].dt.hour
-    processed_data['day_of_week'] = processed_data['timestamp'].dt.dayofweek
-    processed_data['is_weekend'] = processed_data['day_of_week'] >= 5
-    processed_data['is_business_hours'] = ((processed_data['hour'] >= 8) & 
-                                          (processed_data['hour'] <= 18) & 
-                                          (~processed_data['is_weekend']))
+    # Built from a dict, since assigning a column to a frame copies it
+    ordered = {'timestamp': timestamps.array.take(order)}
+    del timestamps
+    for col in data.columns:
+        if col != 'timestamp':
+            ordered[col] = _take_values(data[col], order)
+    return pd.DataFrame(ordered, copy=False)
+
+def _take_values(values: pd.Series, indices: np.ndarray, allow_fill: bool = False):
+    """Gather the values of a column at the given positions, -1 giving an empty value if ``allow_fill``."""
+    values = values.array
+    if isinstance(values, pd.arrays.NumpyExtensionArray):
+        values = values.to_numpy()
+    return pd.api.extensions.take(values, indices, allow_fill=allow_fill)
+
+def _numeric_columns(data: pd.DataFrame) -> List[str]:
+    """Names of the numeric, non-boolean columns; unlike select_dtypes this does not copy the data."""
+    return [col for col, dtype in data.dtypes.items()
+            if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+
+def _float_values(values: pd.Series) -> np.ndarray:
+    """Values of a numeric column as float64, without a copy if they already are."""
+    if values.dtype == np.float64:
+        return values.to_numpy()
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+def _label_values(values: pd.Series) -> np.ndarray:
+    """Anomaly labels as float64, with NaN for rows that are not labelled."""
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+def _aggregate_duplicate_timestamps(data: pd.DataFrame, timestamps: pd.Series, order: Optional[np.ndarray],
+                                    starts: np.ndarray) -> pd.DataFrame:
+    """
+    Average the standard columns of rows that share a timestamp.
     
-    # Add indicator for missing values that were filled
-    for col in numeric_columns:
-        missing_indicator = f"{col}_was_missing"
-        processed_data[missing_indicator] = data[col].isna().astype(int)
+    ``order`` sorts the rows by timestamp (None if they are sorted) and
+    ``starts`` holds the sorted position of the first row of each
+    timestamp. Each column is gathered in sorted order and its groups of
+    equal timestamps are reduced with ``np.add.reduceat``, one column at a
+    time, without the hash tables and intermediate frames of a groupby.
+    A timestamp keeps the largest ``is_anomaly`` label of its rows, so it
+    is an anomaly if any of them is; unlabelled rows are ignored.
+    """
+    first_rows = starts if order is None else order[starts]
+    aggregated = {'timestamp': timestamps.array.take(first_rows)}
+    del first_rows
     
-    # Set index to timestamp for time series analysis
-    processed_data = processed_data.set_index('timestamp').reset_index()
+    for col in ['consumption', 'temperature', 'humidity', 'occupancy']:
+        if col not in data.columns:
+            continue
+        values = _float_values(data[col])
+        values = values.copy() if order is None else values[order]
+        missing = np.isnan(values)
+        values[missing] = 0.0
+        np.logical_not(missing, out=missing)
+        counts = np.add.reduceat(missing, starts, dtype=np.int32)
+        del missing
+        sums = np.add.reduceat(values, starts)
+        del values
+        with np.errstate(invalid='ignore'):
+            np.divide(sums, counts, out=sums)
+        aggregated[col] = sums
     
-    # Initialize is_anomaly column to 0 (false)
-    processed_data['is_anomaly'] = 0
+    if 'is_anomaly' in data.columns:
+        labels = _label_values(data['is_anomaly'])
+        labels = labels if order is None else labels[order]
+        aggregated['is_anomaly'] = np.fmax.reduceat(labels, starts)
+        del labels
     
-    return processed_data
+    # Built from a dict, since assigning a column to a frame copies it
+    return pd.DataFrame(aggregated, copy=False)
+
+# Longest run of missing readings filled by interpolation; longer runs are outages
+MAX_INTERPOLATION_GAP = 12
+
+# Column flagging rows that fall in a long outage
+OUTAGE_COLUMN = 'is_outage'
+
+# Most rows regularize_time_grid may insert, as a multiple of the readings
+MAX_INSERTED_ROWS_FACTOR = 1
+
+def _timestamp_ns_array(timestamps) -> np.ndarray:
+    """Timestamps as int64 nanoseconds since the epoch (UTC for timezone-aware values)."""
+    values = pd.DatetimeIndex(timestamps).array
+    # as_unit copies even when the unit already matches
+    if values.unit != 'ns':
+        values = values.as_unit('ns')
+    return values.asi8
+
+def infer_sampling_interval(timestamps) -> Optional[pd.Timedelta]:
+    """
+    Infer the regular interval between readings.
+    
+    Parameters:
+        timestamps (Series): Sorted, unique timestamps
+        
+    Returns:
+        Timedelta: The median spacing of the readings, or None if fewer than
+            three readings are available
+    """
+    if len(timestamps) < 3:
+        return None
+    
+    diffs = np.diff(_timestamp_ns_array(timestamps))
+    diffs = diffs[diffs > 0]
+    if diffs.size == 0:
+        return None
+    return pd.Timedelta(int(np.median(diffs)), unit='ns')
+
+def regularize_time_grid(data: pd.DataFrame, interval: Optional[pd.Timedelta] = None,
+                         max_gap: Optional[int] = None
+                         ) -> Tuple[pd.DataFrame, Optional[pd.Timedelta]]:
+    """
+    Insert empty rows where readings are missing from the sampling grid.
+    
+    A gap between two consecutive readings that spans ``n`` intervals gets
+    ``n - 1`` new rows, one per missing reading, with every other column
+    empty. Existing readings keep their own timestamps, so data that is
+    slightly off the grid is never dropped.
+    
+    Gaps of more than ``max_gap`` missing readings are not expanded; the
+    reading that ends one is flagged in ``is_outage`` instead. At most
+    ``MAX_INSERTED_ROWS_FACTOR`` rows per reading are inserted in total, so
+    a few stray timestamps cannot blow up the dataset: if the gaps need more,
+    the longest are recorded as outages until the rest fit.
+    
+    Parameters:
+        data (DataFrame): Dataset sorted by unique timestamps
+        interval (Timedelta, optional): Sampling interval (inferred if None)
+        max_gap (int, optional): Longest gap, in missing readings, that is expanded
+        
+    Returns:
+        tuple: (dataset with missing readings inserted, sampling interval or None)
+    """
+    return _regularize_time_grid(data, interval, max_gap)
+
+def _regularize_time_grid(data: pd.DataFrame, interval: Optional[pd.Timedelta] = None,
+                          max_gap: Optional[int] = None, release: bool = False
+                          ) -> Tuple[pd.DataFrame, Optional[pd.Timedelta]]:
+    """
+    regularize_time_grid, optionally releasing the input's columns as they are rebuilt.
+    
+    With ``release`` each column is deleted from ``data`` once its
+    regularized copy exists, so a working frame that owns its arrays is
+    never held twice; ``data`` must then not be used afterwards.
+    """
+    if interval is None:
+        interval = infer_sampling_interval(data['timestamp'])
+    if interval is None:
+        return data, None
+    
+    ts_ns = _timestamp_ns_array(data['timestamp'])
+    
+    # Missing readings in each gap, rounded to whole intervals, computed in place
+    expanded = np.diff(ts_ns)
+    expanded += interval.value // 2
+    expanded //= interval.value
+    expanded -= 1
+    np.maximum(expanded, 0, out=expanded)
+    
+    # Gaps recorded as outages rather than expanded
+    if max_gap is not None:
+        outage_gaps = expanded > max_gap
+        expanded[outage_gaps] = 0
+    else:
+        outage_gaps = np.zeros(len(expanded), dtype=bool)
+    limit = MAX_INSERTED_ROWS_FACTOR * len(data)
+    if expanded.sum() > limit:
+        longest = np.argsort(-expanded, kind='stable')
+        dropped = int(np.searchsorted(np.cumsum(expanded[longest]), expanded.sum() - limit)) + 1
+        outage_gaps[longest[:dropped]] = True
+        expanded[longest[:dropped]] = 0
+        del longest
+    
+    after_outage = np.concatenate([[False], outage_gaps])
+    del outage_gaps
+    if not after_outage.any():
+        after_outage = None
+    
+    total = int(expanded.sum())
+    if total == 0:
+        if after_outage is not None:
+            data = data if release else data.copy(deep=False)
+            data[OUTAGE_COLUMN] = after_outage
+        return data, interval
+    
+    # Position of every reading in the regularized frame: its row plus the
+    # readings inserted before it, summed in place as gap sizes plus one
+    positions = np.empty(len(data), dtype=np.int64)
+    positions[0] = 0
+    expanded += 1
+    np.cumsum(expanded, out=positions[1:])
+    expanded -= 1
+    
+    # Position of every missing reading: gap start + k intervals, k = 1..count
+    gaps = np.flatnonzero(expanded)
+    counts = expanded[gaps]
+    del expanded
+    k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    new_positions = np.repeat(positions[gaps], counts) + k
+    new_ns = np.repeat(ts_ns[gaps], counts) + k * interval.value
+    del gaps, counts, k
+    
+    # Build the regularized frame a column at a time, so at most one column
+    # is being copied on top of the input at once; the frame is made from a
+    # dict at the end, since assigning a column to a frame copies it
+    length = len(data) + total
+    regular = {}
+    
+    grid_ns = np.empty(length, dtype=np.int64)
+    grid_ns[positions] = ts_ns
+    grid_ns[new_positions] = new_ns
+    del new_ns, ts_ns
+    timestamps = pd.DatetimeIndex(grid_ns.view('datetime64[ns]'))
+    # The dtype holds the time zone; the .dt accessor would keep the column alive in a reference cycle
+    tz = getattr(data['timestamp'].dtype, 'tz', None)
+    if tz is not None:
+        timestamps = timestamps.tz_localize('UTC').tz_convert(tz)
+    regular['timestamp'] = timestamps.array
+    del timestamps, grid_ns
+    
+    columns = data.columns.tolist()
+    if after_outage is not None and OUTAGE_COLUMN not in columns:
+        columns.append(OUTAGE_COLUMN)
+    
+    # Row of the input each row comes from, -1 for inserted rows; only
+    # needed for columns that are not float64
+    source = None
+    
+    for col in columns:
+        if col == OUTAGE_COLUMN:
+            outage = np.zeros(length, dtype=bool)
+            outage[positions] = data[col].to_numpy(dtype=bool) if after_outage is None else after_outage
+            regular[col] = outage
+        elif col != 'timestamp' and data[col].dtype == np.float64:
+            # Missing readings are empty
+            values = np.empty(length, dtype=np.float64)
+            values[positions] = data[col].to_numpy()
+            values[new_positions] = np.nan
+            regular[col] = values
+        elif col != 'timestamp':
+            # Integer and boolean columns are widened as by concat
+            if source is None:
+                source = np.full(length, -1, dtype=np.int64)
+                source[positions] = np.arange(len(data))
+            regular[col] = _take_values(data[col], source, allow_fill=True)
+        if release and col in data.columns:
+            del data[col]
+    
+    return pd.DataFrame(regular, copy=False), interval
+
+def _missing_runs(missing: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and (exclusive) end position of every run of consecutive missing values."""
+    # np.diff of a boolean array marks where it changes, without widening it
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], missing, [False]])))
+    return edges[::2], edges[1::2]
+
+def _interpolate_runs(ts_ns: np.ndarray, values: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                      targets: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation in time at the target positions, which lie in the given runs.
+    
+    Each target is interpolated between the readings just before and after
+    its run, which are the readings np.interp would use, so only the run
+    boundaries are gathered rather than every known reading. A run at
+    either end of the data takes the nearest reading, as np.interp does.
+    """
+    run = np.searchsorted(starts, targets, side='right') - 1
+    left = starts[run] - 1
+    right = ends[run]
+    left = np.where(left < 0, right, left)
+    right = np.where(right >= len(values), left, right)
+    
+    span = (ts_ns[right] - ts_ns[left]).astype(np.float64)
+    offset = (ts_ns[targets] - ts_ns[left]).astype(np.float64)
+    weight = np.divide(offset, span, out=np.zeros(len(targets)), where=span != 0)
+    return values[left] + weight * (values[right] - values[left])
+
+def fill_gaps(data: pd.DataFrame, columns: List[str], interval: Optional[pd.Timedelta] = None,
+              method: str = 'linear', max_gap: int = MAX_INTERPOLATION_GAP) -> List[np.ndarray]:
+    """
+    Fill missing numeric values in place, interpolating short gaps.
+    
+    Runs of up to ``max_gap`` missing readings are filled by linear
+    interpolation in time, or with ``method='seasonal'`` by the reading one
+    week earlier where that exists (linear otherwise). Longer runs, and
+    values that cannot be interpolated, are filled with the column median.
+    Rows in a long run of missing consumption readings are flagged in the
+    ``is_outage`` column, in addition to any outages regularize_time_grid
+    recorded there. Only columns that hold missing values are replaced.
+    
+    Parameters:
+        data (DataFrame): Dataset on a regular time grid
+        columns (list): Numeric columns to fill
+        interval (Timedelta, optional): Sampling interval, needed for seasonal filling
+        method (str): 'linear' or 'seasonal'
+        max_gap (int): Longest run of missing readings that is interpolated
+        
+    Returns:
+        list: One boolean array per column, up to 64, marking the filled values
+    """
+    return _fill_gaps(data, columns, interval, method, max_gap)
+
+
+def _fill_gaps(data: pd.DataFrame, columns: List[str], interval: Optional[pd.Timedelta] = None,
+               method: str = 'linear', max_gap: int = MAX_INTERPOLATION_GAP,
+               in_place: Iterable[str] = ()) -> List[np.ndarray]:
+    """
+    fill_gaps, writing straight into the arrays of the ``in_place`` columns.
+    
+    Those must be float64 columns whose arrays no other frame shares, such as
+    columns preprocess_data rebuilt; other columns are replaced by filled copies.
+    """
+    if method not in ('linear', 'seasonal'):
+        raise ValueError(f"Unknown fill method: {method}")
+    
+    ts_ns = _timestamp_ns_array(data['timestamp'])
+    
+    # Seasonal filling needs an interval that divides a week evenly, so
+    # readings one week apart can fall on the same grid
+    week = pd.Timedelta(weeks=1).value
+    seasonal_fill = (method == 'seasonal' and interval is not None and interval.value > 0
+                     and week % interval.value == 0)
+    
+    flags = []
+    if OUTAGE_COLUMN in data.columns:
+        outage = data[OUTAGE_COLUMN].to_numpy(dtype=bool, na_value=False).copy()
+    else:
+        outage = np.zeros(len(data), dtype=bool)
+    for col in columns:
+        values = data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(values)
+        
+        if missing.any():
+            starts, ends = _missing_runs(missing)
+            
+            # Runs too long to interpolate, marked by +1 at their start and -1 at their end
+            long_runs = ends - starts > max_gap
+            edges = np.zeros(len(values) + 1, dtype=np.int8)
+            edges[starts[long_runs]] = 1
+            edges[ends[long_runs]] = -1
+            in_long_run = np.cumsum(edges, dtype=np.int8)[:-1].astype(bool)
+            del edges
+            short = missing & ~in_long_run
+            known = len(values) - np.count_nonzero(missing)
+            # The median for long runs is taken before any value is filled
+            median = None
+            if in_long_run.any() or known < 2:
+                median = np.nanmedian(values) if known else 0.0
+            # Values converted from another dtype are already a private copy
+            shared = data[col].dtype == np.float64
+            filled = values.copy() if shared and col not in in_place else values
+            
+            if seasonal_fill:
+                # The reading at exactly one week earlier, found by time since
+                # long gaps that were not expanded shift row positions
+                targets = ts_ns[short] - week
+                source = np.searchsorted(ts_ns, targets)
+                np.minimum(source, len(ts_ns) - 1, out=source)
+                usable = ts_ns[source] == targets
+                seasonal = np.full(source.shape, np.nan)
+                seasonal[usable] = values[source[usable]]
+                filled[short] = seasonal
+                del targets, source, usable, seasonal
+            
+            pending = np.flatnonzero(short & np.isnan(filled))
+            if len(pending) > 0 and known >= 2:
+                filled[pending] = _interpolate_runs(ts_ns, values, starts, ends, pending)
+            
+            if median is not None:
+                filled[np.isnan(filled)] = median
+            
+            if not shared or col not in in_place:
+                data[col] = filled
+            del filled
+            if col == 'consumption':
+                outage |= in_long_run
+        
+        if len(flags) < 64:
+            flags.append(missing)
+    
+    data[OUTAGE_COLUMN] = outage
+    return flags
+
+def _add_time_features(data: pd.DataFrame):
+    """Add hour, day of week, weekend and business hours columns, in place."""
+    timestamps = data['timestamp'].dt
+    hour = timestamps.hour.to_numpy().astype(np.int8)
+    day_of_week = timestamps.dayofweek.to_numpy().astype(np.int8)
+    
+    data['hour'] = hour
+    data['day_of_week'] = day_of_week
+    data['is_weekend'] = day_of_week >= 5
+    data['is_business_hours'] = (hour >= 8) & (hour <= 18) & (day_of_week < 5)
+
+# Name of the column packing the <col>_was_missing indicators as bits
+MISSING_MASK_COLUMN = 'missing_mask'
+
+# Largest relative error accepted when storing floats as float32
+FLOAT32_RTOL = 1e-6
+
+def _smallest_int_dtype(values: np.ndarray):
+    """Smallest signed integer dtype that holds every value, or None for an empty array."""
+    if values.size == 0:
+        return None
+    low, high = values.min(), values.max()
+    for dtype in [np.int8, np.int16, np.int32]:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return None
+
+def pack_bitmask(flags: List[np.ndarray]) -> np.ndarray:
+    """
+    Pack up to 64 boolean arrays into one array of bitmasks.
+    
+    Parameters:
+        flags (list): Boolean arrays of equal length; array ``i`` becomes bit ``i``
+        
+    Returns:
+        ndarray: Bitmasks in the smallest unsigned type with enough bits
+    """
+    dtype = next(dtype for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]
+                 if np.iinfo(dtype).bits >= len(flags))
+    mask = np.zeros(len(flags[0]) if flags else 0, dtype=dtype)
+    for bit, flag in enumerate(flags):
+        mask |= flag.astype(dtype) << dtype(bit)
+    return mask
+
+def pack_missing_indicators(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pack the ``<col>_was_missing`` indicator columns into one bitmask column.
+    
+    Bit ``i`` of ``missing_mask`` is set when the ``i``-th column listed in
+    ``data.attrs['missing_mask_columns']`` was missing in that row. The mask
+    uses the smallest unsigned type with enough bits; indicators beyond 64
+    columns are kept as boolean columns.
+    
+    Parameters:
+        data (DataFrame): Dataset with missing value indicator columns
+        
+    Returns:
+        DataFrame: The dataset with the indicators packed
+    """
+    indicators = [col for col in data.columns if col.endswith('_was_missing')][:64]
+    if not indicators:
+        return data
+    
+    mask = pack_bitmask([data[col].to_numpy() != 0 for col in indicators])
+    
+    data = data.drop(columns=indicators)
+    data[MISSING_MASK_COLUMN] = mask
+    data.attrs['missing_mask_columns'] = [col[:-len('_was_missing')] for col in indicators]
+    return data
+
+# Columns recording how a row was processed or labelled, which are never features
+NON_FEATURE_COLUMNS = ['timestamp', 'is_anomaly', OUTAGE_COLUMN, MISSING_MASK_COLUMN]
+
+def numeric_feature_columns(data: pd.DataFrame) -> List[str]:
+    """
+    Numeric columns of a dataset that can be used as detection features.
+    
+    Labels, outage flags and missing value records (the packed mask and any
+    ``<col>_was_missing`` indicators) are left out, so a detector can neither
+    learn from the labels it is scored against nor from how gaps were filled.
+    
+    Parameters:
+        data (DataFrame): The dataset
+        
+    Returns:
+        list: Names of the feature columns
+    """
+    return [col for col in _numeric_columns(data)
+            if col not in NON_FEATURE_COLUMNS and not str(col).endswith('_was_missing')]
+
+def missing_indicator(data: pd.DataFrame, column: str) -> pd.Series:
+    """
+    Whether each value of a column was missing before it was filled.
+    
+    Works both on packed datasets and on ones that still hold a
+    ``<column>_was_missing`` indicator column.
+    
+    Parameters:
+        data (DataFrame): Processed dataset
+        column (str): Name of the original column
+        
+    Returns:
+        Series: Boolean indicator, all False if nothing was recorded
+    """
+    if f"{column}_was_missing" in data.columns:
+        return data[f"{column}_was_missing"].astype(bool)
+    
+    packed = data.attrs.get('missing_mask_columns', [])
+    if column not in packed or MISSING_MASK_COLUMN not in data.columns:
+        return pd.Series(False, index=data.index)
+    
+    mask = data[MISSING_MASK_COLUMN].to_numpy()
+    return pd.Series((mask >> mask.dtype.type(packed.index(column))) & 1 == 1, index=data.index)
+
+def compact_dtypes(data: pd.DataFrame, float_rtol: float = FLOAT32_RTOL) -> pd.DataFrame:
+    """
+    Store each column of a processed dataset in the smallest type that holds it.
+    
+    Float columns become float32 when every value survives the round trip
+    within ``float_rtol``, integer columns use the smallest of int8, int16
+    and int32 that fits, and missing value indicators are packed into a
+    bitmask with pack_missing_indicators.
+    
+    Parameters:
+        data (DataFrame): Processed dataset
+        float_rtol (float): Largest relative error accepted for float32
+        
+    Returns:
+        DataFrame: The dataset with compact column types
+    """
+    data = pack_missing_indicators(data)
+    
+    for col in data.columns:
+        if col == MISSING_MASK_COLUMN:
+            continue
+        dtype = data[col].dtype
+        if not isinstance(dtype, np.dtype):
+            # Leave extension types such as nullable integers alone
+            continue
+        values = data[col].to_numpy()
+        
+        if pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+            compact = values.astype(np.float32)
+            with np.errstate(over='ignore', invalid='ignore'):
+                fits = np.allclose(compact, values, rtol=float_rtol, atol=0, equal_nan=True)
+            if fits:
+                data[col] = compact
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            compact_dtype = _smallest_int_dtype(values)
+            if compact_dtype is not None and np.dtype(compact_dtype).itemsize < dtype.itemsize:
+                data[col] = values.astype(compact_dtype)
+    
+    return data
 
 def split_train_test(data, test_size=0.2):
     """
@@ -143,7 +732,7 @@ def normalize_features(train_data, test_data=None, columns=None):
     Parameters:
         train_data (DataFrame): Training data
         test_data (DataFrame): Test data (optional)
-        columns (list): Columns to normalize (if None, all numeric columns)
+        columns (list): Columns to normalize (if None, all numeric feature columns)
     
     Returns:
         tuple: (normalized_train, normalized_test, scaler)
@@ -153,11 +742,9 @@ def normalize_features(train_data, test_data=None, columns=None):
     # Clone the data
     train_normalized = train_data.copy()
     
-    # If no columns specified, use all numeric columns except 'is_anomaly'
+    # If no columns specified, use all numeric feature columns
     if columns is None:
-        columns = train_normalized.select_dtypes(include=[np.number]).columns.tolist()
-        if 'is_anomaly' in columns:
-            columns.remove('is_anomaly')
+        columns = numeric_feature_columns(train_normalized)
     
     # Initialize the scaler
     scaler = StandardScaler()
@@ -185,38 +772,274 @@ def prepare_features(data, feature_columns=None):
         ndarray: Feature matrix X
     """
     if feature_columns is None:
-        # Use all numeric columns except is_anomaly
-        feature_columns = data.select_dtypes(include=[np.number]).columns.tolist()
-        if 'is_anomaly' in feature_columns:
-            feature_columns.remove('is_anomaly')
+        # Use all numeric feature columns
+        feature_columns = numeric_feature_columns(data)
     
     # Extract features
     X = data[feature_columns].values
     
     return X
 
-def detect_csv_format(file_path: str) -> Dict[str, Any]:
+# File name endings accepted as (optionally compressed) CSV input
+SUPPORTED_CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.zip')
+
+# Leading bytes that identify each supported compression format
+COMPRESSION_SIGNATURES = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\xfd7zXZ\x00': 'xz',
+    b'PK\x03\x04': 'zip'
+}
+
+def is_supported_csv(filename: str) -> bool:
+    """
+    Check whether a file name is a CSV file or a compressed CSV file.
+    
+    Parameters:
+        filename (str): File name to check
+        
+    Returns:
+        bool: True if the file can be read as energy CSV data
+    """
+    return filename.lower().endswith(SUPPORTED_CSV_EXTENSIONS)
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """
+    Identify the compression format of a file from its first bytes.
+    
+    Parameters:
+        head (bytes): Leading bytes of the file
+        
+    Returns:
+        str: 'gzip', 'bz2', 'xz' or 'zip', or None for uncompressed data
+    """
+    for signature, compression in COMPRESSION_SIGNATURES.items():
+        if head.startswith(signature):
+            return compression
+    return None
+
+@contextmanager
+def open_energy_csv(source) -> Iterator[BinaryIO]:
+    """
+    Open a plain or compressed CSV file as a stream of decompressed bytes.
+    
+    The compression format is recognised from the leading bytes, not the
+    file name. Data is decompressed on the fly as it is read, so the
+    uncompressed file is never written to disk or held in memory. ZIP
+    archives yield their first CSV member and must be seekable.
+    
+    Parameters:
+        source (str or file-like): Path to the file, or a readable binary stream
+        
+    Yields:
+        Binary stream of the decompressed CSV data
+    """
+    owns_source = isinstance(source, (str, os.PathLike))
+    raw = open(source, 'rb') if owns_source else source
+    
+    try:
+        # Peek at the signature without consuming it
+        reader = raw if hasattr(raw, 'peek') else io.BufferedReader(raw)
+        compression = detect_compression(reader.peek(8)[:8])
+        
+        if compression == 'zip':
+            if not reader.seekable():
+                raise ValueError("ZIP archives cannot be streamed; upload them as a file instead.")
+            with zipfile.ZipFile(reader) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                csv_members = [info for info in members if info.filename.lower().endswith('.csv')]
+                if not members:
+                    raise ValueError("The ZIP archive does not contain any files.")
+                with archive.open((csv_members or members)[0]) as member:
+                    yield member
+        elif compression == 'gzip':
+            with gzip.GzipFile(fileobj=reader) as stream:
+                yield stream
+        elif compression == 'bz2':
+            with bz2.BZ2File(reader) as stream:
+                yield stream
+        elif compression == 'xz':
+            with lzma.LZMAFile(reader) as stream:
+                yield stream
+        else:
+            yield reader
+    finally:
+        if owns_source:
+            raw.close()
+
+# Number of values inspected when inferring a timestamp format
+TIMESTAMP_SAMPLE_SIZE = 200
+
+# Lower bound of epoch values in each unit (about 1973), checked from the largest unit down
+EPOCH_UNIT_THRESHOLDS = [('ns', 1e17), ('us', 1e14), ('ms', 1e11), ('s', 1e8)]
+
+# Earliest date, and latest years ahead of today, an unnamed column of epoch numbers may fall in
+EPOCH_PLAUSIBLE_START = pd.Timestamp('1990-01-01')
+EPOCH_PLAUSIBLE_YEARS_AHEAD = 1
+
+# Words in a column name that mark it as holding timestamps
+TIMESTAMP_NAME_WORDS = ['time', 'date', 'epoch', 'unix']
+
+def infer_timestamp_format(values) -> Dict[str, Optional[str]]:
+    """
+    Infer how a column of timestamps is encoded, from a sample of its values.
+    
+    Numbers (or digit strings) in a plausible range are treated as epoch
+    times, with the unit chosen by magnitude. Text is matched to an explicit
+    strftime format that parses every sampled value, preferring month-first
+    over day-first when both fit.
+    
+    Parameters:
+        values (Series): Raw timestamp values
+        
+    Returns:
+        dict: 'timestamp_format' (strftime format) or 'timestamp_unit'
+            ('s', 'ms', 'us' or 'ns'); both None if no encoding fits
+    """
+    from pandas.tseries.api import guess_datetime_format
+    
+    result = {'timestamp_format': None, 'timestamp_unit': None}
+    
+    # Sample evenly across the values so ambiguous day/month orders are more likely resolved
+    sample = pd.Series(values).dropna()
+    sample = sample.iloc[::max(len(sample) // TIMESTAMP_SAMPLE_SIZE, 1)].head(TIMESTAMP_SAMPLE_SIZE)
+    if sample.empty:
+        return result
+    
+    if pd.api.types.is_datetime64_any_dtype(sample):
+        return result
+    
+    # Epoch seconds, milliseconds, microseconds or nanoseconds
+    numbers = pd.to_numeric(sample, errors='coerce')
+    if numbers.notna().all():
+        magnitude = numbers.abs().median()
+        for unit, threshold in EPOCH_UNIT_THRESHOLDS:
+            if magnitude >= threshold:
+                result['timestamp_unit'] = unit
+                return result
+        if pd.api.types.is_numeric_dtype(sample):
+            return result
+    
+    # Explicit strftime format guessed from a few values, checked against the whole sample
+    text = sample.astype(str).str.strip()
+    candidates = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for value in text.head(20):
+            for dayfirst in [False, True]:
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt and fmt not in candidates:
+                    candidates.append(fmt)
+    
+    for fmt in candidates:
+        try:
+            pd.to_datetime(text, format=fmt)
+        except (ValueError, TypeError):
+            continue
+        result['timestamp_format'] = fmt
+        return result
+    
+    return result
+
+def _plausible_epoch_column(name, values, unit: str) -> bool:
+    """
+    Check that a numeric column inferred as epoch times is likely to hold timestamps.
+    
+    Large numbers such as cumulative meter readings in Wh also pass the
+    magnitude check of infer_timestamp_format, so the guess is only accepted
+    when the column name mentions a time or date, or the values increase
+    and fall between EPOCH_PLAUSIBLE_START and a year from now.
+    """
+    words = re.split(r'[^a-z0-9]+', str(name).lower())
+    if 'ts' in words or any(word in part for part in words for word in TIMESTAMP_NAME_WORDS):
+        return True
+    
+    numbers = pd.to_numeric(pd.Series(values).dropna(), errors='coerce')
+    if len(numbers) < 2 or numbers.isna().any() or not numbers.is_monotonic_increasing or numbers.nunique() < 2:
+        return False
+    
+    latest = pd.Timestamp.now() + pd.DateOffset(years=EPOCH_PLAUSIBLE_YEARS_AHEAD)
+    try:
+        bounds = pd.to_datetime([numbers.iloc[0], numbers.iloc[-1]], unit=unit)
+    except (OverflowError, ValueError):
+        return False
+    return EPOCH_PLAUSIBLE_START <= bounds[0] and bounds[1] <= latest
+
+def parse_timestamps(values, format_info: Optional[Dict[str, Any]] = None) -> pd.Series:
+    """
+    Convert raw timestamp values to datetimes using an explicit encoding.
+    
+    Values that are already datetimes are returned unchanged. The encoding is
+    taken from ``format_info`` (as stored by detect_csv_format) or inferred
+    from a sample, so pandas always uses its vectorized parser instead of
+    guessing per element.
+    
+    If a stored format stops matching, e.g. a day-first file whose first
+    rows looked month-first, the format is inferred again from these values
+    and saved back into ``format_info`` so later chunks use it directly.
+    Only if that fails too does parsing fall back to per-element inference.
+    
+    Parameters:
+        values (Series): Raw timestamp values
+        format_info (dict, optional): Holds 'timestamp_format' or 'timestamp_unit'
+        
+    Returns:
+        Series: Parsed timestamps
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    
+    if format_info is None or ('timestamp_format' not in format_info and 'timestamp_unit' not in format_info):
+        format_info = infer_timestamp_format(values)
+    
+    if format_info.get('timestamp_unit'):
+        return pd.to_datetime(pd.to_numeric(values), unit=format_info['timestamp_unit'])
+    
+    if format_info.get('timestamp_format'):
+        try:
+            return pd.to_datetime(values, format=format_info['timestamp_format'])
+        except ValueError:
+            encoding = infer_timestamp_format(values)
+            if encoding['timestamp_format'] in (None, format_info['timestamp_format']):
+                return pd.to_datetime(values, format='mixed')
+            format_info.update(encoding)
+            return parse_timestamps(values, format_info)
+    
+    return pd.to_datetime(values)
+
+def detect_csv_format(file_path: str, has_header: bool = True) -> Dict[str, Any]:
     """
     Detect the format of an energy-related CSV file.
     
+    Compressed files (gzip, bz2, xz or zip) are sniffed from a decompressed
+    sample of their first lines.
+    
     Parameters:
-        file_path (str): Path to the CSV file
+        file_path (str): Path to the CSV file, plain or compressed
+        has_header (bool): Whether the first row of the file holds column names
         
     Returns:
         dict: Dictionary containing format information
     """
     try:
-        # Read first few lines to detect format
-        with open(file_path, 'r', encoding='utf-8') as f:
-            sample_lines = [f.readline() for _ in range(10)]
+        # Read first few lines to detect format, decompressing only this sample
+        with open_energy_csv(file_path) as stream:
+            text = io.TextIOWrapper(stream, encoding='utf-8')
+            sample_lines = [text.readline() for _ in range(10)]
+            text.detach()
+        sample = ''.join(sample_lines)
         
         # Detect delimiter
         sniffer = csv.Sniffer()
-        dialect = sniffer.sniff(''.join(sample_lines))
+        dialect = sniffer.sniff(sample)
         delimiter = dialect.delimiter
         
-        # Try to read the file with pandas to detect columns
-        df_sample = pd.read_csv(file_path, nrows=5, delimiter=delimiter)
+        # Try to read the sample with pandas to detect columns
+        if has_header:
+            df_sample = pd.read_csv(io.StringIO(sample), nrows=5, delimiter=delimiter)
+        else:
+            df_sample = pd.read_csv(io.StringIO(sample), nrows=5, delimiter=delimiter, header=None)
+            df_sample.columns = [f'col_{i}' for i in range(len(df_sample.columns))]
         
         # Analyze columns
         columns = df_sample.columns.tolist()
@@ -232,13 +1055,17 @@ def detect_csv_format(file_path: str) -> Dict[str, Any]:
         # If no obvious timestamp column, try to detect based on content
         if timestamp_col is None:
             for col in columns:
-                # Try to convert to datetime
-                try:
-                    pd.to_datetime(df_sample[col])
+                encoding = infer_timestamp_format(df_sample[col])
+                if encoding['timestamp_format'] or (
+                        encoding['timestamp_unit']
+                        and _plausible_epoch_column(col, df_sample[col], encoding['timestamp_unit'])):
                     timestamp_col = col
                     break
-                except:
-                    continue
+        
+        # Infer the timestamp encoding once so every later parse can use it
+        timestamp_encoding = {'timestamp_format': None, 'timestamp_unit': None}
+        if timestamp_col is not None:
+            timestamp_encoding = infer_timestamp_format(df_sample[timestamp_col])
         
         # Detect energy consumption column
         consumption_col = None
@@ -273,7 +1100,8 @@ def detect_csv_format(file_path: str) -> Dict[str, Any]:
             'temperature_column': temperature_col,
             'humidity_column': humidity_col,
             'occupancy_column': occupancy_col,
-            'has_header': True  # Assuming all CSV files have headers
+            'has_header': has_header,
+            **timestamp_encoding
         }
     
     except Exception as e:
@@ -286,16 +1114,105 @@ def detect_csv_format(file_path: str) -> Dict[str, Any]:
             'temperature_column': None,
             'humidity_column': None,
             'occupancy_column': None,
-            'has_header': True
+            'has_header': has_header,
+            'timestamp_format': None,
+            'timestamp_unit': None
         }
 
-def read_energy_csv(file_path: str, format_info: Optional[Dict[str, Any]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+# Number of rows parsed per chunk during streaming ingestion
+DEFAULT_CHUNK_SIZE = 100000
+
+def _read_csv_kwargs(format_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the pandas read_csv arguments that match a detected CSV format.
+    
+    Parameters:
+        format_info (dict): Format information from detect_csv_format
+        
+    Returns:
+        dict: Keyword arguments for pd.read_csv
+    """
+    kwargs = {'delimiter': format_info['delimiter']}
+    if not format_info.get('has_header', True):
+        kwargs['header'] = None
+        kwargs['names'] = format_info['columns']
+    return kwargs
+
+def standardize_energy_frame(df: pd.DataFrame, format_info: Dict[str, Any], row_offset: int = 0,
+                             keep_extra_columns: bool = False) -> pd.DataFrame:
+    """
+    Convert raw CSV rows to the standardized timestamp/consumption layout.
+    
+    Parameters:
+        df (DataFrame): Raw rows as read from the CSV file
+        format_info (dict): Format information from detect_csv_format
+        row_offset (int): Position of the first row in the file, used to continue
+            generated timestamps across chunks
+        keep_extra_columns (bool): Whether to carry over columns that are not
+            mapped to a standard column
+        
+    Returns:
+        DataFrame: The standardized rows
+    """
+    standardized_df = pd.DataFrame(index=df.index)
+    
+    # Process timestamp column
+    if format_info['timestamp_column']:
+        try:
+            standardized_df['timestamp'] = parse_timestamps(df[format_info['timestamp_column']], format_info)
+        except Exception as e:
+            raise ValueError(f"Failed to convert timestamp column: {str(e)}")
+    else:
+        # If no timestamp column, create an index-based one
+        start = format_info.get('generated_start') or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        standardized_df['timestamp'] = pd.date_range(
+            start=pd.Timestamp(start) + pd.Timedelta(hours=row_offset),
+            periods=len(df),
+            freq='H'
+        )
+        
+    # Process consumption column
+    if format_info['consumption_column']:
+        try:
+            standardized_df['consumption'] = pd.to_numeric(df[format_info['consumption_column']])
+        except Exception as e:
+            raise ValueError(f"Failed to convert consumption column: {str(e)}")
+    else:
+        raise ValueError("No energy consumption column detected in the file")
+        
+    # Process optional columns
+    if format_info['temperature_column']:
+        standardized_df['temperature'] = pd.to_numeric(df[format_info['temperature_column']], errors='coerce')
+        
+    if format_info['humidity_column']:
+        standardized_df['humidity'] = pd.to_numeric(df[format_info['humidity_column']], errors='coerce')
+        
+    if format_info['occupancy_column']:
+        standardized_df['occupancy'] = pd.to_numeric(df[format_info['occupancy_column']], errors='coerce')
+    
+    if keep_extra_columns:
+        mapped = {format_info[key] for key in ['timestamp_column', 'consumption_column', 'temperature_column',
+                                                'humidity_column', 'occupancy_column'] if format_info.get(key)}
+        for col in df.columns:
+            if col not in mapped and col not in standardized_df.columns:
+                standardized_df[col] = df[col]
+    
+    return standardized_df.reset_index(drop=True)
+
+def read_energy_csv(file_path: str, format_info: Optional[Dict[str, Any]] = None,
+                    append_to: Optional[pd.DataFrame] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Read an energy-related CSV file and convert it to a standardized format.
     
+    Compressed files (gzip, bz2, xz or zip) are decompressed while reading.
+    In append mode the new rows are validated on their own and merged into
+    ``append_to`` in timestamp order; where both hold a row for the same
+    timestamp, the new row replaces the existing one.
+    
     Parameters:
         file_path (str): Path to the CSV file
         format_info (dict, optional): Format information from detect_csv_format
+        append_to (DataFrame, optional): Standardized data to append the new rows to
         
     Returns:
         tuple: (DataFrame with standardized columns, Format information dictionary)
@@ -309,45 +1226,25 @@ def read_energy_csv(file_path: str, format_info: Optional[Dict[str, Any]] = None
         if 'error' in format_info and not format_info['columns']:
             raise ValueError(f"Failed to detect CSV format: {format_info['error']}")
             
-        # Read the CSV file
-        df = pd.read_csv(file_path, delimiter=format_info['delimiter'])
+        # Read the CSV file, decompressing it on the fly
+        with open_energy_csv(file_path) as stream:
+            df = pd.read_csv(stream, **_read_csv_kwargs(format_info))
         
         # Create a standardized DataFrame
-        standardized_df = pd.DataFrame()
+        standardized_df = standardize_energy_frame(df, format_info)
         
-        # Process timestamp column
-        if format_info['timestamp_column']:
-            try:
-                standardized_df['timestamp'] = pd.to_datetime(df[format_info['timestamp_column']])
-            except Exception as e:
-                raise ValueError(f"Failed to convert timestamp column: {str(e)}")
-        else:
-            # If no timestamp column, create an index-based one
-            standardized_df['timestamp'] = pd.date_range(
-                start=datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
-                periods=len(df),
-                freq='H'
-            )
-            format_info['timestamp_column'] = 'Generated timestamp'
-            
-        # Process consumption column
-        if format_info['consumption_column']:
-            try:
-                standardized_df['consumption'] = pd.to_numeric(df[format_info['consumption_column']])
-            except Exception as e:
-                raise ValueError(f"Failed to convert consumption column: {str(e)}")
-        else:
-            raise ValueError("No energy consumption column detected in the file")
+        if append_to is not None:
+            from utils.dataset_store import merge_timestamped_rows
             
-        # Process optional columns
-        if format_info['temperature_column']:
-            standardized_df['temperature'] = pd.to_numeric(df[format_info['temperature_column']], errors='coerce')
+            # Only the new rows need validating; the existing data already passed
+            is_valid, message = validate_dataset(standardized_df, format_info)
+            if not is_valid:
+                raise ValueError(message)
             
-        if format_info['humidity_column']:
-            standardized_df['humidity'] = pd.to_numeric(df[format_info['humidity_column']], errors='coerce')
-            
-        if format_info['occupancy_column']:
-            standardized_df['occupancy'] = pd.to_numeric(df[format_info['occupancy_column']], errors='coerce')
+            standardized_df = merge_timestamped_rows(append_to, standardized_df)
+        
+        if not format_info['timestamp_column']:
+            format_info['timestamp_column'] = 'Generated timestamp'
             
         return standardized_df, format_info
         
@@ -356,9 +1253,193 @@ def read_energy_csv(file_path: str, format_info: Optional[Dict[str, Any]] = None
         empty_df = pd.DataFrame(columns=['timestamp', 'consumption'])
         return empty_df, {'error': str(e)}
 
+def iter_energy_csv_chunks(file_path: str, format_info: Optional[Dict[str, Any]] = None,
+                           chunksize: int = DEFAULT_CHUNK_SIZE,
+                           keep_extra_columns: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    Read an energy-related CSV file in fixed-size chunks of standardized rows.
+    
+    Each chunk is standardized and validated on its own, so only one chunk of
+    the file is held in memory at a time. Compressed files are decompressed
+    as the chunks are read. The source may also be a binary stream, such as
+    an upload that is still arriving; its format must then be passed in.
+    
+    Parameters:
+        file_path (str or file-like): Path to the CSV file, or a binary stream
+        format_info (dict, optional): Format information from detect_csv_format
+        chunksize (int): Number of rows per chunk
+        keep_extra_columns (bool): Whether to carry over unmapped columns
+        
+    Yields:
+        DataFrame: Standardized and validated chunk of rows
+    """
+    if format_info is None:
+        format_info = detect_csv_format(file_path)
+    
+    if 'error' in format_info and not format_info['columns']:
+        raise ValueError(f"Failed to detect CSV format: {format_info['error']}")
+    
+    # Keep generated timestamps continuous across chunks
+    if not format_info['timestamp_column'] and not format_info.get('generated_start'):
+        format_info['generated_start'] = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    
+    row_offset = 0
+    with open_energy_csv(file_path) as stream, \
+            pd.read_csv(stream, chunksize=chunksize, **_read_csv_kwargs(format_info)) as reader:
+        for raw_chunk in reader:
+            chunk = standardize_energy_frame(raw_chunk, format_info, row_offset=row_offset,
+                                             keep_extra_columns=keep_extra_columns)
+            
+            is_valid, message = validate_dataset(chunk, format_info)
+            if not is_valid:
+                raise ValueError(f"Rows {row_offset + 1}-{row_offset + len(chunk)}: {message}")
+            
+            row_offset += len(chunk)
+            yield chunk
+
+def ingest_energy_csv(file_path: str, output_path: str, format_info: Optional[Dict[str, Any]] = None,
+                      chunksize: int = DEFAULT_CHUNK_SIZE, min_rows: int = 0) -> Dict[str, Any]:
+    """
+    Stream an energy-related CSV file into a stored columnar dataset.
+    
+    The file is read, standardized, validated and written chunk by chunk, so
+    peak memory is bounded by the chunk size rather than the file size. Any
+    partially written output is removed if ingestion fails. Rows that arrive
+    out of time order, as in many meter exports, are sorted once the file is
+    written with an external merge sort, which keeps memory bounded by the
+    sort's run size rather than the file size. Once written, the
+    stored dataset is profiled and rolled up to coarser time resolutions so
+    its summary and charts never have to be recomputed from every row.
+    
+    Parameters:
+        file_path (str or file-like): Path to the source CSV file, or a binary
+            stream together with its format_info
+        output_path (str): Path of the stored dataset to write
+        format_info (dict, optional): Format information from detect_csv_format
+        chunksize (int): Number of rows per chunk
+        min_rows (int): Minimum number of rows the dataset must contain
+        
+    Returns:
+        dict: Summary with row_count, columns, start, end, format_info and profile
+    """
+    from utils.dataset_store import DatasetWriter, remove_stored_dataset, sort_stored_dataset
+    from utils.dataset_profile import build_dataset_profile
+    from utils.dataset_rollups import build_rollups
+    
+    if format_info is None:
+        format_info = detect_csv_format(file_path)
+    
+    row_count = 0
+    start = None
+    end = None
+    writer = DatasetWriter(output_path)
+    
+    try:
+        with writer:
+            for chunk in iter_energy_csv_chunks(file_path, format_info, chunksize=chunksize,
+                                                keep_extra_columns=True):
+                writer.write(chunk)
+                
+                chunk_start = chunk['timestamp'].min()
+                chunk_end = chunk['timestamp'].max()
+                start = chunk_start if start is None or chunk_start < start else start
+                end = chunk_end if end is None or chunk_end > end else end
+                row_count += len(chunk)
+        
+        if row_count == 0:
+            raise ValueError("The uploaded file is empty.")
+        
+        if row_count < min_rows:
+            raise ValueError(f"Dataset contains too few rows (minimum {min_rows} required).")
+        
+        # Keep stored rows in time order so time windows are contiguous slices
+        sort_stored_dataset(output_path)
+        
+        profile = build_dataset_profile(output_path)
+        build_rollups(output_path)
+    
+    except Exception:
+        remove_stored_dataset(output_path)
+        raise
+    
+    if not format_info['timestamp_column']:
+        format_info['timestamp_column'] = 'Generated timestamp'
+    
+    return {
+        'row_count': row_count,
+        'columns': writer.columns,
+        'start': start,
+        'end': end,
+        'format_info': format_info,
+        'profile': profile
+    }
+
+def append_energy_csv(file_path: str, dataset_path: str, profile: Optional[Dict[str, Any]] = None,
+                      format_info: Optional[Dict[str, Any]] = None,
+                      chunksize: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Append the rows of an energy-related CSV file to a stored columnar dataset.
+    
+    Only the new rows are standardized and validated, a chunk at a time, and
+    each chunk is handed on as it is read, so the file is never held in
+    memory at once. They are merged into the stored data in timestamp order,
+    replacing stored rows that have the same timestamp. When every new row
+    is later than the stored data the existing profile is updated from a
+    profile of the new rows alone; otherwise the merged dataset is profiled
+    again.
+    
+    Parameters:
+        file_path (str): Path to the CSV file with the new rows
+        dataset_path (str): Path of the stored dataset to append to
+        profile (dict, optional): Current profile of the stored dataset
+        format_info (dict, optional): Format information from detect_csv_format
+        chunksize (int): Number of rows per chunk
+        
+    Returns:
+        dict: Summary with row_count, added, replaced, start, end,
+            positions_changed, replaced_timestamps, format_info and profile;
+            see append_stored_dataset
+    """
+    from utils.dataset_store import append_stored_dataset
+    from utils.dataset_profile import build_dataset_profile, merge_dataset_profiles, PROFILE_VERSION
+    from utils.dataset_rollups import build_rollups
+    
+    if format_info is None:
+        format_info = detect_csv_format(file_path)
+    
+    chunks = iter_energy_csv_chunks(file_path, format_info, chunksize=chunksize, keep_extra_columns=True)
+    first_chunk = next((chunk for chunk in chunks if len(chunk)), None)
+    if first_chunk is None:
+        raise ValueError("The uploaded file is empty.")
+    
+    result = append_stored_dataset(dataset_path, itertools.chain([first_chunk], chunks))
+    
+    if (profile is not None and profile.get('version') == PROFILE_VERSION
+            and result['in_order'] and not result['replaced']):
+        profile = merge_dataset_profiles(profile, result['first_new_row'], dataset_path)
+    else:
+        profile = build_dataset_profile(dataset_path)
+    
+    build_rollups(dataset_path)
+    
+    if not format_info['timestamp_column']:
+        format_info['timestamp_column'] = 'Generated timestamp'
+    
+    return {
+        'row_count': result['row_count'],
+        'added': result['added'],
+        'replaced': result['replaced'],
+        'start': result['start'],
+        'end': result['end'],
+        'positions_changed': result['positions_changed'],
+        'replaced_timestamps': result['replaced_timestamps'],
+        'format_info': format_info,
+        'profile': profile
+    }
+
 def list_energy_csv_files(directory: str) -> List[Dict[str, str]]:
     """
-    List all CSV files in a directory that might contain energy-related data.
+    List all CSV files, plain or compressed, in a directory that might contain energy-related data.
     
     Parameters:
         directory (str): Directory path to search
@@ -370,7 +1451,7 @@ def list_energy_csv_files(directory: str) -> List[Dict[str, str]]:
     
     try:
         for filename in os.listdir(directory):
-            if filename.lower().endswith('.csv'):
+            if is_supported_csv(filename):
                 file_path = os.path.join(directory, filename)
                 
                 # Get basic file info
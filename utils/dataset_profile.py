@@ -0,0 +1,528 @@
+"""
+Dataset profiling for the Energy Anomaly Detection System.
+
+A profile summarizes a stored dataset: per-column summary statistics, null
+counts, histograms, time coverage and a small downsampled series. It is
+computed once when a dataset is ingested and kept in the dataset's metadata,
+so preview and insights pages can be rendered without reading the data file.
+The fine histograms used to merge profiles on append are kept in a sidecar
+file next to the dataset rather than in the metadata.
+"""
+import os
+import json
+import math
+from collections import Counter
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from utils.dataset_store import iter_stored_dataset
+
+# Bumped whenever the layout of a profile changes, so older profiles are rebuilt
+PROFILE_VERSION = 3
+
+# Number of histogram bins stored per numeric column
+HISTOGRAM_BINS = 30
+
+# Fine bins per stored histogram bin, used to approximate the median
+MEDIAN_RESOLUTION = 64
+
+# Suffix of the sidecar holding the fine histograms of a stored dataset
+FINE_HISTOGRAM_SUFFIX = '.histograms.json'
+
+# Maximum number of points kept in the downsampled series
+SERIES_POINTS = 500
+
+# Number of leading rows kept for previews
+PREVIEW_ROWS = 10
+
+# Number of distinct timestamp intervals tracked when inferring the sampling interval
+MAX_TRACKED_INTERVALS = 64
+
+
+def _json_float(value) -> Optional[float]:
+    """Convert a number to a JSON-safe float, mapping NaN and infinities to None."""
+    if value is None:
+        return None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _json_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convert rows to JSON-safe records with readable timestamps."""
+    records = df.copy()
+    for col in records.columns:
+        if pd.api.types.is_datetime64_any_dtype(records[col]):
+            records[col] = records[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    records = records.astype(object).where(records.notna(), None)
+    return [{col: (_json_float(value) if isinstance(value, (float, np.floating)) else value)
+             for col, value in row.items()}
+            for row in records.to_dict('records')]
+
+
+class _NumericAccumulator:
+    """Running count, mean, variance, range and histogram of one numeric column."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.fine_counts = None
+
+    def update_moments(self, values: np.ndarray):
+        """Merge the moments of a batch of non-null values (Chan et al.)."""
+        if len(values) == 0:
+            return
+        count = len(values)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+        batch_min, batch_max = float(values.min()), float(values.max())
+        self.min = batch_min if self.min is None else min(self.min, batch_min)
+        self.max = batch_max if self.max is None else max(self.max, batch_max)
+
+    def update_histogram(self, values: np.ndarray):
+        """Add a batch of non-null values to the fine histogram."""
+        if self.count == 0:
+            return
+        if self.fine_counts is None:
+            self.fine_counts = np.zeros(HISTOGRAM_BINS * MEDIAN_RESOLUTION, dtype=np.int64)
+        counts, _ = np.histogram(values, bins=len(self.fine_counts), range=self._range())
+        self.fine_counts += counts
+
+    def merge(self, other: '_NumericAccumulator'):
+        """
+        Merge another accumulator into this one.
+
+        Both fine histograms are re-binned onto the combined value range by
+        bin centre, so the merged median stays within one fine bin width of
+        the combined range.
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return
+
+        histograms = [(acc._range(), acc.fine_counts) for acc in (self, other) if acc.fine_counts is not None]
+
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if histograms:
+            bins = HISTOGRAM_BINS * MEDIAN_RESOLUTION
+            low, high = self._range()
+            merged = np.zeros(bins, dtype=np.int64)
+            for (old_low, old_high), counts in histograms:
+                centres = old_low + (np.arange(bins) + 0.5) * (old_high - old_low) / bins
+                target = np.clip(((centres - low) / (high - low) * bins).astype(int), 0, bins - 1)
+                merged += np.bincount(target, weights=counts, minlength=bins).astype(np.int64)
+            self.fine_counts = merged
+
+    @classmethod
+    def from_summary(cls, summary: Dict[str, Any],
+                     fine_counts: Optional[np.ndarray] = None) -> '_NumericAccumulator':
+        """
+        Rebuild an accumulator from the column summary stored in a profile.
+
+        Without the column's fine histogram, each display histogram bin is
+        placed on its centre fine bin, which keeps merged medians within half
+        a display bin.
+        """
+        accumulator = cls()
+        accumulator.count = summary['count']
+        accumulator.mean = summary['mean'] or 0.0
+        accumulator.m2 = (summary['std'] or 0.0) ** 2 * max(summary['count'] - 1, 0)
+        accumulator.min = summary['min']
+        accumulator.max = summary['max']
+        if fine_counts is not None and len(fine_counts) == HISTOGRAM_BINS * MEDIAN_RESOLUTION:
+            accumulator.fine_counts = np.asarray(fine_counts, dtype=np.int64)
+        elif summary.get('histogram'):
+            accumulator.fine_counts = np.zeros(HISTOGRAM_BINS * MEDIAN_RESOLUTION, dtype=np.int64)
+            accumulator.fine_counts[MEDIAN_RESOLUTION // 2::MEDIAN_RESOLUTION] = summary['histogram']['counts']
+        return accumulator
+
+    def _range(self):
+        """Histogram range, widened for constant columns."""
+        if self.min == self.max:
+            return self.min - 0.5, self.max + 0.5
+        return self.min, self.max
+
+    def median(self) -> Optional[float]:
+        """Median interpolated within the fine histogram bin that holds it."""
+        if self.count == 0 or self.fine_counts is None:
+            return None
+        if self.min == self.max:
+            return self.min
+
+        low, high = self._range()
+        width = (high - low) / len(self.fine_counts)
+        cumulative = np.cumsum(self.fine_counts)
+        half = self.count / 2
+        i = int(np.searchsorted(cumulative, half))
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (half - before) / self.fine_counts[i] if self.fine_counts[i] else 0.0
+        return low + (i + fraction) * width
+
+    def summary(self) -> Dict[str, Any]:
+        """Summary statistics and display histogram of the column."""
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+        summary = {
+            'count': self.count,
+            'min': _json_float(self.min),
+            'max': _json_float(self.max),
+            'mean': _json_float(self.mean) if self.count else None,
+            'median': _json_float(self.median()),
+            'std': _json_float(std),
+            'histogram': None
+        }
+        if self.fine_counts is not None:
+            low, high = self._range()
+            summary['histogram'] = {
+                'edges': np.linspace(low, high, HISTOGRAM_BINS + 1).tolist(),
+                'counts': self.fine_counts.reshape(HISTOGRAM_BINS, MEDIAN_RESOLUTION).sum(axis=1).tolist()
+            }
+        return summary
+
+
+def fine_histogram_path(file_path: str) -> str:
+    """
+    Path of the fine histogram sidecar of a dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        str: Path of the sidecar file
+    """
+    return f"{file_path}{FINE_HISTOGRAM_SUFFIX}"
+
+
+def _save_fine_histograms(file_path: str, accumulators: Dict[str, '_NumericAccumulator']):
+    """Write the fine histogram of each numeric column next to a dataset file."""
+    histograms = {col: acc.fine_counts.tolist() for col, acc in accumulators.items()
+                  if acc.fine_counts is not None}
+    with open(fine_histogram_path(file_path), 'w') as f:
+        json.dump({'version': PROFILE_VERSION, 'columns': histograms}, f)
+
+
+def _load_fine_histograms(file_path: str) -> Dict[str, np.ndarray]:
+    """Fine histograms stored next to a dataset file, or an empty dict if there are none."""
+    path = fine_histogram_path(file_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        stored = json.load(f)
+    if stored.get('version') != PROFILE_VERSION:
+        return {}
+    return {col: np.array(counts, dtype=np.int64) for col, counts in stored['columns'].items()}
+
+
+def _iter_source(source, columns: Optional[List[str]] = None, start: int = 0) -> Iterator[pd.DataFrame]:
+    """Batches of a stored dataset from row ``start`` on, or a single in-memory frame."""
+    if isinstance(source, pd.DataFrame):
+        yield source if columns is None else source[columns]
+    else:
+        yield from iter_stored_dataset(source, columns=columns, start=start)
+
+
+def build_dataset_profile(source) -> Dict[str, Any]:
+    """
+    Compute the profile of a stored dataset or an in-memory frame.
+
+    The dataset is streamed twice in batches, so memory stays bounded by the
+    batch size: the first pass collects counts, moments, ranges and the
+    timestamp interval, the second fills histograms and the downsampled
+    series. The median is approximated from a histogram with
+    ``HISTOGRAM_BINS * MEDIAN_RESOLUTION`` bins; for a stored dataset this
+    fine histogram is written to the sidecar at ``fine_histogram_path``.
+
+    Parameters:
+        source: Path to the stored dataset, or a standardized DataFrame
+
+    Returns:
+        dict: The dataset profile, safe to store as JSON
+    """
+    profile, accumulators = _profile_with_accumulators(source)
+    if not isinstance(source, pd.DataFrame):
+        _save_fine_histograms(source, accumulators)
+    return profile
+
+
+def _profile_with_accumulators(source, first_row: int = 0):
+    """Profile of a frame, or of a stored dataset from ``first_row`` on, with each numeric accumulator."""
+    columns = None
+    dtypes = {}
+    numeric_cols = []
+    null_counts = Counter()
+    accumulators = {}
+    row_count = 0
+    memory_usage = 0
+    head = []
+
+    # Timestamp coverage
+    start = end = previous_ts = None
+    is_sorted = True
+    intervals = Counter()
+
+    # First pass: counts, moments and timestamp coverage
+    for chunk in _iter_source(source, start=first_row):
+        if columns is None:
+            columns = chunk.columns.tolist()
+            dtypes = {col: str(chunk[col].dtype) for col in columns}
+            numeric_cols = [col for col in columns
+                            if col != 'timestamp' and pd.api.types.is_numeric_dtype(chunk[col])]
+            accumulators = {col: _NumericAccumulator() for col in numeric_cols}
+            head = _json_records(chunk.head(PREVIEW_ROWS))
+
+        row_count += len(chunk)
+        memory_usage += int(chunk.memory_usage(deep=True, index=False).sum())
+        null_counts.update(chunk.isna().sum().to_dict())
+
+        for col in numeric_cols:
+            values = chunk[col].to_numpy(dtype='float64')
+            accumulators[col].update_moments(values[~np.isnan(values)])
+
+        if 'timestamp' in chunk.columns:
+            timestamps = chunk['timestamp'].dropna()
+            if len(timestamps):
+                ns = timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+                if previous_ts is not None:
+                    ns = np.concatenate([[previous_ts], ns])
+                diffs = np.diff(ns)
+                is_sorted = is_sorted and bool((diffs >= 0).all())
+                intervals.update(dict(zip(*np.unique(diffs[diffs > 0], return_counts=True))))
+                intervals = Counter(dict(intervals.most_common(MAX_TRACKED_INTERVALS)))
+                previous_ts = int(ns[-1])
+
+                chunk_start, chunk_end = timestamps.min(), timestamps.max()
+                start = chunk_start if start is None or chunk_start < start else start
+                end = chunk_end if end is None or chunk_end > end else end
+
+    columns = columns or []
+
+    # Second pass: histograms and a downsampled series of bucket means
+    step = max(-(-row_count // SERIES_POINTS), 1)
+    buckets = -(-row_count // step) if row_count else 0
+    series_sums = {col: np.zeros(buckets) for col in numeric_cols}
+    series_counts = {col: np.zeros(buckets) for col in numeric_cols}
+    series_ts = np.full(buckets, np.iinfo(np.int64).min, dtype=np.int64)
+    has_series = 'timestamp' in columns and buckets > 0
+
+    offset = 0
+    if numeric_cols:
+        read_cols = numeric_cols + (['timestamp'] if has_series else [])
+        for chunk in _iter_source(source, columns=read_cols, start=first_row):
+            positions = np.arange(offset, offset + len(chunk))
+            bucket_ids = positions // step
+
+            for col in numeric_cols:
+                values = chunk[col].to_numpy(dtype='float64')
+                present = ~np.isnan(values)
+                accumulators[col].update_histogram(values[present])
+                if has_series:
+                    series_sums[col] += np.bincount(bucket_ids[present], weights=values[present], minlength=buckets)
+                    series_counts[col] += np.bincount(bucket_ids[present], minlength=buckets)
+
+            if has_series:
+                first_rows = positions % step == 0
+                series_ts[bucket_ids[first_rows]] = (
+                    chunk['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)[first_rows]
+                )
+
+            offset += len(chunk)
+
+    # Per-column statistics
+    column_stats = {}
+    for col in columns:
+        column_stats[col] = {
+            'dtype': dtypes[col],
+            'null_count': int(null_counts.get(col, 0)),
+            'numeric': col in accumulators
+        }
+        if col in accumulators:
+            column_stats[col].update(accumulators[col].summary())
+
+    # Time coverage and sampling interval
+    time_coverage = None
+    if start is not None:
+        interval_ns = intervals.most_common(1)[0][0] if intervals else None
+        time_coverage = _time_coverage(start, end, float(interval_ns) / 1e9 if interval_ns else None,
+                                       row_count, is_sorted)
+
+    # Downsampled series, skipping buckets without a timestamp
+    series = None
+    if has_series and numeric_cols:
+        valid = series_ts != np.iinfo(np.int64).min
+        series = {
+            'step': step,
+            'timestamps': [ts.isoformat() for ts in pd.to_datetime(series_ts[valid])],
+            'values': {
+                col: [_json_float(value) for value in np.divide(
+                    series_sums[col], series_counts[col],
+                    out=np.full(buckets, np.nan), where=series_counts[col] > 0
+                )[valid]]
+                for col in numeric_cols
+            }
+        }
+
+    profile = {
+        'version': PROFILE_VERSION,
+        'row_count': row_count,
+        'column_count': len(columns),
+        'columns': columns,
+        'numeric_columns': numeric_cols,
+        'null_count': int(sum(null_counts.values())),
+        'memory_usage': memory_usage,
+        'column_stats': column_stats,
+        'time_coverage': time_coverage,
+        'series': series,
+        'head': head
+    }
+    return profile, accumulators
+
+
+def _time_coverage(start: pd.Timestamp, end: pd.Timestamp, interval_seconds: Optional[float],
+                   row_count: int, is_sorted: bool) -> Dict[str, Any]:
+    """Time coverage entry of a profile."""
+    expected_rows = int((end - start).total_seconds() // interval_seconds) + 1 if interval_seconds else row_count
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'interval_seconds': interval_seconds,
+        'expected_rows': expected_rows,
+        'coverage': min(row_count / expected_rows, 1.0) if expected_rows else None,
+        'is_sorted': is_sorted
+    }
+
+
+def _halve_series(points: List[Optional[float]]) -> List[Optional[float]]:
+    """Average neighbouring points of a series, ignoring missing values."""
+    values = np.array([np.nan if value is None else value for value in points], dtype='float64')
+    if len(values) % 2:
+        values = np.append(values, np.nan)
+    pairs = values.reshape(-1, 2)
+    counts = (~np.isnan(pairs)).sum(axis=1)
+    means = np.divide(np.nansum(pairs, axis=1), counts, out=np.full(len(pairs), np.nan), where=counts > 0)
+    return [_json_float(value) for value in means]
+
+
+def merge_dataset_profiles(profile: Dict[str, Any], rows: Union[pd.DataFrame, int],
+                           file_path: str) -> Dict[str, Any]:
+    """
+    Update a dataset profile with rows appended after it.
+
+    Counts, moments, ranges and histograms are merged without reading the
+    profiled rows, and the two downsampled series are joined and thinned
+    back to ``SERIES_POINTS`` points. The fine histograms are read from and written
+    back to the dataset's sidecar. This is only valid when every appended
+    row is later than every profiled row and none replaced an existing row;
+    otherwise the dataset must be profiled again.
+
+    Parameters:
+        profile (dict): Profile of the stored rows
+        rows (pd.DataFrame or int): The appended rows, with the same columns,
+            or the position in the stored dataset of the first appended row;
+            the rows from there on are then streamed in batches
+        file_path (str): Path to the stored dataset
+
+    Returns:
+        dict: Profile of the combined dataset
+    """
+    if isinstance(rows, pd.DataFrame):
+        appended, appended_accumulators = _profile_with_accumulators(rows)
+    else:
+        appended, appended_accumulators = _profile_with_accumulators(file_path, first_row=rows)
+    if not appended['row_count']:
+        return profile
+    if not profile['row_count']:
+        _save_fine_histograms(file_path, appended_accumulators)
+        return appended
+
+    row_count = profile['row_count'] + appended['row_count']
+    fine_histograms = _load_fine_histograms(file_path)
+
+    column_stats = {}
+    accumulators = {}
+    for col in profile['columns']:
+        stats = dict(profile['column_stats'][col])
+        new_stats = appended['column_stats'].get(col, {})
+        stats['null_count'] += new_stats.get('null_count', 0)
+        if stats['numeric'] and col in appended_accumulators:
+            accumulator = _NumericAccumulator.from_summary(stats, fine_histograms.get(col))
+            accumulator.merge(appended_accumulators[col])
+            accumulators[col] = accumulator
+            stats.update(accumulator.summary())
+        column_stats[col] = stats
+    _save_fine_histograms(file_path, accumulators)
+
+    time_coverage = profile['time_coverage'] or appended['time_coverage']
+    if profile['time_coverage'] and appended['time_coverage']:
+        time_coverage = _time_coverage(
+            pd.Timestamp(profile['time_coverage']['start']),
+            pd.Timestamp(appended['time_coverage']['end']),
+            profile['time_coverage']['interval_seconds'] or appended['time_coverage']['interval_seconds'],
+            row_count,
+            profile['time_coverage']['is_sorted'] and appended['time_coverage']['is_sorted']
+        )
+
+    series = profile['series']
+    if series and appended['series']:
+        timestamps = series['timestamps'] + appended['series']['timestamps']
+        values = {col: series['values'][col] + appended['series']['values'].get(col, [])
+                  for col in series['values']}
+        step = series['step']
+        # Halve the series by averaging neighbouring points until it fits
+        while len(timestamps) > SERIES_POINTS:
+            timestamps = timestamps[::2]
+            values = {col: _halve_series(points) for col, points in values.items()}
+            step *= 2
+        series = {'step': step, 'timestamps': timestamps, 'values': values}
+
+    return {
+        **profile,
+        'row_count': row_count,
+        'null_count': profile['null_count'] + appended['null_count'],
+        'memory_usage': profile['memory_usage'] + appended['memory_usage'],
+        'column_stats': column_stats,
+        'time_coverage': time_coverage,
+        'series': series
+    }
+
+
+def dataset_profile(dataset) -> Dict[str, Any]:
+    """
+    Get the stored profile of a dataset record, building it if needed.
+
+    Datasets uploaded before profiles were introduced, or whose profile is
+    from an older layout, are profiled from their data file and the profile
+    is attached to the record's metadata. The caller commits the session.
+
+    Parameters:
+        dataset: Dataset record
+
+    Returns:
+        dict: The dataset profile
+    """
+    metadata = dataset.dataset_metadata or {}
+    profile = metadata.get('profile')
+
+    if profile is None or profile.get('version') != PROFILE_VERSION:
+        profile = build_dataset_profile(dataset.file_path)
+        # Reassign so the JSON column is flagged as modified
+        dataset.dataset_metadata = {**metadata, 'profile': profile}
+
+    return profile
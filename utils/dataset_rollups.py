@@ -0,0 +1,295 @@
+"""
+Multi-resolution rollups for the Energy Anomaly Detection System.
+
+Each stored dataset gets 15-minute, hourly, daily and monthly rollups with
+the sum, mean, minimum, maximum and count of every numeric column. They are
+computed once at ingest and stored next to the dataset, so charts of long
+time ranges read a few thousand buckets instead of every raw reading.
+"""
+import os
+import json
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.dataset_store import iter_stored_dataset, load_dataset, STORE_EXTENSION, DEFAULT_CHART_POINTS
+
+# Rollup resolutions from finest to coarsest: (name, pandas frequency, approximate bucket length)
+ROLLUP_RESOLUTIONS = [
+    ('15min', '15min', pd.Timedelta(minutes=15)),
+    ('hourly', 'h', pd.Timedelta(hours=1)),
+    ('daily', 'D', pd.Timedelta(days=1)),
+    ('monthly', 'MS', pd.Timedelta(days=30.44))
+]
+
+# Pandas frequency of each rollup
+ROLLUP_FREQUENCIES = {name: freq for name, freq, _ in ROLLUP_RESOLUTIONS}
+
+# Statistics stored per numeric column, as <column>_<stat>
+ROLLUP_STATS = ['sum', 'mean', 'min', 'max', 'count']
+
+# Chart width, in pixels, assumed when the caller does not know it
+DEFAULT_CHART_WIDTH = 1200
+
+# Suffix of the manifest listing the rollups stored for a dataset
+ROLLUP_MANIFEST_SUFFIX = '.rollups.json'
+
+
+def rollup_path(file_path: str, resolution: str) -> str:
+    """
+    Path of one rollup of a dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        resolution (str): Rollup name, e.g. 'hourly'
+
+    Returns:
+        str: Path of the rollup file
+    """
+    return f"{file_path}.rollup-{resolution}{STORE_EXTENSION}"
+
+
+def rollup_manifest_path(file_path: str) -> str:
+    """
+    Path of the rollup manifest of a dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        str: Path of the manifest file
+    """
+    return f"{file_path}{ROLLUP_MANIFEST_SUFFIX}"
+
+
+def _rollup_columns(data: pd.DataFrame) -> List[str]:
+    """Numeric, non-boolean columns of a frame other than the timestamp."""
+    return [col for col in data.columns
+            if col != 'timestamp' and pd.api.types.is_numeric_dtype(data[col])
+            and not pd.api.types.is_bool_dtype(data[col])]
+
+
+def _bucket_starts(timestamps: pd.Series, freq: str) -> pd.Series:
+    """Start of the bucket each timestamp falls in."""
+    if freq == 'MS':
+        return timestamps.dt.to_period('M').dt.start_time
+    return timestamps.dt.floor(freq)
+
+
+def _partial_rollup(chunk: pd.DataFrame, freq: str, columns: List[str]) -> pd.DataFrame:
+    """Sum, min, max and count of each column per bucket of one batch of rows."""
+    grouped = chunk[columns].groupby(_bucket_starts(chunk['timestamp'], freq).rename('timestamp'))
+    partial = grouped.agg(['sum', 'min', 'max', 'count'])
+    partial.columns = [f"{col}_{stat}" for col, stat in partial.columns]
+    return partial
+
+
+def _combine_partials(partials: List[pd.DataFrame], columns: List[str]) -> pd.DataFrame:
+    """Merge per-batch partial rollups whose buckets may straddle batch boundaries."""
+    combined = pd.concat(partials)
+    rules = {}
+    for col in columns:
+        rules.update({f"{col}_sum": 'sum', f"{col}_min": 'min', f"{col}_max": 'max', f"{col}_count": 'sum'})
+    rollup = combined.groupby(level=0).agg(rules)
+
+    for col in columns:
+        counts = rollup[f"{col}_count"]
+        rollup[f"{col}_mean"] = rollup[f"{col}_sum"] / counts.where(counts > 0)
+        rollup[f"{col}_sum"] = rollup[f"{col}_sum"].where(counts > 0)
+
+    ordered = [f"{col}_{stat}" for col in columns for stat in ROLLUP_STATS]
+    return rollup[ordered].reset_index()
+
+
+def rollup_frame(data: pd.DataFrame, resolution: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Roll up an in-memory frame to one resolution.
+
+    Parameters:
+        data (DataFrame): Rows with a datetime timestamp column
+        resolution (str): Rollup name, e.g. 'hourly'
+        columns (list, optional): Numeric columns to roll up (all numeric columns if None)
+
+    Returns:
+        DataFrame: One row per bucket, with the bucket start as timestamp
+    """
+    if columns is None:
+        columns = _rollup_columns(data)
+    return _combine_partials([_partial_rollup(data, ROLLUP_FREQUENCIES[resolution], columns)], columns)
+
+
+def build_rollups(file_path: str) -> Dict[str, Any]:
+    """
+    Compute and store every rollup of a stored dataset.
+
+    The dataset is streamed once in batches; each batch is rolled up to all
+    resolutions and the partial buckets are merged at the end, so memory is
+    bounded by the batch size plus the rollups themselves. A resolution is
+    only stored if it at least halves the number of rows; finer ones would
+    not make charts any cheaper.
+
+    Parameters:
+        file_path (str): Path to the columnar dataset file
+
+    Returns:
+        dict: The rollup manifest (resolutions stored, time range, row count)
+    """
+    partials = {name: [] for name, _, _ in ROLLUP_RESOLUTIONS}
+    columns = None
+    row_count = 0
+    start = end = None
+
+    for chunk in iter_stored_dataset(file_path):
+        if columns is None:
+            columns = _rollup_columns(chunk)
+        chunk = chunk[chunk['timestamp'].notna()]
+        if chunk.empty:
+            continue
+
+        row_count += len(chunk)
+        chunk_start, chunk_end = chunk['timestamp'].min(), chunk['timestamp'].max()
+        start = chunk_start if start is None or chunk_start < start else start
+        end = chunk_end if end is None or chunk_end > end else end
+
+        for name, freq, _ in ROLLUP_RESOLUTIONS:
+            partials[name].append(_partial_rollup(chunk, freq, columns))
+
+    resolutions = []
+    for name, _, _ in ROLLUP_RESOLUTIONS:
+        path = rollup_path(file_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+        if not partials[name] or not columns:
+            continue
+        rollup = _combine_partials(partials[name], columns)
+        if len(rollup) * 2 <= row_count:
+            rollup.to_parquet(path, index=False)
+            resolutions.append(name)
+
+    manifest = {
+        'resolutions': resolutions,
+        'columns': columns or [],
+        'row_count': row_count,
+        'start': start.isoformat() if start is not None else None,
+        'end': end.isoformat() if end is not None else None
+    }
+    with open(rollup_manifest_path(file_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    return manifest
+
+
+def load_rollup_manifest(file_path: str) -> Dict[str, Any]:
+    """
+    Load the rollup manifest of a stored dataset, building the rollups if needed.
+
+    Rollups are rebuilt when they are missing or older than the dataset
+    file, e.g. for datasets stored before rollups were introduced.
+
+    Parameters:
+        file_path (str): Path to the columnar dataset file
+
+    Returns:
+        dict: The rollup manifest
+    """
+    manifest_path = rollup_manifest_path(file_path)
+    if os.path.exists(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(file_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return build_rollups(file_path)
+
+
+def select_resolution(start, end, width: int = DEFAULT_CHART_WIDTH,
+                      available: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Choose the coarsest rollup that still gives a point per pixel.
+
+    Parameters:
+        start: Start of the time range
+        end: End of the time range
+        width (int): Chart width in pixels
+        available (list, optional): Rollups to choose from (all if None)
+
+    Returns:
+        str: Name of the rollup, or None if the raw readings are needed
+    """
+    if start is None or end is None:
+        return None
+
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for name, _, bucket in reversed(ROLLUP_RESOLUTIONS):
+        if (available is None or name in available) and span / bucket >= width:
+            return name
+    return None
+
+
+def _time_bounds(time_range: Optional[tuple], manifest: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Start and end of a requested range, with open ends taken from the dataset."""
+    start, end = time_range if time_range is not None else (None, None)
+    start = start if start is not None else manifest.get('start')
+    end = end if end is not None else manifest.get('end')
+    return start, end
+
+
+def _rollup_series(rollup: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Chart series of one column from a rollup: bucket mean plus its range."""
+    series = rollup[['timestamp', f"{column}_mean", f"{column}_min", f"{column}_max"]]
+    series = series.rename(columns={f"{column}_mean": column})
+    return series[series[column].notna()].reset_index(drop=True)
+
+
+def chart_series(dataset, column: str, time_range: Optional[tuple] = None,
+                 width: int = DEFAULT_CHART_WIDTH) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    Series of one column to plot over a time range at a given chart width.
+
+    The coarsest rollup with at least one bucket per pixel is used. Each
+    bucket is plotted at its mean, with its minimum and maximum in
+    ``<column>_min`` and ``<column>_max``. When no rollup is fine enough
+    the raw readings are returned, thinned to ``DEFAULT_CHART_POINTS``.
+
+    Parameters:
+        dataset: Dataset record with a ``file_path``, a path, or a DataFrame
+            already in memory
+        column (str): Numeric column to plot
+        time_range (tuple, optional): (start, end) timestamps, either may be None
+        width (int): Chart width in pixels
+
+    Returns:
+        tuple: (DataFrame with timestamp and column, rollup name or None for raw readings)
+    """
+    if isinstance(dataset, pd.DataFrame):
+        data = load_dataset(dataset, columns=['timestamp', column], time_range=time_range)
+        if data.empty:
+            return data, None
+        resolution = select_resolution(data['timestamp'].min(), data['timestamp'].max(), width)
+        if resolution is not None:
+            rollup = rollup_frame(data, resolution, columns=[column])
+            if len(rollup) * 2 <= len(data):
+                return _rollup_series(rollup, column), resolution
+        return load_dataset(data, sample=DEFAULT_CHART_POINTS), None
+
+    file_path = getattr(dataset, 'file_path', dataset)
+
+    if os.path.splitext(file_path)[1].lower() == STORE_EXTENSION:
+        manifest = load_rollup_manifest(file_path)
+        if column in manifest['columns']:
+            start, end = _time_bounds(time_range, manifest)
+            resolution = select_resolution(start, end, width, available=manifest['resolutions'])
+            if resolution is not None:
+                filters = []
+                if time_range is not None and time_range[0] is not None:
+                    filters.append(('timestamp', '>=', _bucket_floor(time_range[0], resolution)))
+                if time_range is not None and time_range[1] is not None:
+                    filters.append(('timestamp', '<=', pd.Timestamp(time_range[1])))
+                rollup = pd.read_parquet(rollup_path(file_path, resolution),
+                                         columns=['timestamp'] + [f"{column}_{stat}" for stat in ROLLUP_STATS],
+                                         filters=filters or None)
+                return _rollup_series(rollup, column), resolution
+
+    return load_dataset(dataset, columns=['timestamp', column], time_range=time_range,
+                        sample=DEFAULT_CHART_POINTS), None
+
+
+def _bucket_floor(timestamp, resolution: str) -> pd.Timestamp:
+    """Start of the bucket of a rollup that holds a timestamp."""
+    return _bucket_starts(pd.Series([pd.Timestamp(timestamp)]), ROLLUP_FREQUENCIES[resolution]).iloc[0]
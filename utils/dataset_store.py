@@ -0,0 +1,1207 @@
+"""
+Columnar storage for datasets in the Energy Anomaly Detection System.
+
+Uploaded datasets are persisted as Parquet files with a parsed datetime
+timestamp column, so readers get typed columns back without re-parsing text.
+"""
+import os
+import glob
+import json
+import bisect
+import itertools
+import weakref
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Any, Union
+
+from utils.cache import LRUCache
+from utils.data_processing import parse_timestamps
+
+# File extension used for stored datasets
+STORE_EXTENSION = '.parquet'
+
+# Rows per Parquet row group
+DEFAULT_ROW_GROUP_SIZE = 50000
+
+# Maximum number of points sent to a single chart series
+DEFAULT_CHART_POINTS = 5000
+
+# Suffix of the sidecar row index stored next to each dataset file
+ROW_INDEX_SUFFIX = '.rowindex.json'
+
+# Rows sorted in memory at a time when a stored dataset is sorted
+SORT_RUN_SIZE = 200000
+
+# Rows read from each sorted run at a time while the runs are merged
+MERGE_BATCH_SIZE = 8192
+
+
+def stored_dataset_path(directory: str, name: str) -> str:
+    """
+    Build the path of a stored dataset from an upload filename.
+
+    Parameters:
+        directory (str): Directory holding stored datasets
+        name (str): Base name for the file, with or without an extension
+
+    Returns:
+        str: Path of the columnar dataset file
+    """
+    stem = name.split('.', 1)[0] if '.' in name else name
+    return os.path.join(directory, f"{stem}{STORE_EXTENSION}")
+
+
+class DatasetWriter:
+    """
+    Incrementally write standardized chunks to a columnar dataset file.
+
+    The first chunk fixes the column layout: the timestamp is stored as a
+    datetime column, numeric columns as float64 and anything else as text.
+    Later chunks are coerced to that layout so every row group shares one
+    schema. If a later chunk holds text in a numeric column, e.g. one that
+    was empty in the first chunk, the column is widened to text instead of
+    losing the values; row groups already written are rewritten with the
+    widened schema.
+
+    Every row group is recorded with its first row and timestamp range, and
+    the resulting row index is saved next to the dataset when the writer is
+    closed.
+
+    Passing the schema of an existing dataset fixes the column layout up
+    front, so rows merged into that dataset are coerced to its layout.
+    """
+
+    def __init__(self, file_path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 schema: Optional[pa.Schema] = None):
+        self.file_path = file_path
+        self.row_group_size = row_group_size
+        self.columns = None
+        self.numeric_columns = set()
+        self.schema = schema
+        if schema is not None:
+            self.columns = schema.names
+            self.numeric_columns = {field.name for field in schema
+                                    if field.name != 'timestamp' and pa.types.is_floating(field.type)}
+        self.row_count = 0
+        self.row_groups = []
+        self._writer = None
+        self._widened = False
+
+    def normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Coerce a chunk to the column layout fixed by the first chunk.
+
+        Numeric columns that hold text are widened to text; write calls this
+        on every chunk, so it only needs calling directly to inspect rows in
+        the layout they will be stored in.
+
+        Parameters:
+            chunk (DataFrame): Standardized rows
+
+        Returns:
+            DataFrame: The rows in the writer's column layout
+        """
+        if self.columns is None:
+            self.columns = chunk.columns.tolist()
+            self.numeric_columns = {col for col in self.columns
+                                    if col != 'timestamp' and pd.api.types.is_numeric_dtype(chunk[col])}
+
+        chunk = chunk.reindex(columns=self.columns)
+
+        normalized = {}
+        for col in self.columns:
+            if col == 'timestamp':
+                normalized[col] = parse_timestamps(chunk[col])
+                continue
+
+            if col in self.numeric_columns:
+                values = chunk[col]
+                if pd.api.types.is_numeric_dtype(values):
+                    normalized[col] = values.astype('float64')
+                    continue
+                numbers = pd.to_numeric(values, errors='coerce')
+                if not (numbers.isna() & values.notna()).any():
+                    normalized[col] = numbers.astype('float64')
+                    continue
+                # Text in a numeric column: store the column as text from now on
+                self.numeric_columns.discard(col)
+                self._widened = True
+
+            normalized[col] = chunk[col].astype('string')
+
+        return pd.DataFrame(normalized)
+
+    def _rewrite_row_groups(self):
+        """Rewrite the row groups written so far with the current schema, one at a time."""
+        self._writer.close()
+        written_path = f"{self.file_path}.widen"
+        os.replace(self.file_path, written_path)
+        try:
+            self._writer = pq.ParquetWriter(self.file_path, self.schema)
+            written = pq.ParquetFile(written_path)
+            for group in range(written.num_row_groups):
+                rows = self.normalize(written.read_row_group(group).to_pandas())
+                self._writer.write_table(pa.Table.from_pandas(rows, schema=self.schema, preserve_index=False))
+        finally:
+            os.remove(written_path)
+
+    def write(self, chunk: pd.DataFrame):
+        """
+        Append a chunk of rows to the dataset file.
+
+        Parameters:
+            chunk (DataFrame): Standardized rows to append
+        """
+        chunk = self.normalize(chunk)
+
+        if self._widened:
+            # Derive the widened schema from the chunk and bring earlier row groups in line
+            self._widened = False
+            self.schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+            if self._writer is not None:
+                self._rewrite_row_groups()
+
+        table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+
+        if self._writer is None:
+            self.schema = table.schema
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            self._writer = pq.ParquetWriter(self.file_path, self.schema)
+
+        # Write one row group per slice so each can be indexed
+        for offset in range(0, len(chunk), self.row_group_size):
+            rows = min(self.row_group_size, len(chunk) - offset)
+            timestamps = chunk['timestamp'].iloc[offset:offset + rows]
+            self._writer.write_table(table.slice(offset, rows))
+            self.row_groups.append({
+                'offset': self.row_count,
+                'rows': rows,
+                'min_ts': _timestamp_ns(timestamps.min()),
+                'max_ts': _timestamp_ns(timestamps.max())
+            })
+            self.row_count += rows
+
+    def close(self):
+        """Finish the file so it can be read and save its row index."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            RowIndex(self.row_count, self.row_groups).save(self.file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_stored_dataset(data: pd.DataFrame, file_path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+    """
+    Write a complete DataFrame as a columnar dataset file.
+
+    Parameters:
+        data (DataFrame): Standardized dataset
+        file_path (str): Path of the dataset file to write
+        row_group_size (int): Rows per row group
+    """
+    with DatasetWriter(file_path, row_group_size=row_group_size) as writer:
+        writer.write(data)
+
+
+def _timestamp_ns(value) -> Optional[int]:
+    """Convert a timestamp to integer nanoseconds, or None if it is missing."""
+    return None if pd.isna(value) else int(pd.Timestamp(value).value)
+
+
+def row_index_path(file_path: str) -> str:
+    """
+    Path of the sidecar row index of a dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        str: Path of the row index file
+    """
+    return f"{file_path}{ROW_INDEX_SUFFIX}"
+
+
+class RowIndex:
+    """
+    Row-group checkpoints of a stored dataset.
+
+    Each checkpoint holds the position of the first row of a row group, its
+    row count and its timestamp range, so a window of rows can be located
+    by position or by time without reading the dataset.
+    """
+
+    def __init__(self, row_count: int, row_groups: List[Dict[str, Any]]):
+        self.row_count = row_count
+        self.row_groups = row_groups
+        self.offsets = [group['offset'] for group in row_groups]
+
+    @classmethod
+    def load(cls, file_path: str) -> 'RowIndex':
+        """
+        Load the row index of a dataset file.
+
+        The index is rebuilt from the Parquet footer and saved if the sidecar
+        file is missing, e.g. for datasets stored before it was introduced.
+
+        Parameters:
+            file_path (str): Path to the dataset file
+
+        Returns:
+            RowIndex: The row index
+        """
+        index_path = row_index_path(file_path)
+
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(file_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data['row_count'], data['row_groups'])
+
+        index = cls.from_parquet(file_path)
+        index.save(file_path)
+        return index
+
+    @classmethod
+    def from_parquet(cls, file_path: str) -> 'RowIndex':
+        """
+        Build the row index from the row group metadata of a Parquet file.
+
+        Parameters:
+            file_path (str): Path to the Parquet file
+
+        Returns:
+            RowIndex: The row index
+        """
+        metadata = pq.ParquetFile(file_path).metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        ts_column = names.index('timestamp') if 'timestamp' in names else None
+
+        row_groups = []
+        offset = 0
+        for i in range(metadata.num_row_groups):
+            group = metadata.row_group(i)
+            min_ts = max_ts = None
+            if ts_column is not None:
+                stats = group.column(ts_column).statistics
+                if stats is not None and stats.has_min_max:
+                    min_ts = _timestamp_ns(stats.min)
+                    max_ts = _timestamp_ns(stats.max)
+            row_groups.append({'offset': offset, 'rows': group.num_rows, 'min_ts': min_ts, 'max_ts': max_ts})
+            offset += group.num_rows
+
+        return cls(offset, row_groups)
+
+    def save(self, file_path: str):
+        """
+        Save the row index next to a dataset file.
+
+        Parameters:
+            file_path (str): Path to the dataset file
+        """
+        with open(row_index_path(file_path), 'w', encoding='utf-8') as f:
+            json.dump({'row_count': self.row_count, 'row_groups': self.row_groups}, f)
+
+    def groups_for_rows(self, start: int, stop: int) -> List[int]:
+        """
+        Row groups holding the rows in the half-open range [start, stop).
+
+        Parameters:
+            start (int): Position of the first row
+            stop (int): Position after the last row
+
+        Returns:
+            list: Row group numbers
+        """
+        if start >= stop or not self.row_groups:
+            return []
+        first = max(bisect.bisect_right(self.offsets, start) - 1, 0)
+        last = max(bisect.bisect_right(self.offsets, stop - 1) - 1, 0)
+        return list(range(first, last + 1))
+
+    def groups_for_time(self, start=None, end=None) -> List[int]:
+        """
+        Row groups whose timestamp range overlaps [start, end].
+
+        Row groups without timestamp statistics are always included.
+
+        Parameters:
+            start: Earliest timestamp (unbounded if None)
+            end: Latest timestamp (unbounded if None)
+
+        Returns:
+            list: Row group numbers
+        """
+        start_ns = _timestamp_ns(start) if start is not None else None
+        end_ns = _timestamp_ns(end) if end is not None else None
+
+        groups = []
+        for i, group in enumerate(self.row_groups):
+            if group['min_ts'] is None or group['max_ts'] is None:
+                groups.append(i)
+            elif (start_ns is None or group['max_ts'] >= start_ns) and (end_ns is None or group['min_ts'] <= end_ns):
+                groups.append(i)
+        return groups
+
+
+def _empty_frame(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Empty DataFrame with the columns and types of a columnar dataset."""
+    df = pq.read_schema(file_path).empty_table().to_pandas()
+    return df if columns is None else df[columns]
+
+
+def read_rows(file_path: str, start: int, stop: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a window of rows by position without loading the whole dataset.
+
+    For columnar datasets only the row groups covering the window are read.
+    Older text datasets are scanned up to the window instead of being loaded.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        start (int): Position of the first row
+        stop (int): Position after the last row
+        columns (list, optional): Columns to load (all columns if None)
+
+    Returns:
+        DataFrame: The rows, indexed by their position in the dataset
+    """
+    start = max(start, 0)
+
+    if os.path.splitext(file_path)[1].lower() != STORE_EXTENSION:
+        df = pd.read_csv(file_path, skiprows=range(1, start + 1), nrows=max(stop - start, 0), usecols=columns)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = parse_timestamps(df['timestamp'])
+        df.index = range(start, start + len(df))
+        return df
+
+    index = RowIndex.load(file_path)
+    stop = min(stop, index.row_count)
+    groups = index.groups_for_rows(start, stop)
+    if not groups:
+        return _empty_frame(file_path, columns)
+
+    first_offset = index.row_groups[groups[0]]['offset']
+    df = pq.ParquetFile(file_path).read_row_groups(groups, columns=columns).to_pandas()
+    df = df.iloc[start - first_offset:stop - first_offset]
+    df.index = range(start, stop)
+    return df
+
+
+def read_row_positions(file_path: str, positions, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read scattered rows by position without loading the whole dataset.
+
+    For columnar datasets only the row groups holding one of the rows are
+    read, one at a time. Text datasets are scanned in chunks, keeping only
+    the requested rows. Positions outside the dataset are skipped.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        positions: Row positions, in any order and possibly repeated
+        columns (list, optional): Columns to load (all columns if None)
+
+    Returns:
+        DataFrame: The rows in position order, indexed by their position in the dataset
+    """
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    positions = positions[positions >= 0]
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension == STORE_EXTENSION:
+        index = RowIndex.load(file_path)
+        positions = positions[positions < index.row_count]
+        parquet_file = pq.ParquetFile(file_path)
+        parts = []
+        groups = np.searchsorted(index.offsets, positions, side='right') - 1
+        for group in np.unique(groups):
+            wanted = positions[groups == group]
+            df = parquet_file.read_row_group(int(group), columns=columns).to_pandas()
+            df = df.iloc[wanted - index.offsets[group]]
+            df.index = wanted
+            parts.append(df)
+    elif extension == '.csv':
+        parts = []
+        offset = 0
+        if len(positions):
+            for chunk in pd.read_csv(file_path, usecols=columns, chunksize=DEFAULT_ROW_GROUP_SIZE):
+                wanted = positions[(positions >= offset) & (positions < offset + len(chunk))]
+                if len(wanted):
+                    df = chunk.iloc[wanted - offset]
+                    df.index = wanted
+                    parts.append(df)
+                offset += len(chunk)
+                if offset > positions[-1]:
+                    break
+        if not parts:
+            return pd.read_csv(file_path, usecols=columns, nrows=0)
+        df = pd.concat(parts)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = parse_timestamps(df['timestamp'])
+        return df
+    else:
+        df = load_cached_dataset(file_path, columns=columns)
+        return df.iloc[positions[positions < len(df)]]
+
+    if not parts:
+        return _empty_frame(file_path, columns)
+    return pd.concat(parts)
+
+
+def read_time_window(file_path: str, start=None, end=None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read the rows whose timestamp falls in [start, end] using the row index.
+
+    Only the row groups overlapping the window are read.
+
+    Parameters:
+        file_path (str): Path to the columnar dataset file
+        start: Earliest timestamp (unbounded if None)
+        end: Latest timestamp (unbounded if None)
+        columns (list, optional): Columns to load (all columns if None)
+
+    Returns:
+        DataFrame: The rows, indexed by their position in the dataset
+    """
+    read_columns = columns if columns is None or 'timestamp' in columns else ['timestamp'] + list(columns)
+
+    index = RowIndex.load(file_path)
+    groups = index.groups_for_time(start, end)
+    if not groups:
+        return _empty_frame(file_path, columns)
+
+    parquet_file = pq.ParquetFile(file_path)
+    frames = []
+    for group in groups:
+        df = parquet_file.read_row_group(group, columns=read_columns).to_pandas()
+        df.index = range(index.row_groups[group]['offset'], index.row_groups[group]['offset'] + len(df))
+        frames.append(time_slice(df, start, end))
+
+    df = pd.concat(frames)
+    return df if columns is None else df[columns]
+
+
+def iter_stored_dataset(file_path: str, columns: Optional[List[str]] = None,
+                        batch_size: int = DEFAULT_ROW_GROUP_SIZE, start: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Stream a stored dataset in batches of rows.
+
+    Columnar datasets are read batch by batch so memory stays bounded by the
+    batch size; row groups before ``start`` are skipped using the row index.
+    Older text datasets are loaded whole and yielded once.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        columns (list, optional): Columns to load (all columns if None)
+        batch_size (int): Maximum number of rows per batch
+        start (int): Position of the first row to stream
+
+    Yields:
+        DataFrame: Consecutive batches of rows
+    """
+    if os.path.splitext(file_path)[1].lower() != STORE_EXTENSION:
+        yield read_stored_dataset(file_path, columns=columns).iloc[start:]
+        return
+
+    row_groups = None
+    skip = 0
+    if start > 0:
+        index = RowIndex.load(file_path)
+        row_groups = index.groups_for_rows(start, index.row_count)
+        if not row_groups:
+            return
+        skip = start - index.row_groups[row_groups[0]]['offset']
+
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_size, columns=columns,
+                                                        row_groups=row_groups):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        yield batch.slice(skip).to_pandas()
+        skip = 0
+
+
+def merge_timestamped_rows(existing: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge two sets of rows in timestamp order.
+
+    Where both sets hold a row for the same timestamp, the new row replaces
+    the existing one. Rows with equal timestamps keep their relative order.
+
+    Parameters:
+        existing (DataFrame): Rows already in the dataset
+        new (DataFrame): Rows to merge in
+
+    Returns:
+        DataFrame: The merged rows with a fresh positional index
+    """
+    existing = existing[~existing['timestamp'].isin(new['timestamp'])]
+    merged = pd.concat([existing, new], ignore_index=True)
+    return merged.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def _is_sorted_by_time(file_path: str) -> bool:
+    """Check whether a columnar dataset is sorted by timestamp, reading only that column."""
+    previous = None
+    for batch in iter_stored_dataset(file_path, columns=['timestamp']):
+        timestamps = batch['timestamp'].dropna()
+        if len(timestamps) == 0:
+            continue
+        if not timestamps.is_monotonic_increasing or (previous is not None and timestamps.iloc[0] < previous):
+            return False
+        previous = timestamps.iloc[-1]
+    return True
+
+
+def _sort_keys(timestamps: pd.Series) -> np.ndarray:
+    """Timestamps as int64 nanoseconds, with missing timestamps sorting last."""
+    keys = pd.DatetimeIndex(timestamps).as_unit('ns').asi8.copy()
+    keys[keys == pd.NaT.value] = np.iinfo(np.int64).max
+    return keys
+
+
+def _write_sorted_runs(file_path: str, run_paths: List[str], run_size: int):
+    """
+    Split a stored dataset into sorted runs, one file per run.
+
+    Each run holds up to ``run_size`` consecutive rows, sorted stably by
+    timestamp. The run files are stored in small row groups so they can be
+    read back a batch at a time while they are merged. Paths are added to
+    ``run_paths`` as the runs are written, so the caller can remove them.
+    """
+    schema = pq.read_schema(file_path)
+    for batch in iter_stored_dataset(file_path, batch_size=run_size):
+        run_path = f"{file_path}.run{len(run_paths)}"
+        run_paths.append(run_path)
+        order = np.argsort(_sort_keys(batch['timestamp']), kind='stable')
+        table = pa.Table.from_pandas(batch.take(order), schema=schema, preserve_index=False)
+        pq.write_table(table, run_path, row_group_size=MERGE_BATCH_SIZE)
+
+
+def _merge_sorted_runs(run_paths: List[str], writer: DatasetWriter, row_group_size: int):
+    """
+    Merge sorted runs into one dataset, holding one batch of each run at a time.
+
+    Each round emits every buffered row that sorts before the last buffered
+    row of some run. Rows are ordered by timestamp, then run, then position
+    within the run, so the merge is stable and the run holding the smallest
+    last row is always used up, which guarantees progress.
+    """
+    readers = [pq.ParquetFile(path).iter_batches(batch_size=MERGE_BATCH_SIZE) for path in run_paths]
+    buffers = [None] * len(readers)
+    pending = []
+    pending_rows = 0
+
+    while True:
+        # Refill the buffers that were used up, dropping finished runs
+        for i, reader in enumerate(readers):
+            while reader is not None and (buffers[i] is None or len(buffers[i][1]) == 0):
+                batch = next(reader, None)
+                if batch is None:
+                    readers[i] = reader = None
+                    buffers[i] = None
+                else:
+                    frame = batch.to_pandas()
+                    buffers[i] = (frame, _sort_keys(frame['timestamp']))
+
+        active = [i for i, buffer in enumerate(buffers) if buffer is not None]
+        if not active:
+            break
+
+        # No run holds an unread row that sorts before the smallest last buffered row
+        cutoff_key, cutoff_run = min((buffers[i][1][-1], i) for i in active)
+
+        parts = []
+        keys = []
+        for i in active:
+            frame, run_keys = buffers[i]
+            side = 'right' if i <= cutoff_run else 'left'
+            n = int(np.searchsorted(run_keys, cutoff_key, side=side))
+            parts.append(frame.iloc[:n])
+            keys.append(run_keys[:n])
+            buffers[i] = (frame.iloc[n:], run_keys[n:])
+
+        merged = pd.concat(parts, ignore_index=True)
+        pending.append(merged.take(np.argsort(np.concatenate(keys), kind='stable')))
+        pending_rows += len(merged)
+        if pending_rows >= row_group_size:
+            writer.write(pd.concat(pending, ignore_index=True))
+            pending = []
+            pending_rows = 0
+
+    if pending:
+        writer.write(pd.concat(pending, ignore_index=True))
+
+
+def sort_stored_dataset(file_path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                        run_size: int = SORT_RUN_SIZE) -> bool:
+    """
+    Rewrite a stored columnar dataset in timestamp order if it is not sorted.
+
+    Sorted datasets let time windows resolve to contiguous row ranges. The
+    dataset is sorted externally: runs of ``run_size`` rows are sorted in
+    memory and written to temporary files, which are then merged a batch of
+    each at a time. Peak memory is bounded by one run while the runs are
+    written and by one batch per run plus one row group while they are
+    merged, never by the dataset size. The sort is stable, so rows with
+    equal timestamps keep their file order; rows without a timestamp go last.
+
+    Parameters:
+        file_path (str): Path to the columnar dataset file
+        row_group_size (int): Rows per row group of the rewritten file
+        run_size (int): Rows sorted in memory at a time
+
+    Returns:
+        bool: True if the dataset had to be rewritten
+    """
+    if _is_sorted_by_time(file_path):
+        return False
+
+    tmp_path = f"{file_path}.tmp"
+    run_paths = []
+    try:
+        _write_sorted_runs(file_path, run_paths, run_size)
+        with DatasetWriter(tmp_path, row_group_size=row_group_size, schema=pq.read_schema(file_path)) as writer:
+            _merge_sorted_runs(run_paths, writer, row_group_size)
+
+        os.replace(tmp_path, file_path)
+        os.replace(row_index_path(tmp_path), row_index_path(file_path))
+    finally:
+        for path in [tmp_path, row_index_path(tmp_path)] + run_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    evict_cached_dataset(file_path)
+    return True
+
+
+class _SortedRowReader:
+    """
+    Read a dataset sorted by timestamp in pieces bounded by a timestamp.
+
+    Rows are read a batch at a time, so memory stays bounded by the batch
+    size plus the rows handed out by one call.
+    """
+
+    def __init__(self, file_path: str):
+        self._batches = iter_stored_dataset(file_path, batch_size=MERGE_BATCH_SIZE)
+        self._empty = _empty_frame(file_path)
+        self._buffer = None
+
+    def read_until(self, key: Optional[int] = None) -> pd.DataFrame:
+        """
+        Read the next rows whose sort key is at most ``key`` (all remaining rows if None).
+
+        Only the last row of each timestamp is kept; since every row up to
+        the key is read, duplicates never straddle two calls.
+        """
+        parts = []
+        while True:
+            if self._buffer is None or not len(self._buffer[1]):
+                batch = next(self._batches, None)
+                if batch is None:
+                    break
+                self._buffer = (batch, _sort_keys(batch['timestamp']))
+            frame, keys = self._buffer
+            n = len(keys) if key is None else int(np.searchsorted(keys, key, side='right'))
+            parts.append(frame.iloc[:n])
+            self._buffer = (frame.iloc[n:], keys[n:])
+            if n < len(keys):
+                break
+
+        rows = pd.concat(parts, ignore_index=True) if parts else self._empty
+        return rows.drop_duplicates('timestamp', keep='last').reset_index(drop=True)
+
+
+def append_stored_dataset(file_path: str, rows: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                          row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> Dict[str, Any]:
+    """
+    Merge new rows into a stored columnar dataset in timestamp order.
+
+    New rows are coerced to the dataset's column layout; a numeric column
+    they hold text in is widened to text. Where a new row has
+    the same timestamp as a stored row, the stored row is replaced, and of
+    several new rows with one timestamp the last is kept. The new rows may
+    arrive as an iterable of chunks: they are spooled to a temporary file
+    chunk by chunk and sorted there externally, so they are never held in
+    memory at once. An unsorted dataset is first sorted externally with
+    sort_stored_dataset; the sorted dataset and the sorted new rows are then
+    merged batch by batch into a new file, so memory stays bounded by the
+    batch size. The new file then replaces the old one together with its
+    row index.
+
+    Rows inserted before the end of the stored data, or a sort of the stored
+    data, move stored rows to other positions. The result reports this as
+    positions_changed, so callers holding row positions (such as the index
+    of detected anomalies) can re-key them by timestamp with row_positions.
+
+    Parameters:
+        file_path (str): Path to the columnar dataset file
+        rows (DataFrame or iterable of DataFrame): Standardized rows to merge in
+        row_group_size (int): Rows per row group of the rewritten file
+
+    Returns:
+        dict: row_count, added, replaced, start and end of the merged dataset,
+            whether the new rows all came after the stored rows (in_order),
+            the position of the first new row when they did (first_new_row,
+            else None), whether stored rows moved (positions_changed) and the
+            timestamps of the replaced rows as int64 nanoseconds
+            (replaced_timestamps)
+    """
+    if os.path.splitext(file_path)[1].lower() != STORE_EXTENSION:
+        raise ValueError("Only columnar datasets can be appended to. Please re-upload this dataset first.")
+
+    if isinstance(rows, pd.DataFrame):
+        rows = [rows]
+
+    # Sort the stored rows once, without loading them; later appends can then stream
+    was_sorted = not sort_stored_dataset(file_path, row_group_size)
+
+    index = RowIndex.load(file_path)
+    stored_end = max((group['max_ts'] for group in index.row_groups if group['max_ts'] is not None), default=None)
+
+    new_path = f"{file_path}.new{STORE_EXTENSION}"
+    tmp_path = f"{file_path}.tmp"
+    added = 0
+    first_new_key = None
+    inserted_before_end = False
+    replaced_timestamps = []
+
+    try:
+        with DatasetWriter(new_path, row_group_size=row_group_size, schema=pq.read_schema(file_path)) as spool:
+            for chunk in rows:
+                spool.write(chunk)
+        sort_stored_dataset(new_path, row_group_size)
+
+        new_rows = _SortedRowReader(new_path)
+        with DatasetWriter(tmp_path, row_group_size=row_group_size, schema=pq.read_schema(file_path)) as writer:
+            for batch in itertools.chain(iter_stored_dataset(file_path), [None]):
+                # Merge the new rows that fall up to the end of this batch, or all that remain
+                batch_keys = None if batch is None else _sort_keys(batch['timestamp'])
+                pending = new_rows.read_until(None if batch is None else batch_keys[-1])
+                if len(pending):
+                    pending_keys = _sort_keys(pending['timestamp'])
+                    replaced = np.zeros(len(pending), dtype=bool) if batch is None else np.isin(pending_keys,
+                                                                                            batch_keys)
+                    replaced_timestamps.append(pending_keys[replaced])
+                    added += int((~replaced).sum())
+                    first_new_key = pending_keys[0] if first_new_key is None else first_new_key
+                    if stored_end is not None:
+                        inserted_before_end |= bool((pending_keys[~replaced] < stored_end).any())
+                    batch = pending if batch is None else merge_timestamped_rows(batch, pending)
+                if batch is not None:
+                    writer.write(batch)
+
+        os.replace(tmp_path, file_path)
+        os.replace(row_index_path(tmp_path), row_index_path(file_path))
+    finally:
+        for path in [new_path, row_index_path(new_path), tmp_path, row_index_path(tmp_path)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    evict_cached_dataset(file_path)
+
+    merged_index = RowIndex.load(file_path)
+    starts = [group['min_ts'] for group in merged_index.row_groups if group['min_ts'] is not None]
+    ends = [group['max_ts'] for group in merged_index.row_groups if group['max_ts'] is not None]
+
+    replaced_timestamps = (np.concatenate(replaced_timestamps) if replaced_timestamps
+                           else np.empty(0, dtype=np.int64))
+    in_order = was_sorted and (stored_end is None or first_new_key is None or first_new_key > stored_end)
+
+    return {
+        'row_count': merged_index.row_count,
+        'added': added,
+        'replaced': len(replaced_timestamps),
+        'start': pd.Timestamp(min(starts)) if starts else None,
+        'end': pd.Timestamp(max(ends)) if ends else None,
+        'in_order': in_order,
+        'first_new_row': index.row_count if in_order else None,
+        'positions_changed': not was_sorted or inserted_before_end,
+        'replaced_timestamps': replaced_timestamps
+    }
+
+
+def row_positions(file_path: str, timestamps) -> np.ndarray:
+    """
+    Find the row positions of timestamps in a stored dataset sorted by time.
+
+    Only the timestamp column is streamed, a batch at a time. Where several
+    rows share a timestamp, the first is returned.
+
+    Parameters:
+        file_path (str): Path to the dataset file, sorted by timestamp
+        timestamps (array-like): Timestamps to look up
+
+    Returns:
+        numpy.ndarray: Row position of each timestamp, or -1 where no row has it
+    """
+    keys = _sort_keys(pd.Series(pd.to_datetime(np.asarray(timestamps))))
+    positions = np.full(len(keys), -1, dtype=np.int64)
+    offset = 0
+    for batch in iter_stored_dataset(file_path, columns=['timestamp']):
+        batch_keys = _sort_keys(batch['timestamp'])
+        if len(batch_keys):
+            found = np.minimum(np.searchsorted(batch_keys, keys, side='left'), len(batch_keys) - 1)
+            hits = (positions == -1) & (batch_keys[found] == keys)
+            positions[hits] = offset + found[hits]
+        offset += len(batch)
+    return positions
+
+
+def remove_stored_dataset(file_path: str):
+    """
+    Delete a stored dataset file together with its sidecar files and cache entries.
+
+    Sidecar files are the files named after the dataset file plus a suffix,
+    such as its row index and rollups.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+    """
+    for path in [file_path] + glob.glob(f"{glob.escape(file_path)}.*"):
+        if os.path.exists(path):
+            os.remove(path)
+    evict_cached_dataset(file_path)
+
+
+def read_stored_dataset(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load a stored dataset.
+
+    Columnar files are read directly with their stored types. Datasets saved
+    before the columnar format was introduced are parsed from text, with the
+    timestamp column converted to datetime.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        columns (list, optional): Columns to load (all columns if None)
+
+    Returns:
+        DataFrame: The dataset
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == STORE_EXTENSION:
+        return pd.read_parquet(file_path, columns=columns)
+
+    if ext == '.csv':
+        df = pd.read_csv(file_path, usecols=columns)
+    elif ext in ['.xlsx', '.xls']:
+        df = pd.read_excel(file_path, usecols=columns)
+    elif ext == '.json':
+        df = pd.read_json(file_path)
+    elif ext == '.txt':
+        df = pd.read_csv(file_path, sep=None, engine='python', usecols=columns)
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
+
+    if columns is not None:
+        df = df[columns]
+
+    if 'timestamp' in df.columns:
+        df['timestamp'] = parse_timestamps(df['timestamp'])
+
+    return df
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    """Memory used by a DataFrame, including the contents of text columns."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Process-wide cache of loaded datasets, keyed on (path, mtime, size, columns)
+dataset_cache = LRUCache(
+    max_bytes=int(os.environ.get('DATASET_CACHE_MAX_MB', 512)) * 1024 * 1024,
+    sizeof=_frame_nbytes
+)
+
+
+def dataset_version(file_path: str) -> tuple:
+    """
+    Identify the current version of a stored dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        tuple: (absolute path, modification time in ns, size in bytes)
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def load_cached_dataset(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load a stored dataset through the process-wide dataset cache.
+
+    The cache key includes the file's modification time and size, so a file
+    that changes on disk is reloaded and its older versions are dropped.
+    Projections of different columns are cached separately. The returned
+    frame is a shallow copy: callers may add or replace columns, but must
+    not modify cached values in place.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        columns (list, optional): Columns to load (all columns if None)
+
+    Returns:
+        DataFrame: The dataset
+    """
+    path, *version = dataset_version(file_path)
+    version = tuple(version)
+    key = (path, *version, tuple(columns) if columns is not None else None)
+
+    df = dataset_cache.get(key)
+    if df is None:
+        dataset_cache.invalidate(lambda cached_key: cached_key[0] == path and cached_key[1:3] != version)
+        _drop_time_indexes(lambda indexed: indexed[0] == path and indexed[1:] != version)
+        df = read_stored_dataset(path, columns=columns)
+        dataset_cache.put(key, df)
+
+    return df.copy(deep=False)
+
+
+def dataset_columns(file_path: str) -> List[str]:
+    """
+    Column names of a stored dataset, read without loading any rows.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        list: Column names
+    """
+    if os.path.splitext(file_path)[1].lower() == STORE_EXTENSION:
+        return pq.read_schema(file_path).names
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        return pd.read_csv(file_path, nrows=0).columns.tolist()
+    return load_cached_dataset(file_path).columns.tolist()
+
+
+class TimeIndex:
+    """
+    Binary-search index over the timestamp column of a loaded frame.
+
+    When the timestamps are sorted, a time window resolves to a contiguous
+    range of row positions with two ``searchsorted`` calls, so it can be
+    taken as a slice instead of scanning and copying the frame. Indexes are
+    kept per frame while the frame is alive, so repeated windows over the
+    same data (e.g. on every Streamlit rerun) are not re-indexed; indexes
+    of cached dataset files are kept per file version instead.
+    """
+
+    def __init__(self, timestamps: pd.Series):
+        self.ns = pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+        self.is_sorted = bool(len(self.ns) < 2 or (self.ns[0] != pd.NaT.value and (np.diff(self.ns) >= 0).all()))
+
+    @classmethod
+    def for_frame(cls, df: pd.DataFrame) -> 'TimeIndex':
+        """
+        Get the time index of a frame, building it on first use.
+
+        A cached index is rebuilt if the frame's length or its first or last
+        timestamp changed since it was built.
+
+        Parameters:
+            df (DataFrame): Frame with a datetime timestamp column
+
+        Returns:
+            TimeIndex: The index
+        """
+        cached = _time_indexes.get(id(df))
+        if cached is not None and len(cached.ns) == len(df) and (not len(df) or (
+                _timestamp_ns(df['timestamp'].iat[0]) == _nat_to_none(cached.ns[0]) and
+                _timestamp_ns(df['timestamp'].iat[-1]) == _nat_to_none(cached.ns[-1]))):
+            return cached
+
+        index = cls(df['timestamp'])
+        if cached is None:
+            weakref.finalize(df, _time_indexes.pop, id(df), None)
+        _time_indexes[id(df)] = index
+        return index
+
+    def positions(self, start=None, end=None) -> tuple:
+        """
+        Row positions [first, stop) of the timestamps in [start, end].
+
+        Only valid when the timestamps are sorted.
+
+        Parameters:
+            start: Earliest timestamp (unbounded if None)
+            end: Latest timestamp (unbounded if None)
+
+        Returns:
+            tuple: (first, stop) positions
+        """
+        first = 0 if start is None else int(np.searchsorted(self.ns, _timestamp_ns(start), side='left'))
+        stop = len(self.ns) if end is None else int(np.searchsorted(self.ns, _timestamp_ns(end), side='right'))
+        return first, max(first, stop)
+
+
+# Time indexes of live frames, keyed on id(frame)
+_time_indexes = {}
+
+# Time indexes of cached dataset files, keyed on (path, mtime, size) like
+# the cache entries they belong to, so every copy handed out shares one
+_stored_time_indexes = {}
+
+
+def stored_time_index(file_path: str, df: pd.DataFrame) -> TimeIndex:
+    """
+    Get the time index of a cached dataset file, building it once per file version.
+
+    Frames returned by load_cached_dataset are new shallow copies on every
+    call, so their index is kept with the file version rather than with the
+    frame.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+        df (DataFrame): The file's rows, as returned by load_cached_dataset
+
+    Returns:
+        TimeIndex: The index
+    """
+    version = dataset_version(file_path)
+    index = _stored_time_indexes.get(version)
+    if index is None or len(index.ns) != len(df):
+        index = TimeIndex(df['timestamp'])
+        _stored_time_indexes[version] = index
+    return index
+
+
+def _drop_time_indexes(predicate: Callable[[tuple], bool]) -> int:
+    """Drop the stored time indexes whose (path, mtime, size) key matches the predicate."""
+    keys = [key for key in _stored_time_indexes if predicate(key)]
+    for key in keys:
+        del _stored_time_indexes[key]
+    return len(keys)
+
+
+def _nat_to_none(value: int) -> Optional[int]:
+    """Map the integer encoding of NaT to None."""
+    return None if value == pd.NaT.value else int(value)
+
+
+def time_slice(df: pd.DataFrame, start=None, end=None, index: Optional[TimeIndex] = None) -> pd.DataFrame:
+    """
+    Rows of a frame whose timestamp falls in [start, end].
+
+    Frames sorted by timestamp are sliced by binary search, returning a view
+    of a contiguous range of rows. Unsorted frames fall back to a mask.
+
+    Parameters:
+        df (DataFrame): Frame with a datetime timestamp column
+        start: Earliest timestamp (unbounded if None)
+        end: Latest timestamp (unbounded if None)
+        index (TimeIndex, optional): Time index of the frame (looked up if None)
+
+    Returns:
+        DataFrame: The rows in the window, keeping their original index
+    """
+    if start is None and end is None:
+        return df
+
+    if index is None:
+        index = TimeIndex.for_frame(df)
+    if index.is_sorted:
+        first, stop = index.positions(start, end)
+        return df.iloc[first:stop]
+
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['timestamp'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['timestamp'] <= pd.Timestamp(end)
+    return df[mask]
+
+
+def select_rows(df: pd.DataFrame, columns: Optional[List[str]] = None, time_range: Optional[tuple] = None,
+                sample: Optional[int] = None, time_index: Optional[TimeIndex] = None) -> pd.DataFrame:
+    """
+    Apply a column projection, time window and row sample to a loaded frame.
+
+    Parameters:
+        df (DataFrame): The dataset
+        columns (list, optional): Columns to keep (all columns if None)
+        time_range (tuple, optional): (start, end) timestamps, either may be None
+        sample (int, optional): Maximum number of rows, taken at an even stride
+        time_index (TimeIndex, optional): Time index of the frame (looked up if None)
+
+    Returns:
+        DataFrame: The selected rows, keeping their original index
+    """
+    if time_range is not None and 'timestamp' in df.columns:
+        df = time_slice(df, *time_range, index=time_index)
+
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+
+    if sample is not None and len(df) > sample > 0:
+        step = -(-len(df) // sample)
+        df = df.iloc[::step]
+
+    return df
+
+
+def load_dataset(dataset, columns: Optional[List[str]] = None, time_range: Optional[tuple] = None,
+                 sample: Optional[int] = None) -> pd.DataFrame:
+    """
+    Load the requested part of a dataset, reading as little as possible.
+
+    This is the single access layer for dataset reads. Only the requested
+    columns are read from storage, a time window only reads the row groups
+    that overlap it, and a sample keeps at most ``sample`` evenly spaced
+    rows. Rows keep their position in the full dataset as their index, so
+    stored anomaly indices still line up. Columns that the dataset does not
+    have are skipped.
+
+    Parameters:
+        dataset: Dataset record with a ``file_path``, a path, or a DataFrame
+            already in memory (e.g. Streamlit session data)
+        columns (list, optional): Columns to load (all columns if None)
+        time_range (tuple, optional): (start, end) timestamps, either may be None
+        sample (int, optional): Maximum number of rows to return
+
+    Returns:
+        DataFrame: The selected rows
+    """
+    if isinstance(dataset, pd.DataFrame):
+        return select_rows(dataset, columns=columns, time_range=time_range, sample=sample)
+
+    file_path = getattr(dataset, 'file_path', dataset)
+
+    if columns is not None:
+        available = dataset_columns(file_path)
+        columns = [col for col in columns if col in available]
+
+    if time_range is not None and os.path.splitext(file_path)[1].lower() == STORE_EXTENSION:
+        df = read_time_window(file_path, time_range[0], time_range[1], columns=columns)
+        return select_rows(df, sample=sample)
+
+    df = load_cached_dataset(file_path, columns=columns)
+    time_index = None
+    if time_range is not None and 'timestamp' in df.columns:
+        time_index = stored_time_index(file_path, df)
+    return select_rows(df, time_range=time_range, sample=sample, time_index=time_index)
+
+
+def evict_cached_dataset(file_path: str) -> int:
+    """
+    Drop all cached versions of a dataset file.
+
+    Parameters:
+        file_path (str): Path to the dataset file
+
+    Returns:
+        int: Number of cache entries dropped
+    """
+    path = os.path.abspath(file_path)
+    _drop_time_indexes(lambda indexed: indexed[0] == path)
+    return dataset_cache.invalidate(lambda cached_key: cached_key[0] == path)
@@ -0,0 +1,241 @@
+"""
+Disk spooling of large uploads for the Energy Anomaly Detection System.
+
+Large files are uploaded in chunks that are appended to a spool file on disk,
+so no request has to hold the whole file in memory. The spool's size is the
+number of bytes received, which lets an interrupted upload resume from where
+it stopped.
+"""
+import io
+import os
+import re
+import json
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; concurrent chunks are then not serialized
+    fcntl = None
+
+# Directory, inside the upload folder, holding partial uploads
+SPOOL_DIRNAME = 'partial'
+
+# Bytes copied per read when spooling a request body
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Partial uploads untouched for this long are removed
+SPOOL_MAX_AGE_SECONDS = 24 * 60 * 60
+
+_UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+def _spool_paths(upload_dir: str, upload_id: str):
+    """Paths of the data and state files of a partial upload."""
+    if not _UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise ValueError("Invalid upload id")
+    spool_dir = os.path.join(upload_dir, SPOOL_DIRNAME)
+    return os.path.join(spool_dir, f"{upload_id}.part"), os.path.join(spool_dir, f"{upload_id}.json")
+
+
+def copy_stream(source, target, buffer_size: int = COPY_BUFFER_SIZE, limit: Optional[int] = None) -> int:
+    """
+    Copy a binary stream to a file in fixed-size blocks.
+
+    Parameters:
+        source: Readable binary stream
+        target: Writable binary file
+        buffer_size (int): Bytes read per block
+        limit (int, optional): Most bytes to copy; the rest of the stream is left unread
+
+    Returns:
+        int: Number of bytes copied
+    """
+    copied = 0
+    while limit is None or copied < limit:
+        block = source.read(buffer_size if limit is None else min(buffer_size, limit - copied))
+        if not block:
+            break
+        target.write(block)
+        copied += len(block)
+    return copied
+
+
+def create_spool(upload_dir: str, state: Dict[str, Any]) -> str:
+    """
+    Start a partial upload.
+
+    Parameters:
+        upload_dir (str): Upload folder
+        state (dict): Details of the upload to keep until it completes
+
+    Returns:
+        str: The upload id
+    """
+    purge_stale_spools(upload_dir)
+
+    upload_id = uuid.uuid4().hex
+    data_path, state_path = _spool_paths(upload_dir, upload_id)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+    open(data_path, 'wb').close()
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    return upload_id
+
+
+def load_spool(upload_dir: str, upload_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up a partial upload.
+
+    Parameters:
+        upload_dir (str): Upload folder
+        upload_id (str): The upload id
+
+    Returns:
+        dict: The upload's state with its data ``path`` and ``received``
+            byte count, or None if there is no such upload
+    """
+    try:
+        data_path, state_path = _spool_paths(upload_dir, upload_id)
+    except ValueError:
+        return None
+
+    if not os.path.exists(state_path) or not os.path.exists(data_path):
+        return None
+
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+
+    state['path'] = data_path
+    state['received'] = os.path.getsize(data_path)
+    return state
+
+
+def append_to_spool(upload_dir: str, upload_id: str, stream, offset: int,
+                    length: Optional[int] = None) -> int:
+    """
+    Append a chunk of an upload to its spool file.
+
+    The chunk must start where the received bytes end, so a chunk that is
+    re-sent after a dropped connection cannot be written twice. The spool
+    file is locked while the offset is checked and the chunk written, so two
+    requests sending the same chunk at once cannot both append it. At most
+    ``length`` bytes are read from the stream, so a client cannot write
+    past the range it declared.
+
+    Parameters:
+        upload_dir (str): Upload folder
+        upload_id (str): The upload id
+        stream: Readable binary stream holding the chunk
+        offset (int): Position of the chunk's first byte in the file
+        length (int, optional): Length of the chunk in bytes (the whole stream if None)
+
+    Returns:
+        int: Number of bytes received so far
+    """
+    data_path, _ = _spool_paths(upload_dir, upload_id)
+
+    with open(data_path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            received = os.fstat(f.fileno()).st_size
+            if offset != received:
+                raise ValueError(f"Chunk starts at byte {offset} but {received} bytes have been received")
+
+            copy_stream(stream, f, limit=length)
+            f.flush()
+            return os.fstat(f.fileno()).st_size
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def remove_spool(upload_dir: str, upload_id: str):
+    """
+    Delete a partial upload.
+
+    Parameters:
+        upload_dir (str): Upload folder
+        upload_id (str): The upload id
+    """
+    for path in _spool_paths(upload_dir, upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def purge_stale_spools(upload_dir: str, max_age: int = SPOOL_MAX_AGE_SECONDS) -> int:
+    """
+    Delete partial uploads that have not received data for a while.
+
+    Parameters:
+        upload_dir (str): Upload folder
+        max_age (int): Age in seconds after which a partial upload is abandoned
+
+    Returns:
+        int: Number of files removed
+    """
+    spool_dir = os.path.join(upload_dir, SPOOL_DIRNAME)
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def read_sample(stream, size: int) -> bytes:
+    """
+    Read up to ``size`` bytes from a stream, stopping early only at its end.
+
+    Parameters:
+        stream: Readable binary stream
+        size (int): Number of bytes to read
+
+    Returns:
+        bytes: The bytes read
+    """
+    blocks = []
+    remaining = size
+    while remaining > 0:
+        block = stream.read(remaining)
+        if not block:
+            break
+        blocks.append(block)
+        remaining -= len(block)
+    return b''.join(blocks)
+
+
+class ReplayStream(io.RawIOBase):
+    """
+    Binary stream that replays bytes already read before the rest of a stream.
+
+    Used to sniff the format of a streamed upload from its first bytes and
+    then parse the whole upload without buffering it.
+    """
+
+    def __init__(self, head: bytes, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+
+        block = self._stream.read(len(buffer))
+        buffer[:len(block)] = block
+        return len(block)